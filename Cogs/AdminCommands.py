@@ -1,9 +1,12 @@
 import asyncio
 import os
 import sys
+import time
 from time import sleep
 import re
+from typing import List
 
+import aiofiles
 from discord.ext import commands
 from discord import MessageType
 from discord import app_commands
@@ -43,14 +46,14 @@ class AdminCommands(commands.Cog):
                 int(channel_mention[2:-1])
             except ValueError:
                 await interaction.response.send_message("The `channel_mentions` parameter can only take channel mentions (i.e. of format `#channel`).")
-                await log(self.bot, f"{interaction.user} tried making an announcement from #{interaction.channel} but failed because of invalid channel mention(s)")
+                log(self.bot, f"{interaction.user} tried making an announcement from #{interaction.channel} but failed because of invalid channel mention(s)", interaction=interaction)
                 return
 
             # ensures the channels exist
             channel = discord.utils.get(interaction.guild.text_channels, id=int(channel_mention[2:-1]))
             if (channel == None):
                 await interaction.response.send_message(f"The '{channel_mention}' channel could not be found. The `channel_mentions` parameter can only take channel mentions (i.e. of format `#channel`).")
-                await log(self.bot, f"{interaction.user} tried making an announcement from #{interaction.channel} but failed because of invalid channel mention(s)")
+                log(self.bot, f"{interaction.user} tried making an announcement from #{interaction.channel} but failed because of invalid channel mention(s)", interaction=interaction)
                 return
             channels.append(channel)
             channel_names.append(f"#{channel.name}")
@@ -62,18 +65,18 @@ class AdminCommands(commands.Cog):
         # Errors if the user tries to send a message over 2,000 characters (if they have nitro)
         if (len(message.content) > 2000):
             await interaction.channel.send("Just because you have nitro, doesn't mean I do! The `message` parameter can only take a message of 2000 characters or less.")
-            await log(self.bot, f"{interaction.user} tried making an announcement from #{interaction.channel} but failed because the message was too long")
+            log(self.bot, f"{interaction.user} tried making an announcement from #{interaction.channel} but failed because the message was too long", interaction=interaction)
             return
 
         # logs appropriately
-        await log(self.bot, f"{interaction.user} has executed the announcement command in #{interaction.channel}")
+        log(self.bot, f"{interaction.user} has executed the announcement command in #{interaction.channel}", interaction=interaction)
 
         # sends the message to the specified channels
         for channel in channels:
             await channel.send(message.content)
         
         # logs appropriately
-        await log(self.bot, f"{interaction.user} made an announcement from #{interaction.channel} to {', '.join(channel_names)}")
+        log(self.bot, f"{interaction.user} made an announcement from #{interaction.channel} to {', '.join(channel_names)}", interaction=interaction)
 
 
     @app_commands.command(description="clears either 'all' or the specified number of messages from the channel")
@@ -97,7 +100,7 @@ class AdminCommands(commands.Cog):
                 await interaction.followup.send("Command not confirmed")
                 return
             await interaction.channel.send(f'Clearing all messages from this channel')
-            await log(self.bot, f'{interaction.user} cleared {amount} messages from #{interaction.channel}')
+            log(self.bot, f'{interaction.user} cleared {amount} messages from #{interaction.channel}', interaction=interaction)
             amount = 999999999999999999999999999999999999999999
 
         else:
@@ -105,13 +108,13 @@ class AdminCommands(commands.Cog):
                 amount = int(amount)
             except ValueError:
                 await interaction.channel.send("The `amount` parameter can only take either `all` or a number.")
-                await log(self.bot, f'{interaction.user} attempted to clear messages from #{interaction.channel}, but it failed because a valid "amount" was not passed')
+                log(self.bot, f'{interaction.user} attempted to clear messages from #{interaction.channel}, but it failed because a valid "amount" was not passed', interaction=interaction)
                 await interaction.followup.send("`amount` parameter is invalid")
                 return
 
             if amount < 10:
                 await interaction.channel.send(f'Clearing {amount} messages from this channel')
-                await log(self.bot, f'{interaction.user} cleared {amount} messages from #{interaction.channel}')
+                log(self.bot, f'{interaction.user} cleared {amount} messages from #{interaction.channel}', interaction=interaction)
                 sleep(1)
                 await interaction.channel.purge(limit=int(float(amount)) + 1)
                 await interaction.followup.send(f'Cleared {amount} messages from this channel')
@@ -120,7 +123,7 @@ class AdminCommands(commands.Cog):
                 await interaction.followup.send("Command not confirmed")
                 return
             await interaction.channel.send(f'Clearing {amount} messages from this channel')
-            await log(self.bot, f'{interaction.user} cleared {amount} messages from #{interaction.channel}')
+            log(self.bot, f'{interaction.user} cleared {amount} messages from #{interaction.channel}', interaction=interaction)
 
         sleep(1)
         await interaction.channel.purge(limit=int(float(amount)) + 4)
@@ -151,29 +154,29 @@ class AdminCommands(commands.Cog):
             int(role_mention[3:-1])
         except ValueError:
             await interaction.channel.send("The `role_mention` parameter can only take role mentions (i.e. of format `@role`).")
-            await log(self.bot, f"{interaction.user} tried clearing the '{role_mention}' role in #{interaction.channel} but failed because of an invalid role mention")
+            log(self.bot, f"{interaction.user} tried clearing the '{role_mention}' role in #{interaction.channel} but failed because of an invalid role mention", interaction=interaction)
             return
 
         role = discord.utils.get(guild.roles, id=int(role_mention[3:-1]))
         if role == None:
             await interaction.channel.send(f"The '{role_mention}' role could not be found. The `role_mention` parameter can only take role mentions (i.e. of format `@role`).")
-            await log(self.bot, f"{interaction.user} tried clearing the '@{role.name}' role in #{interaction.channel} but failed because it could not be found")
+            log(self.bot, f"{interaction.user} tried clearing the '@{role.name}' role in #{interaction.channel} but failed because it could not be found", interaction=interaction)
             return
 
         if role >= interaction.guild.me.top_role:
             await interaction.channel.send(f"I cannot remove the {role_mention} role from members because it is equal to or higher than my top role.")
-            await log(self.bot, f"{interaction.user} tried clearing the '@{role.name}' role in #{interaction.channel} but failed because it is equal to or higher than the bot's top role")
+            log(self.bot, f"{interaction.user} tried clearing the '@{role.name}' role in #{interaction.channel} but failed because it is equal to or higher than the bot's top role", interaction=interaction)
             return
 
         cleared_members = []
 
-        await log(self.bot, f"{interaction.user} is clearing the '@{role.name}' role from all members:")
+        log(self.bot, f"{interaction.user} is clearing the '@{role.name}' role from all members:", interaction=interaction)
 
         async for member in guild.fetch_members():
             if role in member.roles:
                 await member.remove_roles(role)
                 name = member.nick if member.nick is not None else member.name
-                await log(self.bot, name, False)
+                log(self.bot, name, False, interaction=interaction)
                 cleared_members.append(name)
 
         if len(cleared_members) > 10:
@@ -225,11 +228,11 @@ class AdminCommands(commands.Cog):
 
         if message == None:
             await interaction.followup.send(f"The message with the ID {message_id} could not be found. Make sure you are in same channel as the message you wish to edit.")
-            await log(self.bot, f"{interaction.user} tried to edit the message with the ID `{message_id}` in #{interaction.channel} but failed because the message could not be found")
+            log(self.bot, f"{interaction.user} tried to edit the message with the ID `{message_id}` in #{interaction.channel} but failed because the message could not be found", interaction=interaction)
             return
         elif message.author != self.bot.user:
             await interaction.followup.send(f"The message with the ID {message_id} is not a message sent by the bot.")
-            await log(self.bot, f"{interaction.user} tried to edit the message with the ID `{message_id}` in #{interaction.channel} but failed because it was not a message sent by the bot")
+            log(self.bot, f"{interaction.user} tried to edit the message with the ID `{message_id}` in #{interaction.channel} but failed because it was not a message sent by the bot", interaction=interaction)
             return
 
         bot_message = await interaction.followup.send(f"Please enter the new message. Type 'cancel' to cancel.")
@@ -240,12 +243,12 @@ class AdminCommands(commands.Cog):
             if new_message.content == 'cancel':
                 await bot_message.edit(content="Message edit cancelled")
                 await new_message.delete()
-                await log(self.bot, f"{interaction.user} cancelled the edit of the message in #{interaction.channel}")
+                log(self.bot, f"{interaction.user} cancelled the edit of the message in #{interaction.channel}", interaction=interaction)
                 return
             else:
                 await message.edit(content=new_message.content)
                 await new_message.delete()
-                await log(self.bot, f"{interaction.user} edited the message with the ID `{message_id}` in #{interaction.channel}")
+                log(self.bot, f"{interaction.user} edited the message with the ID `{message_id}` in #{interaction.channel}", interaction=interaction)
         except asyncio.TimeoutError:
             await interaction.followup.send("You took too long to respond. Exiting command...")
             return
@@ -269,13 +272,7 @@ class AdminCommands(commands.Cog):
 
         guild = interaction.guild
 
-        member_found = False
-        for member in guild.members:
-            if member.name == username:
-                member_found = True
-                break
-
-        if not member_found:
+        if guild_index.member(guild, username) is None:
             await interaction.channel.send(f"That user is no longer active in the server. Would you like to continue this search query anyway?")
             if not await confirmation(self.bot, interaction, confirm_string="yes"):
                 await interaction.followup.send("command not confirmed")
@@ -313,6 +310,68 @@ class AdminCommands(commands.Cog):
         await interaction.followup.send("History gathered")
 
 
+    @app_commands.command(description="search the bot's log history")
+    @app_commands.default_permissions(administrator=True)
+    async def logsearch(self, interaction:discord.Interaction, text:str = None, user:discord.User = None, cog:str = None,
+                        start_date:str = None, end_date:str = None, limit:int = 20):
+        """Search the bot's log history
+        Looks up log records in the full-text log index, filtered by any combination of words in the message,
+        the user that triggered it, the cog that logged it, and a date range. Newest records are shown first.
+
+        Args:
+            text (str): Words that must all appear in the log message
+            user (discord.User): User that triggered the log record
+            cog (str): Name of the cog that logged the record
+            start_date (str): Earliest date to include, in MM-DD-YYYY format
+            end_date (str): Latest date to include, in MM-DD-YYYY format
+            limit (int): Maximum number of records to show
+
+        Outputs:
+            The matching log records and how long the search took
+        """
+
+        await interaction.response.defer(ephemeral=True)
+
+        try:
+            start = get_unix_time(start_date) if start_date else None
+            # Include the whole end date
+            end = get_unix_time(end_date) + 24 * 60 * 60 if end_date else None
+        except ValueError:
+            await interaction.followup.send("Dates must be in MM-DD-YYYY format")
+            return
+
+        search_start = time.perf_counter()
+        records = await asyncio.to_thread(log_index.search, text, user.id if user else None, cog, start, end,
+                                          max(1, min(limit, 100)))
+        elapsed = (time.perf_counter() - search_start) * 1000
+
+        if not records:
+            await interaction.followup.send(f"No log records found ({elapsed:.1f} ms)")
+            return
+
+        # Fit as many records as possible in one message, newest first
+        footer = f"{len(records)} records in {elapsed:.1f} ms"
+        lines = []
+        length = len(footer) + 8
+        for ts, level, record_cog, command, record_user, message in records:
+            stamp = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+            source = '/'.join(part for part in (record_cog, command) if part)
+            line = f"[{stamp}] {level} {source} {record_user or ''}: {message}".replace('`', "'")
+            if length + len(line) + 1 > 2000:
+                footer = f"{len(lines)} of {len(records)} records shown, {elapsed:.1f} ms"
+                break
+            lines.append(line)
+            length += len(line) + 1
+
+        await interaction.followup.send("```" + "\n".join(lines) + "```" + footer)
+        log(self.bot, f"{interaction.user} searched the logs in #{interaction.channel}", interaction=interaction)
+
+    @logsearch.autocomplete("cog")
+    async def logsearch_cog_auto(self, interaction:discord.Interaction, current:str) -> List[app_commands.Choice[str]]:
+        # Offer every loaded cog whose name contains the typed in value
+        return [app_commands.Choice(name=name, value=name) for name in self.bot.cogs if current.lower() in name.lower()][:25]
+
+
     @app_commands.command(description="set status of discord bot")
     @app_commands.default_permissions(administrator=True)
     async def status(self, interaction:discord.Interaction, status:str):
@@ -333,11 +392,11 @@ class AdminCommands(commands.Cog):
             status = status.strip()
             if status.lower() == 'none':
                 await self.bot.change_presence(activity=None)
-                await log(self.bot, f'{interaction.user} disabled the custom status')
+                log(self.bot, f'{interaction.user} disabled the custom status', interaction=interaction)
                 await f.write('Raider Up!') # Default status for when the bot restarts
             elif len(status) <= 128:
                 await self.bot.change_presence(activity=discord.Game(status))
-                await log(self.bot, f'{interaction.user} changed the custom status to "Playing {status}"')
+                log(self.bot, f'{interaction.user} changed the custom status to "Playing {status}"', interaction=interaction)
                 await f.write(status) # write the new status to the file
             elif len(status) > 128:
                 await interaction.followup.send("Unable to set status, length of given status is > 128")
@@ -403,6 +462,8 @@ class AdminCommands(commands.Cog):
                 break
             embed.add_field(name=value[0], value=value[1])
 
+        embed.set_footer(text=f'{member_resolver.summary()}\n{router.summary()}')
+
         await interaction.response.send_message(embed=embed)
 
 
@@ -420,6 +481,11 @@ class AdminCommands(commands.Cog):
         if await confirmation(self.bot, interaction):
             await interaction.channel.send('Restarting...')
             await interaction.followup.send("The bot has restarted")
+
+            # execv skips exit handlers, so write out queued log records first
+            await pipeline.drain()
+            await channel_log_sink.flush()
+            pipeline.close()
             os.execv(sys.argv[0], sys.argv)
         await interaction.followup.send("The bot was not restarted")
 
@@ -437,5 +503,7 @@ class AdminCommands(commands.Cog):
         if await confirmation(self.bot, interaction):
             await interaction.channel.send('Stopping...')
             await interaction.followup.send("Stopping the bot")
+            await pipeline.drain()
+            await channel_log_sink.flush()
             await self.bot.close()
         await interaction.followup.send("The bot was not stopped")
@@ -1,3 +1,4 @@
+import asyncio
 import csv
 import os
 from datetime import time
@@ -5,140 +6,254 @@ import pandas as pd
 import time
 
 from discord.ui import View
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 
 from utils.utils import *
-from utils.db_utils import initialize_db, insert_user, create_connection, insert_timesheet, insert_pomodoro, update_timesheet, get_timesheet_id, get_timesheet, get_pomodoro_id, get_pomodoro, update_pomodoro, insert_user_help, get_all_open_pomodoros, get_all_open_timesheets, close_all_pomodoros, get_user_report
+from utils.log_utils import emit
+from utils.db_gateway import DatabaseGateway
+from utils.scheduler import DeadlineScheduler
+from utils.dm_outbox import dm_outbox
+from utils.checkin_state import CheckinState
+from utils.interaction_router import router
+from utils.report_utils import TimesheetReport, pay_period_calendar, pay_periods
+from utils.db_utils import ConnectionManager, initialize_db, insert_user, insert_timesheet, insert_pomodoro, update_timesheet, update_pomodoro, insert_user_help, close_stale_timesheets, close_timesheet, get_role_report, insert_pay_periods, rollup_closed_timesheets, rebuild_daily_hours, get_open_checkins
 
 async def setup(bot):
     cwd = (os.path.dirname(os.path.abspath(__file__)))
     directory = os.path.dirname(cwd)
     db_path = os.path.join(directory, "cse_discord.db")
-    if not os.path.exists(db_path):
-        initialize_db(db_path)
-    else:
-        print("Database already exists")
+    initialize_db(db_path)
 
-    await bot.add_cog(Checkin(bot))
+    await bot.add_cog(Checkin(bot, db_path))
 
 class Checkin(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, db_path):
         self.bot = bot
-        self.check_pomodoros.start()
-        self.check_timesheets.start()
-
-    def cog_unload(self):
-        self.check_pomodoros.cancel()
-        self.check_timesheets.cancel()
+        self.db = DatabaseGateway(ConnectionManager(db_path))
+        self.scheduler = DeadlineScheduler()
+        self.state = CheckinState()
+        self._sweep = None
+        self._sweep_pending = False
+
+    # Seconds after a pomodoro starts to check in with the user, and after checking in to check them out
+    POMODORO_REMINDER = 20 * 60
+    SHIFT_LENGTH = 8 * 60 * 60
+
+    async def cog_load(self):
+        """ Loads the check-in state of every user, and arms a deadline for every pomodoro and timesheet that
+            was left open while the bot was offline. Deadlines that passed while offline fire right away.
+        """
+        self.register_routes()
+        dm_outbox.register_view('checkin', Checkin.checkin_view)
+        await dm_outbox.start(self.bot, self.db)
+        self.scheduler.start()
+
+        rows = await self.db.read(get_open_checkins) or []
+        self.state.load(rows)
+
+        for time_id, discord_id, time_in, pomo_id, issue, time_start, status, help_count in rows:
+            self.scheduler.schedule(('timesheet', time_id), time_in + Checkin.SHIFT_LENGTH, self.auto_checkout)
+            if pomo_id is not None and status in (0, None):
+                self.scheduler.schedule(('pomodoro', pomo_id), time_start + Checkin.POMODORO_REMINDER,
+                                        self.remind_pomodoro, pomo_id, discord_id)
+
+    async def cog_unload(self):
+        router.remove_routes(self)
+        self.scheduler.close()
+        if self._sweep is not None:
+            self._sweep.cancel()
+        await dm_outbox.stop()
+        await self.db.close()
 
     check_in_group = app_commands.Group(name="checkin", description="...")
 
-    @commands.Cog.listener()
-    async def on_interaction(self, interaction: discord.Interaction):
-        """ An event listener to check for different checkin button presses.
-            Verifies that the interaction includes a custom_id. Each individual statement
-            checks to make sure that the interaction contains a specific custom_id.
+    # Routes of the check-in buttons and modals, and the custom IDs they had on messages sent before
+    # custom IDs were structured
+    ROUTES = {
+        'checkin': ('checkin_checkin_btn', False),
+        'pomodoro': ('checkedin_pomo_btn', False),
+        'pomodoro_create': ('checkedin_pomo_create_', True),
+        'checkout': ('checkedin_checkout_btn', False),
+        'pomodoro_done': ('pomo_done_btn', False),
+        'pomodoro_not_done': ('pomo_not_done_btn', False),
+        'pomodoro_blocked': ('pomo_blocked_btn', False),
+        'pomodoro_blocked_create': ('pomo_blocked_create', False),
+    }
+
+    def register_routes(self):
+        """ Registers a handler for every check-in button and modal with the interaction router.
         """
-        if interaction.data is not None and 'custom_id' in interaction.data and interaction.data['custom_id'] is not None and not interaction.response.is_done():
-            if 'checkin_checkin_btn' in interaction.data['custom_id']:
-                time = str(await get_time_epoch())
-                conn = create_connection("cse_discord.db")
-
-                timesheet = insert_timesheet(conn, interaction.user.id, time)
-
-                await update_view(interaction, Checkin.checked_in_view())
-                await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'checkin')
-                await interaction.response.send_message("You have checked in!", ephemeral=True)
-            elif 'checkedin_pomo_btn' in interaction.data['custom_id']:
-                modal = discord.ui.Modal(title="Pomodoro Creation", custom_id=f"checkedin_pomo_create_{interaction.message.id}")
-                modal.add_item(discord.ui.TextInput(label="What issue are you working on?", required=True))
-
-                await interaction.response.send_modal(modal)
-            elif 'checkedin_pomo_create' in interaction.data['custom_id']:
-                conn = create_connection("cse_discord.db")
-                timesheet_id = get_timesheet_id(conn, interaction.user.id)
-                time = str(await get_time_epoch())
-                pomo_reason = interaction.data['components'][0]['components'][0]['value']
-                pomo = insert_pomodoro(conn, timesheet_id, pomo_reason, time)
-
-                channel = interaction.channel
-                message_id = int(interaction.data['custom_id'].replace("checkedin_pomo_create_", ""))
-
-                message = await channel.fetch_message(message_id)
-                await message.edit(view=Checkin.pomo_view())
-
-                await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'pomodoro')
-                await interaction.response.send_message("You have started a pomodoro. I will check with you in 20 minutes", ephemeral=True)
-            elif 'checkedin_checkout_btn' in interaction.data['custom_id']:
-                conn = create_connection("cse_discord.db")
-                time_id = get_timesheet_id(conn, interaction.user.id)
-                timesheet = get_timesheet(conn, time_id, interaction.user.id)
-
-                time_in = float(timesheet[2])
-                time_out = await get_time_epoch()
-                total_time = time_out - time_in
-
-                timesheet = update_timesheet(conn, time_id, interaction.user.id, time_in, time_out, total_time)
-                
-                if timesheet is True:
-                    await update_view(interaction, Checkin.checkin_view())
-                    await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'checkout')
-                    await interaction.response.send_message(f"You have now been clocked out. Total time: **{await get_string_from_epoch(total_time)}**", ephemeral=True)
-                else:
-                    await interaction.response.send_message("Error while checking out", ephemeral=True)
-            elif 'pomo_done_btn' in interaction.data['custom_id'] or 'pomo_not_done_btn' in interaction.data['custom_id']:
-                conn = create_connection("cse_discord.db")
-                pomo_id = get_pomodoro_id(conn, interaction.user.id)
-                time_id = get_timesheet_id(conn, interaction.user.id)
-                pomo = get_pomodoro(conn, pomo_id, time_id)
-
-                if pomo is not None:
-                    time_start = float(pomo[3])
-                    time_end = await get_time_epoch()
-                    total_time = time_end - time_start
-
-                    pomodoro = update_pomodoro(conn, pomo_id, time_id, pomo[2], time_start, time_end, total_time,
-                                                str(3 if 'pomo_done_btn' in interaction.data['custom_id'] else 2), pomo[7])
-
-                    if True is not None:
-                        if pomo[6] == 1:
-                            async for message in interaction.channel.history(limit=10):
-                                if message.author.id == self.bot.user.id:
-                                    await message.delete()
-                                    break
-                        
-                        await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'checkin')
-                        await update_view(interaction, Checkin.checked_in_view())
-                        await interaction.response.send_message(f"You have now completed your pomodoro. Total time: **{await get_string_from_epoch(total_time)}**", ephemeral=True)
-                    else:
-                        await interaction.response.send_message(f"Error! Unable to close pomodoro", ephemeral=True)
-            elif 'pomo_blocked_btn' in interaction.data['custom_id']:
-                conn = create_connection("cse_discord.db")
-                pomo_id = get_pomodoro_id(conn, interaction.user.id)
-                time_id = get_timesheet_id(conn, interaction.user.id)
-                pomo = get_pomodoro(conn, pomo_id, time_id)
-
-                if pomo is not None:
-                    modal = discord.ui.Modal(title="Pomodoro Blocked", custom_id="pomo_blocked_create")
-                    modal.add_item(discord.ui.TextInput(label="What issue are you having?", required=True))
-
-                    await interaction.response.send_modal(modal)
-            elif 'pomo_blocked_create' in interaction.data['custom_id']:
-                conn = create_connection("cse_discord.db")
-                pomo_id = get_pomodoro_id(conn, interaction.user.id)
-                time_id = get_timesheet_id(conn, interaction.user.id)
-                pomo = get_pomodoro(conn, pomo_id, time_id)
-
-                if pomo is not None:
-                    pomodoro = update_pomodoro(conn, pomo_id, time_id, pomo[2], pomo[3], None, None, None, str(1 if pomo[7] is None else int(pomo[7]) + 1))
-                    remark = interaction.data['components'][0]['components'][0]['value']
-                    help = insert_user_help(conn, remark, pomo_id)
-
-                    if help is not None:
-                        await interaction.response.send_message(f"Your issue has been recorded", ephemeral=True)
-                    else:
-                        await interaction.response.send_message(f"Error!", ephemeral=True)
+        handlers = {
+            'checkin': self.checkin_pressed,
+            'pomodoro': self.pomodoro_pressed,
+            'pomodoro_create': self.pomodoro_created,
+            'checkout': self.checkout_pressed,
+            'pomodoro_done': lambda interaction, args: self.pomodoro_finished(interaction, True),
+            'pomodoro_not_done': lambda interaction, args: self.pomodoro_finished(interaction, False),
+            'pomodoro_blocked': self.blocked_pressed,
+            'pomodoro_blocked_create': self.blocked_created,
+        }
+        for action, handler in handlers.items():
+            router.add_route('checkin', action, self.serialized(handler), owner=self)
+            legacy_id, prefix = Checkin.ROUTES[action]
+            router.add_legacy(legacy_id, 'checkin', action, prefix=prefix)
+
+    def serialized(self, handler):
+        """ Wraps a route handler so the interactions of one user are handled one at a time. A second click
+            waits for the first to finish, then sees the state it left behind.
+        """
+        async def run(interaction: discord.Interaction, args: str):
+            async with self.state.serialized(interaction.user.id):
+                await handler(interaction, args)
+        return run
+
+    async def checkin_pressed(self, interaction: discord.Interaction, args: str):
+        """ Checks a user in. The user's open timesheet and pomodoro come from the check-in state, so no
+            button reads the database.
+        """
+        if self.state.get(interaction.user.id) is not None:
+            await interaction.response.send_message("You are already checked in", ephemeral=True)
+            return
+
+        time = await get_time_epoch()
+
+        timesheet = await self.db.write(insert_timesheet, interaction.user.id, time)
+        if timesheet is None:
+            await interaction.response.send_message("Error while checking in", ephemeral=True)
+            return
+        self.state.checked_in(interaction.user.id, timesheet, time)
+        self.scheduler.schedule(('timesheet', timesheet), time + Checkin.SHIFT_LENGTH, self.auto_checkout)
+
+        await update_view(interaction, Checkin.checked_in_view(), "You have checked in!")
+        await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'checkin')
+
+    async def pomodoro_pressed(self, interaction: discord.Interaction, args: str):
+        """ Asks a checked in user what their pomodoro is about.
+        """
+        modal = discord.ui.Modal(title="Pomodoro Creation", custom_id="checkin:pomodoro_create")
+        modal.add_item(discord.ui.TextInput(label="What issue are you working on?", required=True))
+
+        await interaction.response.send_modal(modal)
+
+    async def pomodoro_created(self, interaction: discord.Interaction, args: str):
+        """ Starts a pomodoro. The modal was opened from the check-in message, so the interaction response
+            edits that message.
+        """
+        state = self.state.get(interaction.user.id)
+        if state is None or state.in_pomodoro:
+            await interaction.response.send_message("You need to be checked in and not in a pomodoro to start one", ephemeral=True)
+            return
+
+        timesheet_id = state.time_id
+        time = await get_time_epoch()
+        pomo_reason = interaction.data['components'][0]['components'][0]['value']
+        pomo = await self.db.write(insert_pomodoro, timesheet_id, pomo_reason, time)
+        if pomo is None:
+            await interaction.response.send_message("Error while starting pomodoro", ephemeral=True)
+            return
+        self.state.pomodoro_started(interaction.user.id, pomo, pomo_reason, time)
+        self.scheduler.schedule(('pomodoro', pomo), time + Checkin.POMODORO_REMINDER,
+                                self.remind_pomodoro, pomo, interaction.user.id)
+
+        await update_view(interaction, Checkin.pomo_view(), "You have started a pomodoro. I will check with you in 20 minutes")
+        await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'pomodoro')
+
+    async def checkout_pressed(self, interaction: discord.Interaction, args: str):
+        """ Checks a user out, ending their pomodoro if they are in one. The timesheet and the pomodoro are
+            closed in the same write.
+        """
+        state = self.state.get(interaction.user.id)
+        if state is None:
+            await interaction.response.send_message("You are not checked in", ephemeral=True)
+            return
+
+        time_id = state.time_id
+        time_in = state.time_in
+        time_out = await get_time_epoch()
+        total_time = time_out - time_in
+
+        timesheet = await self.db.write(close_timesheet, time_id, time_out)
+        await self.db.write(rollup_closed_timesheets)
+
+        # None means the timesheet had already been closed, so the user is checked out either way
+        if timesheet is not False:
+            if state.in_pomodoro:
+                self.scheduler.cancel(('pomodoro', state.pomo_id))
+            self.state.checked_out(interaction.user.id)
+            self.scheduler.cancel(('timesheet', time_id))
+            if timesheet is True:
+                await update_view(interaction, Checkin.checkin_view(), f"You have now been clocked out. Total time: **{await get_string_from_epoch(total_time)}**")
+            else:
+                await update_view(interaction, Checkin.checkin_view(), "You had already been clocked out")
+            await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'checkout')
+        else:
+            await interaction.response.send_message("Error while checking out", ephemeral=True)
+
+    async def pomodoro_finished(self, interaction: discord.Interaction, done: bool):
+        """ Finishes a user's pomodoro, as done or not done, and removes the reminder if one was sent.
+        """
+        state = self.state.get(interaction.user.id)
+        if state is None or not state.in_pomodoro:
+            await interaction.response.send_message("You are not in a pomodoro", ephemeral=True)
+            return
+
+        pomo_id = state.pomo_id
+        time_id = state.time_id
+        time_start = state.pomo_start
+        time_end = await get_time_epoch()
+        total_time = time_end - time_start
+
+        pomodoro = await self.db.write(update_pomodoro, pomo_id, time_id, state.issue, time_start, time_end, total_time,
+                                    3 if done else 2, state.help_count)
+
+        if pomodoro is True:
+            reminder = state.reminder_id
+            self.state.pomodoro_ended(interaction.user.id)
+            self.scheduler.cancel(('pomodoro', pomo_id))
+
+            await update_view(interaction, Checkin.checked_in_view(), f"You have now completed your pomodoro. Total time: **{await get_string_from_epoch(total_time)}**")
+            await change_checkin_status(self.bot, interaction.user.id, interaction.user.display_name, 'checkin')
+
+            # The reminder is no longer needed. It is deleted after responding, or never sent if it is still queued
+            if reminder is not None:
+                await dm_outbox.retract(reminder)
+        else:
+            await interaction.response.send_message(f"Error! Unable to close pomodoro", ephemeral=True)
+
+    async def blocked_pressed(self, interaction: discord.Interaction, args: str):
+        """ Asks a user in a pomodoro what they need help with.
+        """
+        state = self.state.get(interaction.user.id)
+        if state is None or not state.in_pomodoro:
+            await interaction.response.send_message("You are not in a pomodoro", ephemeral=True)
+            return
+
+        modal = discord.ui.Modal(title="Pomodoro Blocked", custom_id="checkin:pomodoro_blocked_create")
+        modal.add_item(discord.ui.TextInput(label="What issue are you having?", required=True))
+
+        await interaction.response.send_modal(modal)
+
+    async def blocked_created(self, interaction: discord.Interaction, args: str):
+        """ Records a help request against a user's pomodoro.
+        """
+        state = self.state.get(interaction.user.id)
+        if state is None or not state.in_pomodoro:
+            await interaction.response.send_message("You are not in a pomodoro", ephemeral=True)
+            return
+
+        pomo_id = state.pomo_id
+        help_count = 1 if state.help_count is None else state.help_count + 1
+        pomodoro = await self.db.write(update_pomodoro, pomo_id, state.time_id, state.issue, state.pomo_start, None, None, None, help_count)
+        if pomodoro is True:
+            self.state.pomodoro_updated(interaction.user.id, None, help_count)
+        remark = interaction.data['components'][0]['components'][0]['value']
+        help = await self.db.write(insert_user_help, remark, pomo_id)
+
+        if help is not None:
+            await interaction.response.send_message(f"Your issue has been recorded", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"Error!", ephemeral=True)
 
     def checkin_view():
         """Function that returns the check in view upon registration
@@ -150,7 +265,7 @@ class Checkin(commands.Cog):
 
 
         view = View()
-        checkin_button = discord.ui.Button(label="Check-in", style=discord.ButtonStyle.green, custom_id="checkin_checkin_btn")
+        checkin_button = discord.ui.Button(label="Check-in", style=discord.ButtonStyle.green, custom_id="checkin:checkin")
         view.add_item(checkin_button)
 
         return view
@@ -166,8 +281,8 @@ class Checkin(commands.Cog):
 
         view = View()
 
-        checkout_button = discord.ui.Button(label="Check-out", style=discord.ButtonStyle.red, custom_id="checkedin_checkout_btn")
-        pomo_button = discord.ui.Button(label="Pomodoro", style=discord.ButtonStyle.blurple, custom_id="checkedin_pomo_btn")
+        checkout_button = discord.ui.Button(label="Check-out", style=discord.ButtonStyle.red, custom_id="checkin:checkout")
+        pomo_button = discord.ui.Button(label="Pomodoro", style=discord.ButtonStyle.blurple, custom_id="checkin:pomodoro")
 
         view.add_item(checkout_button)
         view.add_item(pomo_button)
@@ -184,9 +299,9 @@ class Checkin(commands.Cog):
         
         view = View()
 
-        done_button = discord.ui.Button(label="Done", style=discord.ButtonStyle.green, custom_id="pomo_done_btn")
-        blocked_button = discord.ui.Button(label="Help/Blocked", style=discord.ButtonStyle.red, custom_id="pomo_blocked_btn")
-        not_done_button = discord.ui.Button(label="Not Done", style=discord.ButtonStyle.secondary, custom_id="pomo_not_done_btn")
+        done_button = discord.ui.Button(label="Done", style=discord.ButtonStyle.green, custom_id="checkin:pomodoro_done")
+        blocked_button = discord.ui.Button(label="Help/Blocked", style=discord.ButtonStyle.red, custom_id="checkin:pomodoro_blocked")
+        not_done_button = discord.ui.Button(label="Not Done", style=discord.ButtonStyle.secondary, custom_id="checkin:pomodoro_not_done")
 
         view.add_item(done_button)
         view.add_item(blocked_button)
@@ -206,11 +321,9 @@ class Checkin(commands.Cog):
         discord_id = interaction.user.id
         discord_user = interaction.user.name
 
-        time = str(await get_time_epoch())
+        time = await get_time_epoch()
 
-        conn = create_connection("cse_discord.db")
-        status = insert_user(conn, discord_id, discord_user, time)
-        conn.close()
+        status = await self.db.write(insert_user, discord_id, discord_user, time)
 
         if status == "User already exists":
             await interaction.response.send_message("ERROR: You are already registered", ephemeral=True)
@@ -222,10 +335,7 @@ class Checkin(commands.Cog):
             await interaction.response.send_message("Error registering for checkin", ephemeral=True)
             return
 
-        view = Checkin.checkin_view()
-        channel = await interaction.user.create_dm()
-
-        await channel.send(view=view)
+        await dm_outbox.send(interaction.user.id, view='checkin')
         await interaction.response.send_message("A DM has been sent to you", ephemeral=True)
 
     @check_in_group.command(name="clear", description="Clear your messages from the bot and reset timesheets")
@@ -236,7 +346,7 @@ class Checkin(commands.Cog):
         Outputs:
             A new embed for timesheets
         """
-        channel = await interaction.user.create_dm()
+        channel = await dm_outbox.channel(interaction.user.id)
         if channel.id == interaction.channel_id:
             await interaction.response.defer(ephemeral=True)
             await Checkin.clear_checkin_messages(self, channel, interaction.user)
@@ -245,153 +355,193 @@ class Checkin(commands.Cog):
         else:
             await interaction.response.send_message("Cannot clear outside of your DMs", ephemeral=True)
 
-    async def clear_checkin_messages(self, channel:  discord.TextChannel, user: discord.User):
+    async def clear_checkin_messages(self, channel:  discord.abc.Messageable, user: discord.User):
         async for message in channel.history(limit=10):
             if message.author.id == self.bot.user.id:
                 await message.delete()
         
-        conn = create_connection("cse_discord.db")
 
-        # Clear timesheet if open
-        time_id = get_timesheet_id(conn, user.id)
-        if time_id is not None:
-            timesheet = get_timesheet(conn, time_id, user.id)
+        # Clear timesheet and pomodoro if open
+        async with self.state.serialized(user.id):
+            state = self.state.get(user.id)
+            if state is not None:
+                time_id = state.time_id
+                time_out = await get_time_epoch()
 
-            time_in = float(timesheet[2])
-            time_out = await get_time_epoch()
-            total_time = time_out - time_in
- 
-            print(f"Conn: {conn}\nTime ID: {time_id}\nUser: {user.id}\nTime in: {time_in}\nTime out: {time_out}\nTotal time: {total_time}\n")
-            update_timesheet(conn, time_id, user.id, time_in, time_out, total_time)
+                if state.in_pomodoro:
+                    total_time = time_out - state.pomo_start
+                    await self.db.write(update_pomodoro, state.pomo_id, time_id, state.issue, state.pomo_start, time_out, total_time, 2, state.help_count)
+                    self.scheduler.cancel(('pomodoro', state.pomo_id))
 
-        # End pomodoro if open
-        pomo_id = get_pomodoro_id(conn, user.id)
-        if pomo_id is not None and time_id is not None:
-            pomodoro = get_pomodoro(conn, pomo_id, time_id)
+                total_time = time_out - state.time_in
+                emit(f"Clearing timesheet {time_id} for {user.id}: time in {state.time_in}, time out {time_out}, total time {total_time}", level='DEBUG', cog='Checkin')
+                await self.db.write(update_timesheet, time_id, user.id, state.time_in, time_out, total_time)
+                await self.db.write(rollup_closed_timesheets)
+                self.scheduler.cancel(('timesheet', time_id))
+                self.state.checked_out(user.id)
 
-            time_start = float(pomodoro[3])
-            time_end = await get_time_epoch()
-            total_time = time_end - time_start
+        # Send new view
+        await dm_outbox.send(user.id, view='checkin')
 
-            update_pomodoro(conn, pomo_id, time_id, "", time_start, time_end, total_time, 2)
+    async def remind_pomodoro(self, pomo_id: int, discord_id: int):
+        """ Checks in with a user once their pomodoro has run for twenty minutes, unless it has already
+            been finished or checked in on
+        """
+        async with self.state.serialized(discord_id):
+            state = self.state.get(discord_id)
+            if state is None or state.pomo_id != pomo_id or state.pomo_status not in (0, None):
+                return
+
+            user = self.bot.get_user(discord_id)
+            if user is not None:
+                pomodoro = await self.db.write(update_pomodoro, pomo_id, state.time_id, state.issue, state.pomo_start, None, None, 1, state.help_count)
+                if pomodoro is True:
+                    self.state.pomodoro_updated(discord_id, 1, state.help_count)
+                reminder = await dm_outbox.send(discord_id, "According to my watch, 20 minutes has passed. How are things going?")
+                self.state.reminder_queued(discord_id, reminder)
+
+    async def auto_checkout(self):
+        """ Runs when a timesheet's deadline is reached. Deadlines that fire together, such as every one that
+            passed while the bot was offline, share one sweep
+        """
+        self._sweep_pending = True
+        if self._sweep is None or self._sweep.done():
+            self._sweep = asyncio.get_running_loop().create_task(self.close_stale())
+
+    async def close_stale(self):
+        """ Closes every timesheet that has been open for eight hours, and its pomodoros, with one set-based
+            write and one rollup. The state of each affected user is then updated under their lock. Sweeps
+            again if another deadline fired while this one was running
+        """
+        while self._sweep_pending:
+            # Let the other deadlines that are due right now join this sweep
+            await asyncio.sleep(0)
+            self._sweep_pending = False
+
+            time = await get_time_epoch()
+            closed = await self.db.write(close_stale_timesheets, time - Checkin.SHIFT_LENGTH, time)
+            if not closed:
+                continue
+            await self.db.write(rollup_closed_timesheets)
+
+            for time_id, discord_id in closed:
+                self.scheduler.cancel(('timesheet', time_id))
+
+                # The timesheet and its pomodoro are already closed
+                async with self.state.serialized(discord_id):
+                    state = self.state.get(discord_id)
+                    if state is not None and state.time_id == time_id:
+                        if state.in_pomodoro:
+                            self.scheduler.cancel(('pomodoro', state.pomo_id))
+                        self.state.checked_out(discord_id)
+
+                user = self.bot.get_user(discord_id)
+
+                if user is not None:
+                    channel = await dm_outbox.channel(user.id)
+                    await change_checkin_status(self.bot, user.id, user.display_name, 'checkout')
+                    await Checkin.clear_checkin_messages(self, channel, user)
+
+    @staticmethod
+    def report_range(start_date: str, end_date: str):
+        """ Turn the dates given to a report command into the range to report on.
+            With no dates, the range is the user's last pay period up to now.
+
+        Args:
+            start_date (str): First day of the report in MM-DD-YYYY format, or None
+            end_date (str): Last day of the report in MM-DD-YYYY format, or None
+
+        Returns:
+            range (Tuple[float, float]): Epoch times the report starts and ends at, or None if the dates are invalid
+        """
+        if start_date is None and end_date is None:
+            now = time.time()
+            monday = get_last_pay_period_monday(now)
+            return datetime.datetime.combine(monday, datetime.time()).timestamp(), now
+
+        if start_date is None or end_date is None:
+            return None
+        try:
+            start, end = get_unix_time(start_date), get_unix_time(end_date) + (24 * 60 * 60)
+        except ValueError:
+            return None
+        return (start, end) if start < end else None
+
+    async def send_report(self, interaction: discord.Interaction, names: dict, start: float, end: float, title: str):
+        """ Build a report for a set of users with one grouped query and send it as embeds plus a CSV attachment.
+            The interaction must already be deferred.
+
+        Args:
+            names (dict): Display name of every user to report on by Discord ID
+            start (float): Epoch time the report starts at
+            end (float): Epoch time the report ends at
+            title (str): Title of the report
+        """
+        await self.db.write(insert_pay_periods, pay_period_calendar(start, end))
+        rows = await self.db.read(get_role_report, list(names), start, end)
+        if rows is None:
+            await interaction.followup.send("Error while generating report", ephemeral=True)
+            return
 
-        conn.close()
+        report = TimesheetReport(rows, names, pay_periods(start, end), title)
 
-        # Send new view
-        await channel.send(view=Checkin.checkin_view())
+        # Embeds in one message share a 6000 character limit, so each one is sent on its own
+        embeds = report.embeds()
+        await interaction.followup.send(embed=embeds[0], file=report.csv_file('timesheet_report.csv'), ephemeral=True)
+        for embed in embeds[1:]:
+            await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @check_in_group.command(name='report', description="Generate a report of your timesheets. Date Format should be in MM-DD-YYYY")
+    async def get_report(self, interaction: discord.Interaction, start_date: str = None, end_date: str = None):
+        """ Generates a timesheet report for the user that runs it.
+            Leaving both dates empty reports on the user's last pay period.
 
-    @tasks.loop(minutes=2.0)
-    async def check_pomodoros(self):
-        """ A task that checks open pomodoros every two minutes looking for pomodoros that need reminders
+        Outputs:
+            An embed with the user's totals and a CSV with their hours per pay period
         """
-        conn = create_connection("cse_discord.db")
-        pomodoros = get_all_open_pomodoros(conn)
-
-        if pomodoros is not None:
-            for pomodoro in pomodoros:
-                time = str(await get_time_epoch())
-                if float(time) >= (float(pomodoro[3]) + (20*60)) and (pomodoro[6] == 0 or pomodoro[6] == None):
-                    user = self.bot.get_user(int(pomodoro[8]))
-
-                    if user is not None:
-                        update_pomodoro(conn, pomodoro[0], pomodoro[1], pomodoro[2], pomodoro[3], pomodoro[4], pomodoro[5], 1, pomodoro[7])
-                        channel = await user.create_dm()
-                        await channel.send("According to my watch, 20 minutes has passed. How are things going?")
-                elif float(time) >= (float(pomodoro[3]) + (8 * 60 * 60)) and pomodoro[6] == 1:
-                    # Do things here if we ever want to change the automatic close time for pomodoros separately.
-                    # Change the time delta above
-                    while False:
-                        user = self.bot.get_user(int(pomodoro[8]))
-
-    @tasks.loop(minutes=5.0)
-    async def check_timesheets(self):
-        """ A task that checks open timesheets every five minutes looking for timesheets that need closed
+        report_range = Checkin.report_range(start_date, end_date)
+        if report_range is None:
+            await interaction.response.send_message("Please provide both dates in MM-DD-YYYY format for a given range or leave empty for your last pay period", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        log(self.bot, f'{interaction.user} generated their timesheet report', interaction=interaction)
+        await self.send_report(interaction, {interaction.user.id: interaction.user.display_name}, *report_range,
+                               f'Timesheet report for {interaction.user.display_name}')
+
+    @check_in_group.command(name='report-role', description="Generate a timesheet report for every member of a role. Date Format should be in MM-DD-YYYY")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def role_report(self, interaction: discord.Interaction, role: discord.Role, start_date: str = None, end_date: str = None):
+        """ Generates a payroll report for every member of a role.
+            Leaving both dates empty reports on the last pay period.
+
+        Outputs:
+            Embeds with each member's totals and a CSV with everyone's hours per pay period
         """
-        conn = create_connection("cse_discord.db")
-        timesheets = get_all_open_timesheets(conn)
-
-        if timesheets is not None:
-            for timesheet in timesheets:
-                time = await get_time_epoch()
-                
-                if time >= (float(timesheet[2]) + (8 * 60 * 60)):
-                    user = self.bot.get_user(int(timesheet[1]))
-
-                    if user is not None:
-                        total_time = time - float(timesheet[2])
-                        update_timesheet(conn, timesheet[0], timesheet[1], timesheet[2], time, total_time)
-
-                        close_all_pomodoros(conn, timesheet[0], time)
-
-                        channel = await user.create_dm()
-                        await change_checkin_status(self.bot, user.id, user.display_name, 'checkout')
-                        await Checkin.clear_checkin_messages(self, channel, user)
-
-    #TODO The get_report and get_montly_report function needs to be changed such that the output is presented to the user in a suitable and formatted fashion
-    #Currently, it is set to output the SQL data to the terminal.
-
-    # @check_in_group.command(name='report', description="Generate Report of the user's timesheet. Date Format should be in MM-DD-YYYY")
-    # async def get_report(self, interaction: discord.Interaction, start_time:str = None, end_time:str = None):
-    #     """
-    #         Generates user report when requested by a USER
-            
-    #     """
-    #     conn = create_connection("cse_discord.db")
-    #     new_start_time = None if start_time is None else get_unix_time(start_time)
-    #     new_end_time = None if end_time is None else get_unix_time(end_time)
-
-    #     if start_time is None and end_time is None:
-    #         #get the last pay period
-    #         todays_date = time.time()
-    #         monday = str(get_last_pay_period_monday(todays_date))
-    #         datetime_obj = datetime.datetime.strptime(monday, '%Y-%m-%d')
-    #         new_start_time = datetime_obj.timestamp()
-
-    #         new_end_time = time.time()
-    #         all_records, total_hours, complete_pomodoros = get_user_report(conn, interaction.user.id, new_start_time,new_end_time)
-    #         print(all_records, total_hours, complete_pomodoros)
-    #         await interaction.response.send_message("Look at the terminal log now, replace this later", ephemeral=True) #TODO replace this later
-
-    #     elif start_time is not None and end_time is not None:
-    #         all_records, total_hours, complete_pomodoros = get_user_report(conn, interaction.user.id, new_start_time,new_end_time)
-    #         print("with data",all_records, total_hours, complete_pomodoros)
-    #         await interaction.response.send_message("Look at the terminal log now, replace this later", ephemeral=True) #TODO replace this later
-    #     else:
-    #         await interaction.response.send_message("Please provide both dates for a given range or leave empty for your last pay period", ephemeral=True)
-
-
-    # @check_in_group.command(name='report-monthly', description="Generate report of multiple user for the month. Date Format should be in MM-DD-YYYY")
-    # # @app_commands.default_permissions(administrator=True)
-    # async def get_montly_report(self, interaction: discord.Interaction, role:discord.Role, start_time:str, end_time:str):
-    #     """
-    #         Generates report for multiple user for admin level user
-
-    #     """
-    #     conn = create_connection("cse_discord.db")
-    #     new_start_time = None if start_time is None else get_unix_time(start_time)
-    #     new_end_time = None if end_time is None else get_unix_time(end_time)
-    #     report = {}
-    #     for member in role.members:
-    #         if start_time is None and end_time is None:
-    #             #get the last pay period
-    #             todays_date = time.time()
-    #             monday = str(get_last_pay_period_monday(todays_date))
-    #             datetime_obj = datetime.datetime.strptime(monday, '%Y-%m-%d')
-    #             new_start_time = datetime_obj.timestamp()
-
-    #             new_end_time = time.time()
-    #             all_records, total_hours, complete_pomodoros = get_user_report(conn, member.id, new_start_time,new_end_time)
-    #             print(all_records, total_hours, complete_pomodoros)
-    #             print("error when parsing date. Date Should NOT BE NONE and should be provided")
-
-    #         elif start_time is not None and end_time is not None:
-    #             all_records, total_hours, complete_pomodoros = get_user_report(conn, member.id, new_start_time,new_end_time)
-    #             if not all_records and not complete_pomodoros:
-    #                 print("No record found for ", member.id)
-    #             else:
-    #                 report[member.id] = [all_records, total_hours, complete_pomodoros]
-                
-    #         else:
-    #             await interaction.response.send_message("Please provide both dates for a given range or leave empty for your last pay period", ephemeral=True)
-        
-    #     print("printing report for now \n", report)
\ No newline at end of file
+        report_range = Checkin.report_range(start_date, end_date)
+        if report_range is None:
+            await interaction.response.send_message("Please provide both dates in MM-DD-YYYY format for a given range or leave empty for the last pay period", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        log(self.bot, f'{interaction.user} generated the timesheet report for {role.name}', interaction=interaction)
+        await self.send_report(interaction, {member.id: member.display_name for member in role.members}, *report_range,
+                               f'Timesheet report for {role.name}')
+
+    @check_in_group.command(name='rebuild-hours', description="Rebuild the daily hours used by timesheet reports from every timesheet")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def rebuild_hours(self, interaction: discord.Interaction):
+        """ Rebuilds the daily hours rollup that reports read from.
+            Only needed after timesheets were edited by hand or pomodoros were finished after checking out.
+
+        Outputs:
+            The number of timesheets that were rolled up
+        """
+        await interaction.response.defer(ephemeral=True)
+        count = await self.db.write(rebuild_daily_hours)
+        if count is None:
+            await interaction.followup.send("Error while rebuilding daily hours", ephemeral=True)
+            return
+
+        log(self.bot, f'{interaction.user} rebuilt the daily hours from {count} timesheets', interaction=interaction)
+        await interaction.followup.send(f"Rebuilt daily hours from {count} timesheets", ephemeral=True)
@@ -63,10 +63,10 @@ class CogManagement(commands.Cog):
                 await interaction.channel.send(f'Cog {cog_name} is already loaded')
                 return
             await interaction.channel.send(f'Cog {cog_name} has been loaded')
-            await log(self.bot, f'{interaction.user} loaded the {cog_name} cog.')
+            log(self.bot, f'{interaction.user} loaded the {cog_name} cog.', interaction=interaction)
         else:
             await interaction.response.send_message(f'Cog {cog_name} does not exist. Please be sure you spelled it correctly.')
-            await log(self.bot, f'{interaction.user} attempted to reload the {cog_name} cog, but failed.')
+            log(self.bot, f'{interaction.user} attempted to reload the {cog_name} cog, but failed.', interaction=interaction)
 
 
     @app_commands.command(description="Reload all cogs")
@@ -91,12 +91,12 @@ class CogManagement(commands.Cog):
                 await interaction.channel.send(f'Cog {cog} is unloaded')
                 return
             await interaction.channel.send(f'Cog {cog} has been reloaded')
-            await log(self.bot, f'{interaction.user} reloaded the {cog} cog.')
+            log(self.bot, f'{interaction.user} reloaded the {cog} cog.', interaction=interaction)
         else:
             await interaction.channel.send(f'Cog {cog} does not exist. Please be sure you spelled it correctly.')
-            await log(self.bot, f'{interaction.user} attempted to reload the {cog} cog, but failed.')
+            log(self.bot, f'{interaction.user} attempted to reload the {cog} cog, but failed.', interaction=interaction)
 
-        await log(self.bot, f'{interaction.user} reloaded all cogs.')
+        log(self.bot, f'{interaction.user} reloaded all cogs.', interaction=interaction)
 
 
     @app_commands.command(description="Reload a specific cog")
@@ -128,10 +128,10 @@ class CogManagement(commands.Cog):
                 await interaction.channel.send(f'Cog {cog_name} is unloaded')
                 return
             await interaction.channel.send(f'Cog {cog_name} has been reloaded')
-            await log(self.bot, f'{interaction.user} reloaded the {cog_name} cog.')
+            log(self.bot, f'{interaction.user} reloaded the {cog_name} cog.', interaction=interaction)
         else:
             await interaction.response.send_message(f'Cog {cog_name} does not exist. Please be sure you spelled it correctly.')
-            await log(self.bot, f'{interaction.user} attempted to reload the {cog_name} cog, but failed.')
+            log(self.bot, f'{interaction.user} attempted to reload the {cog_name} cog, but failed.', interaction=interaction)
 
     @app_commands.command(description="Unload a specific cog")
     @app_commands.default_permissions(administrator=True)
@@ -163,13 +163,13 @@ class CogManagement(commands.Cog):
                     await interaction.channel.send(f'Cog {cog_name} is already unloaded')
                     return
                 await interaction.channel.send(f'Cog {cog_name} has been unloaded')
-                await log(self.bot, f'{interaction.user} unloaded the {cog_name} cog.')
+                log(self.bot, f'{interaction.user} unloaded the {cog_name} cog.', interaction=interaction)
             else:
                 await interaction.response.send_message(f'Cannot unload {cog_name}')
                 return
         else:
             await interaction.response.send_message(f'Cog {cog_name} does not exist. Please be sure you spelled it correctly.')
-            await log(self.bot, f'{interaction.user} attempted to unload the {cog_name} cog, but failed.')
+            log(self.bot, f'{interaction.user} attempted to unload the {cog_name} cog, but failed.', interaction=interaction)
 
     # Autocomplete functionality for the parameter "cog_name" in the load, reload, and unload commands
     @load.autocomplete("cog_name")
@@ -194,4 +194,4 @@ class CogManagement(commands.Cog):
         await self.bot.tree.sync()      # syncs global tree to server/guilds
         self.bot.tree.copy_global_to(guild=ctx.guild)       # needs to be run the first time a bot syncs to a server
         await ctx.send(f'All slash commands have been synced')
-        await log(self.bot, f'{ctx.author} synced all slash commands in the {ctx.channel} channel')
+        log(self.bot, f'{ctx.author} synced all slash commands in the {ctx.channel} channel', cog='CogManagement', command='sync', user=str(ctx.author), user_id=ctx.author.id, guild=str(ctx.guild), guild_id=ctx.guild.id)
@@ -1,13 +1,18 @@
+import functools
 import os
 import re
 import pandas as pd
 
 from discord.ext import commands
-from discord.utils import get
 from discord.ui import View
 from discord import app_commands
 
 from utils.rolebutton import RoleButton
+from utils.interaction_router import router
+from utils.guild_executor import GuildExecutor
+from utils.course_planner import CoursePlan, read_courses, plan_teardown, apply_run
+from utils.rollover_journal import rollover_journal
+from utils.role_picker import role_picker
 from utils.utils import *
 
 
@@ -19,42 +24,107 @@ class CourseManagement(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.Cog.listener()
-    async def on_interaction(self, interaction: discord.Interaction):
-        """ An event listener to check for different role button presses.
-            Verifies that the interaction includes a custom_id. Each individual statement
-            checks to make sure that the interaction contains a specific custom_id.
+    async def cog_load(self):
+        """ Registers the role buttons with the interaction router. Role buttons carry the role's ID after
+            `roles:id:`. Buttons built before that carry the role name instead: after `roles:class:<index>:`
+            for class buttons and `roles:toggle:` for the others, or with underscores for spaces after
+            `select_role_class_` and `select_role_` if they were built before custom IDs were structured.
+            The course pickers of the class selection channels use `roles:picker`, `roles:pick`, `roles:page`
+            and `roles:save`, each followed by the course prefix.
         """
+        for action in ('id', 'class', 'toggle', 'legacy_class', 'legacy'):
+            router.add_route('roles', action, functools.partial(self.role_pressed, action), owner=self)
+        router.add_route('roles', 'picker', self.picker_opened, owner=self)
+        router.add_route('roles', 'pick', self.picker_picked, owner=self)
+        router.add_route('roles', 'page', self.picker_paged, owner=self)
+        router.add_route('roles', 'save', self.picker_saved, owner=self)
+        router.add_legacy('select_role_class_', 'roles', 'legacy_class', prefix=True)
+        router.add_legacy('select_role_', 'roles', 'legacy', prefix=True)
+
+    async def cog_unload(self):
+        router.remove_routes(self)
+
+    @staticmethod
+    def button_role(guild: discord.Guild, action: str, args: str):
+        """ Finds the role of a role button from the route of its custom ID.
 
-        # If custom_id is defined
-        if interaction.data is not None and 'custom_id' in interaction.data and interaction.data['custom_id'] is not None and not interaction.response.is_done():
-            # If custom_id is a role select
-            if 'select_role_' in interaction.data['custom_id']:
-                try:
-                    # If class, search for non-greedy role (includes special topics)
-                    if 'select_role_class_' in interaction.data['custom_id']:
-                        name = re.search("^select_role_class_(\w+_\d+(?:_\(.*\))?)_.*", interaction.data['custom_id']).group(1).replace("_", " ")
-                    # If not class, search for greedy role
-                    else:
-                        name = re.search("^select_role_(.*)", interaction.data['custom_id']).group(1).replace("_", " ")
-
-                    # Get role from guild's roles
-                    role = discord.utils.get(interaction.guild.roles, name=name)
-                except ValueError:
-                    role = None
-                
-                # If role was found, add/remove role
-                if role is not None:
-                    # If user has role, remove it
-                    if role in interaction.user.roles:
-                        await interaction.user.remove_roles(role)
-                        await interaction.response.send_message(f"The {role.mention} role has been removed from you.", ephemeral=True)
-                    # If user does not have role, add it
-                    else:
-                        await interaction.user.add_roles(role)
-                        await interaction.response.send_message(f"The {role.mention} role has been given to you.", ephemeral=True)
-                else:
-                    await interaction.response.send_message("Could not find role to add", ephemeral=True)
+        Args:
+            action (str): Action of the button's route
+            args (str): Args of the button's route
+
+        Returns:
+            role (discord.Role): The role, or None if it doesn't exist
+        """
+        # The role ID, followed by the button's index since buttons in one message need unique custom IDs
+        if action == 'id':
+            role_id = args.partition(':')[0]
+            return guild.get_role(int(role_id)) if role_id.isdigit() else None
+
+        if action == 'class':
+            name = args.partition(':')[2]
+        elif action == 'toggle':
+            name = args
+        # Matched non-greedily, since it is followed by the button's index, and may include special topics
+        elif action == 'legacy_class':
+            match = re.search(r"^(\w+_\d+(?:_\(.*\))?)_.*", args)
+            name = match.group(1).replace("_", " ") if match else None
+        else:
+            name = args.replace("_", " ")
+        return guild_index.role(guild, name) if name else None
+
+    async def role_pressed(self, action: str, interaction: discord.Interaction, args: str):
+        """ Gives the role of a role button to the user if they don't have it and removes it if they do.
+        """
+        role = CourseManagement.button_role(interaction.guild, action, args)
+
+        # If role was found, add/remove role
+        if role is not None:
+            # If user has role, remove it
+            if role in interaction.user.roles:
+                await interaction.user.remove_roles(role)
+                await interaction.response.send_message(f"The {role.mention} role has been removed from you.", ephemeral=True)
+            # If user does not have role, add it
+            else:
+                await interaction.user.add_roles(role)
+                await interaction.response.send_message(f"The {role.mention} role has been given to you.", ephemeral=True)
+        else:
+            await interaction.response.send_message("Could not find role to add", ephemeral=True)
+
+    async def picker_opened(self, interaction: discord.Interaction, prefix: str):
+        """ Sends the member a course picker for a prefix, with their current course roles picked.
+        """
+        content, view = role_picker.render(prefix, role_picker.open(interaction.user, prefix))
+        await interaction.response.send_message(content, view=view or discord.utils.MISSING, ephemeral=True)
+
+    async def picker_picked(self, interaction: discord.Interaction, args: str):
+        """ Replaces the picks of one select of a course picker. Nothing is applied until the member saves.
+        """
+        prefix, page, slot = args.split(':')
+        session = role_picker.session(interaction.user, prefix)
+        role_picker.pick(session, int(page), int(slot), interaction.data.get('values', []))
+        content, view = role_picker.render(prefix, session)
+        await update_view(interaction, view, content)
+
+    async def picker_paged(self, interaction: discord.Interaction, args: str):
+        """ Shows another page of a course picker, keeping the picks made on the other pages.
+        """
+        prefix, _, page = args.partition(':')
+        session = role_picker.session(interaction.user, prefix)
+        session.page = max(0, int(page))
+        content, view = role_picker.render(prefix, session)
+        await update_view(interaction, view, content)
+
+    async def picker_saved(self, interaction: discord.Interaction, prefix: str):
+        """ Applies everything picked in a course picker to the member in a single edit.
+        """
+        session = role_picker.session(interaction.user, prefix)
+        try:
+            added, removed = await role_picker.save(interaction.user, prefix, session)
+        except discord.HTTPException as e:
+            await interaction.response.send_message(f"Could not update your courses: {e.text}", ephemeral=True)
+            return
+        content, view = role_picker.render(prefix, session, note=f"Saved: {added} course(s) added, {removed} removed.")
+        await update_view(interaction, view, content)
 
     async def get_category(self, interaction, category_names):
         """Verifies categories to be destroyed
@@ -72,7 +142,7 @@ class CourseManagement(commands.Cog):
         missing_categories = '__**MISSING FOLLOWING CATEGORIES**__\n'
 
         for category_name in category_names:
-            category = get(interaction.guild.categories, name=category_name)
+            category = guild_index.category(interaction.guild, category_name)
 
             # If the category was not found it adds it to the missing_categories message
             if category == None:
@@ -102,7 +172,7 @@ class CourseManagement(commands.Cog):
         missing_roles = '__**MISSING FOLLOWING ROLES**__\n'
 
         for role_name in role_names:
-            role = get(interaction.guild.roles, name=role_name)
+            role = guild_index.role(interaction.guild, role_name)
 
             # If the role was not found it adds it to the missing_roles message
             if role == None:
@@ -117,88 +187,56 @@ class CourseManagement(commands.Cog):
         return roles
 
     @app_commands.command(description="Create course channels")
+    @app_commands.describe(dry_run="Only show what would change", prune="Also remove courses that are no longer in the CSV")
     @app_commands.default_permissions(administrator=True)
-    async def buildcourses(self, interaction:discord.Interaction):
+    async def buildcourses(self, interaction:discord.Interaction, dry_run:bool = False, prune:bool = False):
         """Create course channels
-        Try to destroy old course channels (calls on destroycourses)
         Read in role csv from cached file or from attachment on discord message
-        Extract columns needed through a panda dataframe
+        Plan what has to change by comparing the courses with the guild: missing roles, categories and channels
+        are created, wrong category permissions are fixed, and with prune, courses dropped from a new csv are removed
+        Send the plan, and stop there if this is a dry run
         Get confirmation from author
-        Create all categories, channels, and roles
+        Apply the plan, so courses that are already built cost nothing
         """
 
         await interaction.response.send_message("Please send CSV if you intend to use one. If you do not intend to use one, the cached CSV will be used.")
         csv_filepath = f'role_lists/roles_{interaction.guild.id}.csv'
+        pending_filepath = f'{csv_filepath}.pending'
 
         csv = await interaction.client.wait_for('message', check=lambda message: message.author == interaction.user)
-        # If csv file attached, overwrite existing csv
+        # If csv file attached, it replaces the cached csv once the build is confirmed
+        previous = []
         if len(csv.attachments) > 0:
-            try:
-                os.remove(csv_filepath)
-            except FileNotFoundError:
-                pass
-            await csv.attachments[0].save(csv_filepath)
-        
-        courses_df = pd.read_csv(csv_filepath)
+            await csv.attachments[0].save(pending_filepath)
+            previous = read_courses(csv_filepath)
+            courses = read_courses(pending_filepath)
+        else:
+            pending_filepath = None
+            courses = read_courses(csv_filepath)
 
-        # iterates through dataframe checking if a category exists
-        # if it does, drop the row from the dataframe
-        for i in range(len(courses_df)):
-            if get(interaction.guild.categories, name=courses_df.loc[i, "text"]):
-                courses_df.drop(index=i, axis=0, inplace=True)
-        
-        courses_df = courses_df.dropna(subset=['create_channels'])
+        plan = CoursePlan(interaction.guild, courses, previous)
+        for chunk in chunk_lines(plan.report(prune)):
+            await interaction.channel.send(chunk)
 
-        # extracts appropriate columns using a dataframe
-        role_names = courses_df["role/link"].to_list()
-        course_channels = courses_df["create_channels"].to_list()
-        category_names = courses_df["text"].to_list()
-        long_names = courses_df["long_name"].to_list()
+        # Get confirmation before building channels
+        if dry_run or not plan.calls(prune) or not await confirmation(self.bot, interaction, 'build'):
+            if pending_filepath is not None:
+                os.remove(pending_filepath)
+            return
 
-        # Print to user list of channels to build
-        message = '__**CREATE FOLLOWING CATEGORIES**__\n'
-        for category_name in category_names:
-            message += f'{category_name}\n'
-        await interaction.channel.send(message)
+        if pending_filepath is not None:
+            os.replace(pending_filepath, csv_filepath)
 
-        if not len(category_names):
-            await interaction.channel.send("NO CATEGORIES TO BUILD")
+        run_id = await rollover_journal.start(interaction.guild.id, 'build', plan.changes(prune))
+        failures = await apply_run(rollover_journal, run_id, GuildExecutor(), interaction.channel, interaction.guild,
+                                   'Building courses')
 
-        # Get confirmation before building channels
-        if not await confirmation(self.bot, interaction, 'build'):
-            return
-        
-        permissions = discord.Permissions(read_messages=True, send_messages=True, embed_links=True, 
-                attach_files=True, read_message_history=True, add_reactions=True, connect=True, speak=True, 
-                stream=True, use_voice_activation=True, change_nickname=True, mention_everyone=False)
-        
-        for i in range(len(role_names)):
-            # Create roles
-            role_name = role_names[i]
-            role = await interaction.guild.create_role(name=role_name, permissions=permissions)
-            role.mentionable = True
-            
-            # Create category
-            category_name = category_names[i]
-            category = await interaction.guild.create_category(category_name)
-            await category.set_permissions(interaction.guild.default_role, read_messages=False)      # sets category to private
-            await category.set_permissions(role, read_messages=True)        # allow role to see category
-            
-            # Create channels
-            channels = course_channels[i].split(",")
-
-            for channel in channels:
-                # Create text channel
-                if channel.startswith('#'):
-                    await category.create_text_channel(channel, topic=long_names[i])
-                # Create voice channel(s)
-                else:
-                    member_count, channel_name = channel.split('#')
-                    if member_count == 0:
-                        await category.create_voice_channel(channel_name)
-                    else:
-                        await category.create_voice_channel(channel_name, user_limit=int(member_count))
-        await interaction.channel.send('***CATEGORIES AND ROLES HAVE BEEN BUILT***')
+        changed = len(plan.actions) + (len(plan.removals) if prune else 0)
+        if failures:
+            await interaction.channel.send(f'***{changed - len(failures)} OF {changed} COURSES HAVE BEEN BUILT***\n'
+                                           'Run `/rollover resume` to retry the rest')
+        else:
+            await interaction.channel.send('***CATEGORIES AND ROLES HAVE BEEN BUILT***')
 
     @app_commands.command()
     @app_commands.default_permissions(administrator=True)
@@ -251,31 +289,60 @@ class CourseManagement(commands.Cog):
             await interaction.followup.send("Confirmation denied")
             return
         
-        # Destroy categories and all subchannels
-        for category in categories:
-            for channel in category.channels:
-                await channel.delete()
-            await category.delete()
-        
-        for role in destroy_roles:
-            await role.delete()
+        # Destroy categories, all subchannels and roles, journaled so an interrupted teardown can be resumed
+        changes = plan_teardown(interaction.guild, read_courses(csv_filepath))
+        run_id = await rollover_journal.start(interaction.guild.id, 'destroy', changes)
+        failures = await apply_run(rollover_journal, run_id, GuildExecutor(), interaction.channel, interaction.guild,
+                                   'Destroying courses')
+
+        if failures:
+            await interaction.channel.send(f'***{len(changes) - len(failures)} OF {len(changes)} COURSES HAVE BEEN DESTROYED***\n'
+                                           'Run `/rollover resume` to retry the rest')
+            await interaction.followup.send("Some courses could not be destroyed")
+            return
 
         await interaction.channel.send('***CATEGORIES AND ROLES HAVE BEEN DESTROYED***')
         await interaction.followup.send("Courses have been destroyed")
 
+    rollover_group = app_commands.Group(name="rollover", description="Manage semester course builds and teardowns",
+                                        default_permissions=discord.Permissions(administrator=True))
+
+    @rollover_group.command(name="resume", description="Finish the last course build or teardown that was interrupted")
+    async def rollover_resume(self, interaction:discord.Interaction):
+        """Resume an interrupted course build or teardown
+        Look up the last run of /buildcourses or /destroycourses in this guild that didn't finish
+        Replay only its unfinished steps. Steps whose outcome is unknown are checked against the guild first
+        """
+
+        run = await rollover_journal.unfinished(interaction.guild.id)
+        if run is None:
+            await interaction.response.send_message("There is no unfinished course build or teardown to resume", ephemeral=True)
+            return
+
+        run_id, kind, started, remaining, total = run
+        await interaction.response.send_message(f"Resuming the course {kind} started <t:{int(started)}:R>: {remaining} of {total} steps left")
+        log(self.bot, f'{interaction.user} resumed course {kind} {run_id}', interaction=interaction)
+
+        failures = await apply_run(rollover_journal, run_id, GuildExecutor(), interaction.channel, interaction.guild,
+                                   f'Resuming course {kind}', resume=True)
+        if failures:
+            await interaction.channel.send(f'***{len(failures)} COURSES COULD NOT BE FINISHED***\nRun `/rollover resume` to retry them')
+        else:
+            await interaction.channel.send(f'***COURSE {kind.upper()} HAS BEEN FINISHED***')
+
     async def rolemenu_callback(self, interaction:discord.Interaction, prefixes:list):
         """Callback function for buildrolemenu
         Creates role menus
         Find csv and extracts columns needed through a pandas dataframe
         Get confirmation from author when they wish to continue building the role menu despite missing roles in the server
-        Create the buttons and put them in a view
-        Send the role menu(s) consisting of the view(s) to the proper channel(s)
+        Create a button that opens the course picker of each prefix and put it in a view
+        Send the role menu consisting of the view to the proper channel
 
         Args:
             prefixes (list): used to access selected course-subject prefixes for role button creation
 
         Outputs:
-            rolemenus that consist of rolebuttons
+            rolemenus that consist of a course picker button
         """
 
         await interaction.response.defer()
@@ -293,13 +360,12 @@ class CourseManagement(commands.Cog):
         # if it doesn't, a confirmation message is created to display
         # roles that cannot be created 
         for i in range(len(courses_df)):
-            if not get(interaction.guild.roles, name=courses_df.loc[i, "role/link"]):
+            if not guild_index.role(interaction.guild, courses_df.loc[i, "role/link"]):
                 confirmation_message += f"{courses_df.loc[i, 'role/link']}\n"
                 courses_df.drop(index=i, axis=0, inplace=True)
 
         # extracts appropriate columns using a dataframe
         category_names = courses_df["text"].to_list()
-        long_names = courses_df["long_name"].to_list()
         role_names = courses_df["role/link"].to_list()
 
         if confirmation_message:
@@ -317,22 +383,15 @@ class CourseManagement(commands.Cog):
             if channel == None:
                 message += f"{channel_name} can't be found.\n"
                 continue
-            view = View(timeout=None)
-            for i in range(len(role_names)):
-                # ensure prefix matches the course name (CEG, CS, EE)
-                if re.match(prefix, category_names[i]):
-                    # limit of 25 components per view
-                    if len(view.children) % 25 == 0 and len(view.children) != 0:
-                        message = await channel.send(view=view)
-                        view = View(timeout=None)
-                    name = str(role_names[i]).replace(" ", "_")
-                    this_button = discord.ui.Button(label=f"{category_names[i]} - {long_names[i]}", style=discord.ButtonStyle.gray, custom_id=f"select_role_class_{name}_{i}")
-                    view.add_item(this_button)
-            if not len(view.children):
+            # ensure prefix matches the course name (CEG, CS, EE)
+            if not any(re.match(prefix, category_name) for category_name in category_names):
                 message += f"No buttons were built for: {prefix}\n"
                 continue
-            await channel.send(view=view)
-            message += f"Role buttons have been built for: {prefix}\n"
+            # one button opens a picker with every course of the prefix, instead of a button per course
+            view = View(timeout=None)
+            view.add_item(discord.ui.Button(label=f"Choose {prefix} courses", style=discord.ButtonStyle.blurple, custom_id=f"roles:picker:{prefix}"))
+            await channel.send(f"Press the button to see your {prefix} courses and add or remove any of them at once.", view=view)
+            message += f"Role picker has been built for: {prefix}\n"
         await interaction.channel.send(message)
 
     @app_commands.command()
@@ -390,6 +449,7 @@ class CourseManagement(commands.Cog):
                 stream=True, use_voice_activation=True, change_nickname=True, mention_everyone=False)
 
         # if a user entered a role mention, get the role object + name
+        role = None
         if role_name.startswith("<@&") and role_name.endswith(">"):
             role_name = role_name[3:-1]
 
@@ -401,10 +461,11 @@ class CourseManagement(commands.Cog):
             if role:
                 role_name = role.name
 
-            # create the role if it does not exist
-            if not get(interaction.guild.roles, name=role_name):
-                role = await interaction.guild.create_role(name=role_name, permissions=permissions)
-                role.mentionable = True
+        # create the role if it does not exist
+        if "http" not in role_name and role is None:
+            role = guild_index.role(interaction.guild, role_name)
+            if role is None:
+                role = await interaction.guild.create_role(name=role_name, permissions=permissions, mentionable=True)
 
         # create the button
         view = View(timeout=None)
@@ -413,7 +474,7 @@ class CourseManagement(commands.Cog):
         if "http" in role_name:
             this_button = discord.ui.Button(label=button_name, style=discord.ButtonStyle.url, url=role_name)
         else:
-            this_button = discord.ui.Button(label=button_name, style=discord.ButtonStyle.gray, custom_id=f"select_role_{role_name.replace(' ', '_')}")
+            this_button = discord.ui.Button(label=button_name, style=discord.ButtonStyle.gray, custom_id=f"roles:id:{role.id}")
         if emoji != 'None':
             this_button.emoji = emoji
         
@@ -424,7 +485,73 @@ class CourseManagement(commands.Cog):
             await interaction.channel.send(view=view)
         except:
             await interaction.channel.send("Emoji doesn't exist, please try again.")
-            await log(self.bot, f"{interaction.user} tried creating the '{button_name}' button for role '{role_name}' role in #{interaction.channel} but failed because emoji did not exist")
+            log(self.bot, f"{interaction.user} tried creating the '{button_name}' button for role '{role_name}' role in #{interaction.channel} but failed because emoji did not exist", interaction=interaction)
         else:
-            await log(self.bot, f"{interaction.user} created the '{role_name}' role and '{button_name}' button in #{interaction.channel}")
+            log(self.bot, f"{interaction.user} created the '{role_name}' role and '{button_name}' button in #{interaction.channel}", interaction=interaction)
         await interaction.followup.send("Role button was created")
+
+    def migrate_view(self, guild: discord.Guild, message: discord.Message):
+        """ Rebuilds the view of a role menu with role IDs in the custom IDs of its buttons. Buttons keep their
+            label, style, emoji and row, and URL buttons and buttons whose role can't be found are kept as they are.
+
+        Args:
+            guild (discord.Guild): The guild of the role menu
+            message (discord.Message): The role menu
+
+        Returns:
+            view (discord.ui.View): The rebuilt view
+            migrated (int): Number of buttons that now carry a role ID
+            unresolved (int): Number of role buttons whose role couldn't be found
+        """
+        view = View.from_message(message, timeout=None)
+        migrated = unresolved = 0
+        for i, item in enumerate(view.children):
+            custom_id = getattr(item, 'custom_id', None)
+            resolved = router.resolve(custom_id) if custom_id else None
+            if resolved is None:
+                continue
+            (namespace, action), args = resolved
+            if namespace != 'roles' or action == 'id':
+                continue
+
+            role = CourseManagement.button_role(guild, action, args)
+            if role is None:
+                unresolved += 1
+                continue
+            item.custom_id = f"roles:id:{role.id}:{i}"
+            migrated += 1
+        return view, migrated, unresolved
+
+    @app_commands.command(description="Rebuild the role menus in the class selection channels to use role IDs")
+    @app_commands.default_permissions(administrator=True)
+    async def migraterolemenus(self, interaction:discord.Interaction):
+        """Migrates role menus
+        Finds the role menus the bot sent to the class selection channels
+        Rebuilds the buttons that still carry a role name to carry the role ID, so clicking them doesn't search
+        the guild's roles by name and keeps working when the role is renamed
+        Edits every role menu that changed and reports how many buttons were migrated
+        """
+
+        await interaction.response.defer()
+        executor = GuildExecutor()
+        messages = buttons = unresolved = 0
+
+        for channel in interaction.guild.text_channels:
+            if not channel.name.endswith('-class-selection'):
+                continue
+            async for menu in channel.history(limit=None):
+                if menu.author != self.bot.user or not menu.components:
+                    continue
+                view, migrated, missing = self.migrate_view(interaction.guild, menu)
+                unresolved += missing
+                if not migrated:
+                    continue
+                await executor.call('edit_message', menu.edit, view=view)
+                messages += 1
+                buttons += migrated
+
+        message = f"Migrated {buttons} button(s) on {messages} role menu(s)."
+        if unresolved:
+            message += f"\n{unresolved} button(s) were left as they are because their role could not be found."
+        log(self.bot, f"{interaction.user} migrated {buttons} role button(s) on {messages} role menu(s)", interaction=interaction)
+        await interaction.followup.send(message)
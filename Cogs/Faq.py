@@ -73,7 +73,7 @@ class Faq(commands.Cog):
             await interaction.response.send_message("FAQ has been disabled for this channel!")
 
             # Logging
-            await log(self.bot, f'{interaction.user} has disabled FAQ for the {interaction.channel} channel')
+            log(self.bot, f'{interaction.user} has disabled FAQ for the {interaction.channel} channel', interaction=interaction)
         
         # If the channel is not in the list add it to the end
         else:
@@ -81,7 +81,7 @@ class Faq(commands.Cog):
             self.channel_names.append(interaction.channel.name)
 
             # Logging
-            await log(self.bot, f'{interaction.user} has enabled FAQ for the {interaction.channel} channel') 
+            log(self.bot, f'{interaction.user} has enabled FAQ for the {interaction.channel} channel', interaction=interaction)
 
         channels_path = r"assets/FAQ/channels.txt"
         path = Path(channels_path)
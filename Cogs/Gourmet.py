@@ -121,7 +121,7 @@ class Gourmet(commands.Cog):
         """
 
         await interaction.response.send_message(view=self.GourmetMenu(cog=self))
-        await log(self.bot, f'{interaction.user} ran /feedMe in `#{interaction.channel}`')
+        log(self.bot, f'{interaction.user} ran /feedMe in `#{interaction.channel}`', interaction=interaction)
 
     async def write_restaurants(self):
         self.restaurants.to_csv('assets/restaurants.csv', index=False)
\ No newline at end of file
@@ -12,6 +12,137 @@ class Listeners(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        """Caches the log channel and name index of a newly joined guild
+
+        Args:
+            guild (discord.Guild): The guild that was joined
+        """
+
+        channel_log_sink.resolve(guild)
+        guild_index.build(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        """Forgets the log channel and name index of a guild the bot has left
+
+        Args:
+            guild (discord.Guild): The guild that was left
+        """
+
+        channel_log_sink.forget(guild)
+        guild_index.forget(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        """Keeps cached channel lookups current when a channel is created
+
+        Args:
+            channel (discord.abc.GuildChannel): The created channel
+        """
+
+        channel_log_sink.channel_created(channel)
+        guild_index.channel_created(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        """Keeps cached channel lookups current when a channel is deleted
+
+        Args:
+            channel (discord.abc.GuildChannel): The deleted channel
+        """
+
+        channel_log_sink.channel_deleted(channel)
+        guild_index.channel_deleted(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        """Keeps cached channel lookups current when a channel is renamed
+
+        Args:
+            before (discord.abc.GuildChannel): The channel before the update
+            after (discord.abc.GuildChannel): The channel after the update
+        """
+
+        channel_log_sink.channel_updated(before, after)
+        guild_index.channel_updated(before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        """Keeps the name index current when a role is created
+
+        Args:
+            role (discord.Role): The created role
+        """
+
+        guild_index.role_created(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        """Keeps the name index current when a role is deleted
+
+        Args:
+            role (discord.Role): The deleted role
+        """
+
+        guild_index.role_deleted(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        """Keeps the name index current when a role is renamed
+
+        Args:
+            before (discord.Role): The role before the update
+            after (discord.Role): The role after the update
+        """
+
+        guild_index.role_updated(before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_emojis_update(self, guild, before, after):
+        """Keeps the name index current when a guild's emojis change
+
+        Args:
+            guild (discord.Guild): The guild whose emojis changed
+            before (Sequence[discord.Emoji]): The emojis before the update
+            after (Sequence[discord.Emoji]): The emojis after the update
+        """
+
+        guild_index.emojis_updated(guild, after)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        """Keeps the name index and member resolver current when a member joins
+
+        Args:
+            member (discord.Member): The member that joined
+        """
+
+        guild_index.member_joined(member)
+        member_resolver.member_joined(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        """Keeps the name index current when a member leaves
+
+        Args:
+            member (discord.Member): The member that left
+        """
+
+        guild_index.member_removed(member)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        """Keeps the name index current when a user changes their username
+
+        Args:
+            before (discord.User): The user before the update
+            after (discord.User): The user after the update
+        """
+
+        guild_index.user_updated(before, after)
+
     @commands.Cog.listener()
     async def on_message(self, ctx):
         """Auto-reacts emojis to discord messages
@@ -30,7 +161,7 @@ class Listeners(commands.Cog):
 
             # Get the TA role from its name
             ta_role_name = 'Teaching Assistant'
-            ta_role = discord.utils.get(ctx.guild.roles, name=ta_role_name)
+            ta_role = guild_index.role(ctx.guild, ta_role_name)
             
             # Only react if its in the help room channel and if the user has the TA role
             if ctx.channel.name == 'cs-help-room' and ta_role in ctx.author.roles:
@@ -59,7 +190,7 @@ class Listeners(commands.Cog):
         # Checks if the channel is type of TextChannel to avoid errors from ephemeral messages
         if type(before.channel) == discord.TextChannel:
             # Get the channel to send the message to
-            message_log_channel = discord.utils.get(before.guild.channels, name='message-log')
+            message_log_channel = guild_index.channel(before.guild, 'message-log')
 
             # If the message log channel exists, and the message was not sent by the bot, log the message
             if message_log_channel and before.author != self.bot.user:
@@ -88,7 +219,7 @@ class Listeners(commands.Cog):
         # Checks if the channel is type of TextChannel to avoid errors from ephemeral messages
         if type(message.channel) == discord.TextChannel:
             # Get the channel to send the message to
-            message_log_channel = discord.utils.get(message.guild.channels, name='message-log')
+            message_log_channel = guild_index.channel(message.guild, 'message-log')
 
             # If the message log channel exists, and the message was not sent by the bot, log the deleted message
             if message_log_channel and message.author != self.bot.user:
@@ -199,7 +199,7 @@ class MOSS(commands.Cog):
             if update.content.lower() == "y":
                 moss_df.loc[moss_df["discord_id"] == discord_id, "moss_id"] = moss_id
                 moss_df.to_csv(csv_filepath, index=False)
-                await log(self.bot, f"{interaction.user} ran /moss_register in #{interaction.channel} and updated their MossID in the CSV")
+                log(self.bot, f"{interaction.user} ran /moss_register in #{interaction.channel} and updated their MossID in the CSV", interaction=interaction)
                 await interaction.followup.send(f"The new MossID: `{moss_id}`, is now associated with your account in the CSV", ephemeral=True)
             else:
                 await interaction.followup.send("Your MossID has not been updated.", ephemeral=True)
@@ -209,5 +209,5 @@ class MOSS(commands.Cog):
             new_row_df = pd.DataFrame([{"discord_id": discord_id, "moss_id": moss_id}])
             moss_df = pd.concat([moss_df, new_row_df], ignore_index=True)
             moss_df.to_csv(csv_filepath, index=False)
-            await log(self.bot, f"{interaction.user} ran /moss_register in #{interaction.channel} and added their MossID to the CSV")
+            log(self.bot, f"{interaction.user} ran /moss_register in #{interaction.channel} and added their MossID to the CSV", interaction=interaction)
             await interaction.response.send_message(f"The MossID: `{moss_id}`, has been added to the CSV and is associated with your account",ephemeral=True)
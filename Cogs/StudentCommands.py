@@ -40,7 +40,7 @@ class StudentCommands(commands.Cog):
 
         # Check if corgis dir exists
         if not exists('dogs/corgis'):
-            await log(self.bot, 'Corgis directory not found, downloading 100 images')
+            log(self.bot, 'Corgis directory not found, downloading 100 images', interaction=interaction)
             await download_corgis(self.bot, interaction, 100)
 
         # Get images from directory
@@ -61,7 +61,7 @@ class StudentCommands(commands.Cog):
         await interaction.followup.send(f'Corgi #{number}:', file=discord.File(image))
 
         # put in the log channel that the corgme command was run
-        await log(self.bot, f'{interaction.user} ran /corgme in #{interaction.channel}')
+        log(self.bot, f'{interaction.user} ran /corgme in #{interaction.channel}', interaction=interaction)
 
 
     @app_commands.command(description='Displays the code needed to print "hello world" to the console')
@@ -109,7 +109,7 @@ class StudentCommands(commands.Cog):
         # Build the message
         message = f'{language}\n```{language_data[language]["tag"]}\n{language_data[language]["code"]}\n```'
         await interaction.response.send_message(message)
-        await log(self.bot, f'{interaction.user} ran /helloworld with language {language} in #{interaction.channel}')
+        log(self.bot, f'{interaction.user} ran /helloworld with language {language} in #{interaction.channel}', interaction=interaction)
 
     @app_commands.command(description="Sends message containing Discord WebSocket protocol latency")
     async def ping(self, interaction:discord.Interaction):
@@ -122,7 +122,7 @@ class StudentCommands(commands.Cog):
 
         latency = round(self.bot.latency * 1000)
         await interaction.response.send_message(f'{latency} ms')
-        await log(self.bot, f'{interaction.user} pinged from #{interaction.channel}, response took {latency} ms')
+        log(self.bot, f'{interaction.user} pinged from #{interaction.channel}, response took {latency} ms', interaction=interaction)
 
     @app_commands.command(description="Create a poll users can vote on")
     async def poll(self, interaction:discord.Interaction, question:str, option1: str, option2: str, option3: str = 'None', option4: str = 'None', 
@@ -169,10 +169,10 @@ class StudentCommands(commands.Cog):
             await react_message.add_reaction(reaction)
 
         # Logging
-        await log(self.bot, f'{interaction.user} started a poll in #{interaction.channel}:')
-        await log(self.bot, question, False)
+        log(self.bot, f'{interaction.user} started a poll in #{interaction.channel}:', interaction=interaction)
+        log(self.bot, question, False, interaction=interaction)
         for option in options:
-            await log(self.bot, f'{option}', False)
+            log(self.bot, f'{option}', False, interaction=interaction)
 
     @app_commands.command(description="Rolls dice based on input") 
     async def roll(self, interaction:discord.Interaction, roll:str):
@@ -204,10 +204,10 @@ class StudentCommands(commands.Cog):
                     await interaction.response.send_message(output[1]) # interaction.response.send_message
                 else:
                     await interaction.response.send_message(f'{output[0]}\n{output[1]}')
-                await log(self.bot, f'{interaction.user} successfully ran /roll in #{interaction.channel}')
+                log(self.bot, f'{interaction.user} successfully ran /roll in #{interaction.channel}', interaction=interaction)
             except Exception:
                 await interaction.response.send_message('Invalid input')
-                await log(self.bot, f'{interaction.user} unsuccessfully ran /roll in #{interaction.channel}, errored because input was invalid')
+                log(self.bot, f'{interaction.user} unsuccessfully ran /roll in #{interaction.channel}, errored because input was invalid', interaction=interaction)
         else:
             await interaction.response.send_message('Too large of an input')
-            await log(self.bot, f'{interaction.user} unsuccessfully ran /roll in #{interaction.channel}, errored because input was too large')
+            log(self.bot, f'{interaction.user} unsuccessfully ran /roll in #{interaction.channel}, errored because input was too large', interaction=interaction)
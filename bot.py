@@ -2,6 +2,7 @@
 import os
 from time import time
 
+import aiofiles
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
@@ -31,10 +32,10 @@ async def on_ready():
     await bot.change_presence(activity=discord.Game('Booting'), status=discord.Status.dnd)
 
     # Start logging
-    await log(bot, '\n\n\n\n\n', False)
-    await log(bot, '###################################')
-    await log(bot, '# BOT STARTING FROM FULL SHUTDOWN #')
-    await log(bot, '###################################')
+    log(bot, '\n\n\n\n\n', False)
+    log(bot, '###################################')
+    log(bot, '# BOT STARTING FROM FULL SHUTDOWN #')
+    log(bot, '###################################')
 
     # Load all cogs
     await bot.change_presence(activity=discord.Game(f'Loading Cogs'), status=discord.Status.idle)
@@ -42,7 +43,7 @@ async def on_ready():
         if not file.startswith('__') and file.endswith('.py'):
             try:
                 await bot.load_extension(f'Cogs.{file[:-3]}')
-                await log(bot, f'Loaded cog: {file[:-3]}')
+                log(bot, f'Loaded cog: {file[:-3]}')
             except commands.errors.NoEntryPointError:
                 pass
 
@@ -59,13 +60,23 @@ async def on_ready():
             contents = 'Raider Up!'
         
     await bot.change_presence(activity=discord.Game(contents), status=discord.Status.online)
-    await log(bot, 'Bot is online')
+    log(bot, 'Bot is online')
 
     # Print startup duration
-    await log(bot, '#########################')
-    await log(bot, '# BOT STARTUP COMPLETED #')
-    await log(bot, '#########################\n')
-    await log(bot, f'Started in {round(time() - start_time, 1)} seconds')
+    log(bot, '#########################')
+    log(bot, '# BOT STARTUP COMPLETED #')
+    log(bot, '#########################\n')
+    log(bot, f'Started in {round(time() - start_time, 1)} seconds')
+
+
+@bot.event
+async def on_interaction(interaction):
+    """Routes component and modal interactions
+
+    Every button press and modal submission goes through this one listener, which hands it to the handler
+    registered with the interaction router for its custom_id. Slash commands are handled by the command tree.
+    """
+    await router.dispatch(interaction)
 
 
 @bot.event
@@ -76,22 +87,23 @@ async def on_command_error(ctx, error):
     If other error type, sends message with error statement
     """
     author, message = ctx.author, ctx.message.content
+    fields = {'user': str(author), 'user_id': author.id, 'guild': str(ctx.guild), 'channel': str(ctx.channel)}
 
     if isinstance(error, commands.MissingRequiredArgument):
         await ctx.send('Missing required argument')
         await ctx.send_help()
-        await log(bot, f'{author} attempted to run `{message}` but failed because they were missing a required argument')
+        log(bot, f'{author} attempted to run `{message}` but failed because they were missing a required argument', level='WARNING', **fields)
 
     elif isinstance(error, commands.MissingRole):
         await ctx.send('Missing role')
-        await log(bot, f'{author} attempted to run `{message}` but failed because they were missing a required role')
+        log(bot, f'{author} attempted to run `{message}` but failed because they were missing a required role', level='WARNING', **fields)
 
     elif isinstance(error, commands.CommandNotFound):
-        await log(bot, f'{author} attempted to run `{message}` but failed because the command was not found')
+        log(bot, f'{author} attempted to run `{message}` but failed because the command was not found', **fields)
 
     else:
         await ctx.send(f'Unexpected error: {error}')
-        await log(bot, f'{author} attempted to run `{message}` but failed because of an unexpected error: {error}')
+        log(bot, f'{author} attempted to run `{message}` but failed because of an unexpected error: {error}', level='ERROR', **fields)
 
 
 if __name__ == '__main__':
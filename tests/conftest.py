@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The bot is run from the repository root, which is where its packages are imported from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_log(tmp_path_factory):
+    """Point the log file and the log index at a temporary directory so tests never write to the bot's own.
+    The paths are not restored afterwards, since records still queued are written out at exit.
+    """
+
+    from utils.utils import log_file, log_index
+
+    directory = tmp_path_factory.mktemp('log')
+    log_file.path = str(directory / 'log')
+    log_file._size = 0
+    log_index.path = str(directory / 'log_index.db')
+    log_index.log_path = log_file.path
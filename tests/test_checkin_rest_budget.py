@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+import Cogs.Checkin as checkin_cog
+from utils.db_utils import initialize_db
+from utils.interaction_router import router
+
+
+USER_ID = 42
+
+
+class FakeResponse:
+    """Interaction response that records every call, and fails if an interaction is responded to twice"""
+
+    def __init__(self, calls):
+        self._calls = calls
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    def _record(self, name):
+        assert not self._done, f'{name} after the interaction was already responded to'
+        self._done = True
+        self._calls.append(f'response.{name}')
+
+    async def send_message(self, *args, **kwargs):
+        self._record('send_message')
+
+    async def send_modal(self, modal):
+        self._record('send_modal')
+
+    async def edit_message(self, **kwargs):
+        self._record('edit_message')
+
+    async def defer(self, **kwargs):
+        self._record('defer')
+
+
+class FakeEndpoint:
+    """Stands in for a channel, message or webhook, recording every call made on it"""
+
+    def __init__(self, calls, name, id=None):
+        self._calls = calls
+        self._name = name
+        self.id = id
+
+    def __getattr__(self, attr):
+        async def call(*args, **kwargs):
+            self._calls.append(f'{self._name}.{attr}')
+        return call
+
+
+class FakeUser:
+    id = USER_ID
+    display_name = 'student'
+
+
+class FakeInteraction:
+    def __init__(self, calls, custom_id, value=None):
+        self.data = {'custom_id': custom_id}
+        if value is not None:
+            self.data['components'] = [{'components': [{'value': value}]}]
+        self.user = FakeUser()
+        self.response = FakeResponse(calls)
+        self.channel = FakeEndpoint(calls, 'channel')
+        self.message = FakeEndpoint(calls, 'message', id=99)
+        self.followup = FakeEndpoint(calls, 'followup')
+
+
+class FakeOutbox:
+    """DM outbox whose messages are queued by `send` and only delivered when the test says so.
+    Delivery happens on the outbox's worker, outside of any interaction, so only deleting a delivered
+    message counts towards an interaction's calls.
+    """
+
+    def __init__(self, calls):
+        self._calls = calls
+        self._next_id = 0
+        self.delivered = set()
+
+    async def start(self, bot, db):
+        pass
+
+    async def stop(self):
+        pass
+
+    def register_view(self, name, factory):
+        pass
+
+    async def send(self, user_id, content=None, view=None):
+        self._next_id += 1
+        return self._next_id
+
+    async def retract(self, message_id):
+        if message_id in self.delivered:
+            self._calls.append('dm.delete')
+
+
+class FakeBot:
+    def get_user(self, user_id):
+        return FakeUser()
+
+
+class Harness:
+    """Runs a scenario against a loaded Checkin cog backed by a fresh database"""
+
+    def __init__(self, db_path, calls, outbox):
+        self.db_path = db_path
+        self.calls = calls
+        self.outbox = outbox
+
+    def run(self, scenario):
+        async def main():
+            cog = checkin_cog.Checkin(FakeBot(), self.db_path)
+            await cog.cog_load()
+            try:
+                return await scenario(cog, self.press)
+            finally:
+                await cog.cog_unload()
+        return asyncio.run(main())
+
+    async def press(self, custom_id, value=None):
+        """Dispatch an interaction through the router and return the calls it made"""
+
+        self.calls.clear()
+        assert await router.dispatch(FakeInteraction(self.calls, custom_id, value))
+        return list(self.calls)
+
+
+@pytest.fixture
+def checkin(tmp_path, monkeypatch):
+    calls = []
+    outbox = FakeOutbox(calls)
+    monkeypatch.setattr(checkin_cog, 'dm_outbox', outbox)
+
+    # The status board coalesces its edits on its own schedule, so it isn't part of any interaction
+    async def change_checkin_status(*args):
+        pass
+    monkeypatch.setattr(checkin_cog, 'change_checkin_status', change_checkin_status)
+
+    db_path = str(tmp_path / 'cse_discord.db')
+    initialize_db(db_path)
+    return Harness(db_path, calls, outbox)
+
+
+CHECKED_IN = [('checkin:checkin',)]
+IN_POMODORO = CHECKED_IN + [('checkin:pomodoro_create', 'Fix the build')]
+
+# Interactions leading up to the one that is measured, and the one that is measured
+FLOWS = {
+    'checkin': ([], ('checkin:checkin',)),
+    'pomodoro': (CHECKED_IN, ('checkin:pomodoro',)),
+    'pomodoro_create': (CHECKED_IN, ('checkin:pomodoro_create', 'Fix the build')),
+    'pomodoro_blocked': (IN_POMODORO, ('checkin:pomodoro_blocked',)),
+    'pomodoro_blocked_create': (IN_POMODORO, ('checkin:pomodoro_blocked_create', 'Tests fail')),
+    'pomodoro_done': (IN_POMODORO, ('checkin:pomodoro_done',)),
+    'pomodoro_not_done': (IN_POMODORO, ('checkin:pomodoro_not_done',)),
+    'checkout': (CHECKED_IN, ('checkin:checkout',)),
+    'checkout_in_pomodoro': (IN_POMODORO, ('checkin:checkout',)),
+    'already_checked_in': (CHECKED_IN, ('checkin:checkin',)),
+    'pomodoro_done_not_in_pomodoro': (CHECKED_IN, ('checkin:pomodoro_done',)),
+    'pomodoro_blocked_not_in_pomodoro': (CHECKED_IN, ('checkin:pomodoro_blocked',)),
+    'legacy_pomodoro_create': (CHECKED_IN, ('checkedin_pomo_create_7', 'Fix the build')),
+    'legacy_pomodoro_not_done': (IN_POMODORO, ('pomo_not_done_btn',)),
+}
+
+
+@pytest.mark.parametrize('setup, pressed', FLOWS.values(), ids=FLOWS.keys())
+def test_interaction_makes_one_call(checkin, setup, pressed):
+    async def scenario(cog, press):
+        for step in setup:
+            await press(*step)
+        return await press(*pressed)
+
+    calls = checkin.run(scenario)
+    assert len(calls) == 1, calls
+
+
+@pytest.mark.parametrize('action', ['checkin:pomodoro_done', 'checkin:pomodoro_not_done'])
+def test_finishing_pomodoro_retracts_queued_reminder_without_a_call(checkin, action):
+    async def scenario(cog, press):
+        for step in IN_POMODORO:
+            await press(*step)
+        await cog.remind_pomodoro(cog.state.get(USER_ID).pomo_id, USER_ID)
+        return await press(action)
+
+    assert checkin.run(scenario) == ['response.edit_message']
+
+
+@pytest.mark.parametrize('action', ['checkin:pomodoro_done', 'checkin:pomodoro_not_done'])
+def test_finishing_pomodoro_deletes_delivered_reminder(checkin, action):
+    """The budget of Done and Not Done is the response plus one delete, once the reminder has been delivered"""
+
+    async def scenario(cog, press):
+        for step in IN_POMODORO:
+            await press(*step)
+        await cog.remind_pomodoro(cog.state.get(USER_ID).pomo_id, USER_ID)
+        checkin.outbox.delivered.add(cog.state.get(USER_ID).reminder_id)
+        return await press(action)
+
+    assert checkin.run(scenario) == ['response.edit_message', 'dm.delete']
@@ -0,0 +1,149 @@
+import asyncio
+import contextlib
+
+
+class UserCheckin:
+    """The open timesheet of a checked in user, and their open pomodoro if they are in one
+
+    Args:
+        time_id (int): ID of the open timesheet
+        time_in (float): Epoch time the user checked in at
+    """
+
+    __slots__ = ('time_id', 'time_in', 'pomo_id', 'issue', 'pomo_start', 'pomo_status', 'help_count', 'reminder_id')
+
+    def __init__(self, time_id, time_in):
+        self.time_id = time_id
+        self.time_in = time_in
+        self.pomo_id = None
+        self.issue = None
+        self.pomo_start = None
+        self.pomo_status = None
+        self.help_count = None
+        # Outbox ID of the reminder sent during the pomodoro, which is only known until the bot restarts
+        self.reminder_id = None
+
+    @property
+    def in_pomodoro(self):
+        return self.pomo_id is not None
+
+
+class CheckinState:
+    """Authoritative in-memory check-in state of every user
+    A user is checked out, checked in, or in a pomodoro. The state is loaded from the open timesheets and
+    pomodoros once at startup, and after that updated by the Checkin cog right after each change is written
+    to the database, so handling a button press never has to read the database. Users without an entry are
+    checked out.
+
+    Changes to a user's state read it, write to the database and then update it, so they are run one at a time
+    per user inside `serialized`. A double click waits for the first click to finish and then sees its result,
+    instead of both clicks acting on the same stale state.
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._locks = {}
+
+    @contextlib.asynccontextmanager
+    async def serialized(self, discord_id):
+        """Run a change to a user's state after every change already started for them has finished
+        The lock of a user is dropped once nobody is waiting on it.
+
+        Args:
+            discord_id (int): ID of the user
+        """
+
+        entry = self._locks.get(discord_id)
+        if entry is None:
+            entry = self._locks[discord_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[discord_id]
+
+    def load(self, rows):
+        """Replace the state with the rows of `db_utils.get_open_checkins`
+
+        Args:
+            rows (list): (time_id, discord_id, time_in, pomo_id, issue, time_start, status, help_count) rows
+        """
+
+        self._users = {}
+        for time_id, discord_id, time_in, pomo_id, issue, time_start, status, help_count in rows:
+            user = self._users.get(discord_id)
+            if user is None:
+                user = self._users[discord_id] = UserCheckin(time_id, time_in)
+            if pomo_id is not None:
+                self._set_pomodoro(user, pomo_id, issue, time_start, status, help_count)
+
+    def __len__(self):
+        return len(self._users)
+
+    def __iter__(self):
+        return iter(self._users.items())
+
+    def get(self, discord_id):
+        """Get the state of a user
+
+        Args:
+            discord_id (int): ID of the user
+
+        Returns:
+            user (UserCheckin): The user's open timesheet and pomodoro, or None if they are checked out
+        """
+
+        return self._users.get(discord_id)
+
+    def checked_in(self, discord_id, time_id, time_in):
+        """Record that a user checked in"""
+
+        self._users[discord_id] = UserCheckin(time_id, time_in)
+
+    def checked_out(self, discord_id):
+        """Record that a user checked out, which also ends their pomodoro"""
+
+        self._users.pop(discord_id, None)
+
+    def pomodoro_started(self, discord_id, pomo_id, issue, time_start):
+        """Record that a checked in user started a pomodoro"""
+
+        user = self._users.get(discord_id)
+        if user is not None:
+            self._set_pomodoro(user, pomo_id, issue, time_start, None, None)
+
+    def pomodoro_updated(self, discord_id, status, help_count):
+        """Record a new status and help count for a user's open pomodoro"""
+
+        user = self._users.get(discord_id)
+        if user is not None and user.in_pomodoro:
+            user.pomo_status = status
+            user.help_count = help_count
+
+    def reminder_queued(self, discord_id, message_id):
+        """Record the outbox ID of the reminder sent for a user's open pomodoro"""
+
+        user = self._users.get(discord_id)
+        if user is not None and user.in_pomodoro:
+            user.reminder_id = message_id
+
+    def pomodoro_ended(self, discord_id):
+        """Record that a user's pomodoro was finished"""
+
+        user = self._users.get(discord_id)
+        if user is not None:
+            self._set_pomodoro(user, None, None, None, None, None)
+
+    @staticmethod
+    def _set_pomodoro(user, pomo_id, issue, time_start, status, help_count):
+        """Set every pomodoro field of a user at once"""
+
+        user.pomo_id = pomo_id
+        user.issue = issue
+        user.pomo_start = time_start
+        user.pomo_status = status
+        user.help_count = help_count
+        user.reminder_id = None
@@ -0,0 +1,441 @@
+import functools
+import os
+
+import discord
+import pandas as pd
+
+from utils.guild_index import guild_index
+
+
+# Permissions given to every course role
+COURSE_PERMISSIONS = discord.Permissions(read_messages=True, send_messages=True, embed_links=True, attach_files=True,
+                                         read_message_history=True, add_reactions=True, connect=True, speak=True,
+                                         stream=True, use_voice_activation=True, change_nickname=True,
+                                         mention_everyone=False)
+
+
+class Course:
+    """One row of a classlist CSV that has channels to create
+
+    Args:
+        category_name (str): Name of the course category, the `text` column
+        role_name (str): Name of the course role, the `role/link` column
+        long_name (str): Full name of the course, used as the topic of its text channels
+        channels (str): The `create_channels` column. Text channels are `#name`, voice channels `member_limit#name`
+    """
+
+    def __init__(self, category_name, role_name, long_name, channels):
+        self.category_name = category_name
+        self.role_name = role_name
+        self.long_name = long_name
+
+        # (kind, name, user_limit) of each channel, with text channel names as Discord stores them
+        self.channels = []
+        for channel in channels.split(','):
+            if channel.startswith('#'):
+                self.channels.append(('text', channel[1:].strip().lower().replace(' ', '-'), None))
+            else:
+                member_count, channel_name = channel.split('#')
+                self.channels.append(('voice', channel_name, int(member_count)))
+
+
+def read_courses(csv_filepath):
+    """Read the courses of a classlist CSV
+
+    Args:
+        csv_filepath (str): Path to the CSV
+
+    Returns:
+        courses (List[Course]): The courses with channels to create, or an empty list if there is no CSV
+    """
+
+    if not os.path.exists(csv_filepath):
+        return []
+
+    courses_df = pd.read_csv(csv_filepath).dropna(subset=['create_channels'])
+    return [Course(str(row['text']), str(row['role/link']), None if pd.isna(row['long_name']) else str(row['long_name']),
+                   str(row['create_channels']))
+            for _, row in courses_df.iterrows()]
+
+
+class CourseAction:
+    """What has to change in a guild for one course
+
+    Args:
+        course (Course): The course
+        role (discord.Role): The existing course role, or None to create it
+        category (discord.CategoryChannel): The existing course category, or None to create it
+        fix_overwrites (bool): Whether the existing category's permission overwrites have to be replaced
+        channels (list): (kind, name, user_limit) of each channel to create
+    """
+
+    def __init__(self, course, role, category, fix_overwrites, channels):
+        self.course = course
+        self.role = role
+        self.category = category
+        self.fix_overwrites = fix_overwrites
+        self.channels = channels
+
+    @property
+    def calls(self):
+        """Number of API calls applying the action takes"""
+
+        return len(self.steps())
+
+    def steps(self):
+        """List the steps that make the changes, in the order they have to run
+
+        Returns:
+            steps (List[Tuple[str, dict]]): (action, args) of each step, as run by `run_step`
+        """
+
+        steps = []
+        role = {'id': self.role.id} if self.role is not None else None
+        if role is None:
+            role = {'step': len(steps)}
+            steps.append(('create_role', {'name': self.course.role_name}))
+
+        if self.category is None:
+            category = {'step': len(steps)}
+            steps.append(('create_category', {'name': self.course.category_name, 'role': role}))
+        else:
+            category = {'id': self.category.id}
+            if self.fix_overwrites:
+                steps.append(('edit_category', {'category': category, 'role': role}))
+
+        # Channels inherit the category's permissions, and are created in order so they keep their listed positions
+        for kind, name, user_limit in self.channels:
+            if kind == 'text':
+                steps.append(('create_text_channel', {'category': category, 'name': name, 'topic': self.course.long_name}))
+            else:
+                steps.append(('create_voice_channel', {'category': category, 'name': name, 'user_limit': user_limit}))
+        return steps
+
+    def describe(self):
+        """Describe the action as a line of the plan report"""
+
+        parts = []
+        if self.role is None:
+            parts.append('role')
+        if self.category is None:
+            parts.append('category')
+        elif self.fix_overwrites:
+            parts.append('permissions')
+        if self.channels:
+            parts.append(f"{len(self.channels)} channel{'s' if len(self.channels) != 1 else ''}")
+        return f"{'+' if self.category is None else '~'} {self.course.category_name} ({', '.join(parts)})"
+
+
+class CourseRemoval:
+    """A course that is no longer in the classlist, with its category, channels and role
+
+    Args:
+        course (Course): The course, from the previous classlist
+        category (discord.CategoryChannel): The course category, or None if it is already gone
+        role (discord.Role): The course role, or None if it is already gone
+    """
+
+    def __init__(self, course, category, role):
+        self.course = course
+        self.category = category
+        self.role = role
+
+    @property
+    def calls(self):
+        """Number of API calls applying the removal takes"""
+
+        return len(self.steps())
+
+    def steps(self):
+        """List the steps that delete the category, its channels and the role
+
+        Returns:
+            steps (List[Tuple[str, dict]]): (action, args) of each step, as run by `run_step`
+        """
+
+        steps = []
+        if self.category is not None:
+            for channel in self.category.channels:
+                steps.append(('delete_channel', {'channel': {'id': channel.id}, 'name': channel.name}))
+            steps.append(('delete_channel', {'channel': {'id': self.category.id}, 'name': self.category.name}))
+        if self.role is not None:
+            steps.append(('delete_role', {'role': {'id': self.role.id}, 'name': self.role.name}))
+        return steps
+
+    def describe(self):
+        """Describe the removal as a line of the plan report"""
+
+        parts = []
+        if self.category is not None:
+            parts.append(f'category and {len(self.category.channels)} channels')
+        if self.role is not None:
+            parts.append('role')
+        return f"- {self.course.category_name} ({', '.join(parts)})"
+
+
+class CoursePlan:
+    """The changes that bring a guild's course categories, channels and roles in line with a classlist
+    The guild is looked up through the guild index, so planning makes no API calls, and courses that are
+    already fully built take no calls to apply. Courses in the previous classlist that are missing from the
+    new one are planned for removal, but only removed when asked to. The changes are journaled and applied
+    step by step with `apply_run`, so an interrupted build can be resumed.
+
+    Args:
+        guild (discord.Guild): The guild to plan for
+        courses (List[Course]): Courses of the classlist
+        previous (List[Course]): Courses of the classlist the guild was last built from
+    """
+
+    def __init__(self, guild, courses, previous=()):
+        self.guild = guild
+        self.actions = []
+        self.removals = []
+        self.unchanged = 0
+
+        for course in courses:
+            action = self._plan(course)
+            if action.calls:
+                self.actions.append(action)
+            else:
+                self.unchanged += 1
+
+        # A removed course's role is kept while a current course still uses it
+        current = {course.category_name for course in courses}
+        current_roles = {course.role_name for course in courses}
+        for course in previous:
+            if course.category_name in current:
+                continue
+            role = guild_index.role(guild, course.role_name) if course.role_name not in current_roles else None
+            removal = CourseRemoval(course, guild_index.category(guild, course.category_name), role)
+            if removal.calls:
+                self.removals.append(removal)
+
+    def _plan(self, course):
+        """Compare one course with the guild"""
+
+        role = guild_index.role(self.guild, course.role_name)
+        category = guild_index.category(self.guild, course.category_name)
+        if category is None:
+            return CourseAction(course, role, None, False, course.channels)
+
+        # Only the overwrites the build sets are compared, so other changes made by hand are kept
+        overwrites = category.overwrites
+        default = overwrites.get(self.guild.default_role)
+        fix_overwrites = (role is None or default is None or default.read_messages is not False
+                          or role not in overwrites or overwrites[role].read_messages is not True)
+
+        existing = ({('text', channel.name) for channel in category.text_channels}
+                    | {('voice', channel.name) for channel in category.voice_channels})
+        channels = [channel for channel in course.channels if channel[:2] not in existing]
+        return CourseAction(course, role, category, fix_overwrites, channels)
+
+    def calls(self, prune=False):
+        """Number of API calls applying the plan takes
+
+        Args:
+            prune (bool): Whether removals are counted
+        """
+
+        return sum(action.calls for action in self.actions) + (sum(removal.calls for removal in self.removals) if prune else 0)
+
+    def report(self, prune=False):
+        """Describe the plan
+
+        Args:
+            prune (bool): Whether removals will be applied
+
+        Returns:
+            report (str): A line per course that changes, and the total number of API calls
+        """
+
+        lines = ['__**COURSE BUILD PLAN**__']
+        lines += [action.describe() for action in self.actions]
+        lines += [removal.describe() + ('' if prune else ' - kept, run with prune to remove') for removal in self.removals]
+        if len(lines) == 1:
+            lines.append('Nothing to change')
+        lines.append(f'{self.unchanged} courses already built, {self.calls(prune)} API calls to apply')
+        return '\n'.join(lines)
+
+    def changes(self, prune=False):
+        """List the steps of every course that changes, to be journaled and run by `apply_run`
+
+        Args:
+            prune (bool): Whether to remove courses that are no longer in the classlist
+
+        Returns:
+            changes (List[Tuple[str, List[Tuple[str, dict]]]]): Name of each course and its steps
+        """
+
+        return [(change.course.category_name, change.steps())
+                for change in self.actions + (self.removals if prune else [])]
+
+
+def plan_teardown(guild, courses):
+    """Plan the removal of every course of a classlist that is still in a guild
+
+    Args:
+        guild (discord.Guild): The guild
+        courses (List[Course]): Courses of the classlist
+
+    Returns:
+        changes (List[Tuple[str, List[Tuple[str, dict]]]]): Name of each course and its steps
+    """
+
+    changes = []
+    roles = set()
+    for course in courses:
+        # Courses sharing a role delete it once
+        role = guild_index.role(guild, course.role_name)
+        if role is not None and role.id in roles:
+            role = None
+        elif role is not None:
+            roles.add(role.id)
+
+        removal = CourseRemoval(course, guild_index.category(guild, course.category_name), role)
+        if removal.calls:
+            changes.append((course.category_name, removal.steps()))
+    return changes
+
+
+def _resolve(guild, ref, kind, objects, results):
+    """Get the role or channel a step argument refers to
+
+    Args:
+        guild (discord.Guild): The guild
+        ref (dict): `{'id': id}` for an existing object, or `{'step': index}` for what a step of the same course created
+        kind (str): 'role' or 'channel'
+        objects (dict): Objects created by the steps run so far, by step index
+        results (dict): IDs of the objects created by the steps that are done, by step index
+
+    Returns:
+        object (Union[discord.Role, discord.abc.GuildChannel]): The object, or None if it doesn't exist
+    """
+
+    if 'step' in ref:
+        # Objects created moments ago may not be in the guild's cache yet
+        created = objects.get(ref['step'])
+        if created is not None:
+            return created
+        object_id = results.get(ref['step'])
+    else:
+        object_id = ref['id']
+
+    if object_id is None:
+        return None
+    return guild.get_role(object_id) if kind == 'role' else guild.get_channel(object_id)
+
+
+async def run_step(executor, guild, action, args, objects, results, resume=False):
+    """Make the API call of one journaled step
+    Deleting something that is already gone does nothing. When resuming, a create whose target already
+    exists adopts it instead, since its call may have been made before the step could be marked done.
+
+    Args:
+        executor (GuildExecutor): Executor the API call is made through
+        guild (discord.Guild): The guild
+        action (str): What the step does
+        args (dict): Arguments of the step
+        objects (dict): Objects created by the steps of the course run so far, by step index
+        results (dict): IDs of the objects created by the steps of the course that are done, by step index
+        resume (bool): Whether the step is being replayed
+
+    Returns:
+        object: What the step created, or None
+    """
+
+    def resolve(key, kind):
+        resolved = _resolve(guild, args[key], kind, objects, results)
+        if resolved is None:
+            raise LookupError(f'the {key} of {action} no longer exists')
+        return resolved
+
+    if action == 'delete_channel':
+        channel = _resolve(guild, args['channel'], 'channel', objects, results)
+        if channel is not None:
+            await executor.call('delete_channel', channel.delete)
+        return None
+    if action == 'delete_role':
+        role = _resolve(guild, args['role'], 'role', objects, results)
+        if role is not None:
+            await executor.call('delete_role', role.delete)
+        return None
+
+    if action == 'create_role':
+        existing = guild_index.role(guild, args['name']) if resume else None
+        return existing or await executor.call('create_role', guild.create_role, name=args['name'],
+                                               permissions=COURSE_PERMISSIONS, mentionable=True)
+
+    if action in ('create_category', 'edit_category'):
+        # The category is private to the course role, set in the same request that creates it
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            resolve('role', 'role'): discord.PermissionOverwrite(read_messages=True),
+        }
+        if action == 'edit_category':
+            await executor.call('edit_channel', resolve('category', 'channel').edit, overwrites=overwrites)
+            return None
+        existing = guild_index.category(guild, args['name']) if resume else None
+        return existing or await executor.call('create_channel', guild.create_category, args['name'],
+                                               overwrites=overwrites)
+
+    category = resolve('category', 'channel')
+    if action == 'create_text_channel':
+        existing = discord.utils.get(category.text_channels, name=args['name']) if resume else None
+        return existing or await executor.call('create_channel', category.create_text_channel, args['name'],
+                                               topic=args['topic'])
+    if action == 'create_voice_channel':
+        existing = discord.utils.get(category.voice_channels, name=args['name']) if resume else None
+        return existing or await executor.call('create_channel', category.create_voice_channel, args['name'],
+                                               user_limit=args['user_limit'])
+    raise ValueError(f'unknown step {action}')
+
+
+async def _apply_course(journal, executor, guild, steps, resume):
+    """Run the unfinished steps of one course in order, journaling each one before and after its call
+    The course stops at its first failed step, since the steps after it may depend on it.
+    """
+
+    objects = {}
+    results = {step_seq: result_id for _, _, step_seq, _, _, _, status, result_id in steps if status == 'done'}
+    for step_id, _, step_seq, _, action, args, status, _ in steps:
+        if status == 'done':
+            continue
+
+        await journal.mark(step_id, 'started')
+        try:
+            created = await run_step(executor, guild, action, args, objects, results, resume or status != 'pending')
+        except Exception as e:
+            await journal.mark(step_id, 'failed', error=str(e))
+            raise
+
+        result_id = created.id if created is not None else None
+        objects[step_seq] = created
+        results[step_seq] = result_id
+        await journal.mark(step_id, 'done', result_id)
+
+
+async def apply_run(journal, run_id, executor, channel, guild, title, resume=False):
+    """Run the unfinished steps of a journaled run, reporting progress in a channel
+
+    Args:
+        journal (RolloverJournal): The journal the run is in
+        run_id (int): ID of the run
+        executor (GuildExecutor): Executor the API calls are made through
+        channel (discord.abc.Messageable): Where to report progress
+        guild (discord.Guild): The guild the run changes
+        title (str): What the run does, shown in the progress message
+        resume (bool): Whether the run was interrupted before
+
+    Returns:
+        failures (List[Tuple[str, Exception]]): Name and error of every course that failed
+    """
+
+    courses = {}
+    for step in await journal.steps(run_id):
+        courses.setdefault(step[1], []).append(step)
+
+    jobs = [(steps[0][3], functools.partial(_apply_course, journal, executor, guild, steps, resume))
+            for steps in courses.values() if any(step[6] != 'done' for step in steps)]
+    failures = await executor.run(channel, title, jobs)
+    await journal.finish(run_id)
+    return failures
@@ -0,0 +1,209 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.log_utils import emit
+
+
+class _SavepointConnection:
+    """Stand-in for the writer connection while a job runs inside a group commit
+    The functions in db_utils commit after every statement and roll back on errors. Inside a batch, commits
+    are deferred to the single commit at the end of the batch, and a rollback only undoes the current job
+    by rolling back to its savepoint.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        """Return a cursor on the real connection"""
+
+        return self._conn.cursor()
+
+    def execute(self, *args):
+        """Execute a statement on the real connection"""
+
+        return self._conn.execute(*args)
+
+    def executemany(self, *args):
+        """Execute a statement for every set of parameters on the real connection"""
+
+        return self._conn.executemany(*args)
+
+    def commit(self):
+        """Deferred to the end of the batch"""
+
+    def rollback(self):
+        """Undo everything the current job has written"""
+
+        self._conn.execute("ROLLBACK TO job")
+
+    def close(self):
+        """The writer connection outlives every job"""
+
+
+class DatabaseGateway:
+    """Asyncio-facing access to the database that never blocks the event loop
+    Every write is funneled through one dedicated writer thread. Jobs that queue up while a batch is being
+    written are run together in one transaction, each inside its own savepoint so a failing job doesn't
+    undo the others, and committed with a single fsync (group commit). Reads run on a small pool of reader
+    threads using the connection manager's read-only connections. Coroutines await the result either way.
+
+    Args:
+        manager (ConnectionManager): The connections to use
+        max_batch (int): Maximum number of write jobs per transaction
+        batch_window (float): Seconds to wait for more write jobs to join a batch
+    """
+
+    def __init__(self, manager, max_batch=64, batch_window=0.002):
+        self.manager = manager
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+
+        # The writer thread manages transactions itself
+        self.manager.writer.isolation_level = None
+
+        self._closed = False
+        self._writes = queue.SimpleQueue()
+        self._writer_thread = threading.Thread(target=self._write_loop, name='db-writer', daemon=True)
+        self._writer_thread.start()
+        self._readers = ThreadPoolExecutor(max_workers=manager.reader_count, thread_name_prefix='db-reader')
+
+    async def write(self, func, *args):
+        """Run a db_utils function on the writer thread and wait until its transaction is committed
+
+        Args:
+            func (Callable): A db_utils function taking a connection as its first argument
+            *args: The remaining arguments of `func`
+
+        Returns:
+            The return value of `func`
+
+        Raises:
+            sqlite3.ProgrammingError: If the gateway has been closed
+        """
+
+        if self._closed:
+            raise sqlite3.ProgrammingError('Cannot write through a closed database gateway')
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._writes.put((func, args, loop, future))
+        return await future
+
+    async def read(self, func, *args):
+        """Run a read-only db_utils function on a reader thread
+
+        Args:
+            func (Callable): A db_utils function taking a connection as its first argument
+            *args: The remaining arguments of `func`
+
+        Returns:
+            The return value of `func`
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(self._readers, self._read, func, args)
+
+    def _read(self, func, args):
+        """Run a read-only function with a pooled connection"""
+
+        with self.manager.reader() as conn:
+            return func(conn, *args)
+
+    def _write_loop(self):
+        """Collect write jobs into batches and run them until the stop sentinel is received, then fail every
+        job that was queued after it so no caller waits forever
+        """
+
+        while True:
+            job = self._writes.get()
+            if job is None:
+                break
+
+            batch = [job]
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._writes.get(timeout=self.batch_window)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            self._run_batch(batch)
+            if stopping:
+                break
+
+        error = sqlite3.ProgrammingError('The database gateway was closed before this write ran')
+        while True:
+            try:
+                job = self._writes.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None:
+                func, args, loop, future = job
+                loop.call_soon_threadsafe(self._settle, future, None, error)
+
+    def _run_batch(self, batch):
+        """Run a batch of write jobs in one transaction and hand each result back to its event loop
+
+        Args:
+            batch (List[tuple]): (func, args, loop, future) jobs
+        """
+
+        conn = self.manager.writer
+        proxy = _SavepointConnection(conn)
+        outcomes = []
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            emit(f'Could not start a transaction for {len(batch)} database writes because {e}', level='ERROR', cog='db_gateway')
+            for func, args, loop, future in batch:
+                loop.call_soon_threadsafe(self._settle, future, None, e)
+            return
+
+        for func, args, loop, future in batch:
+            conn.execute("SAVEPOINT job")
+            try:
+                outcomes.append((loop, future, func(proxy, *args), None))
+            except Exception as e:
+                conn.execute("ROLLBACK TO job")
+                outcomes.append((loop, future, None, e))
+            conn.execute("RELEASE job")
+
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            emit(f'Could not commit {len(batch)} database writes because {e}', level='ERROR', cog='db_gateway')
+            conn.execute("ROLLBACK")
+            outcomes = [(loop, future, None, e) for loop, future, _, _ in outcomes]
+
+        for loop, future, result, error in outcomes:
+            loop.call_soon_threadsafe(self._settle, future, result, error)
+
+    @staticmethod
+    def _settle(future, result, error):
+        """Complete a job's future on its own event loop unless the caller gave up on it"""
+
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def close(self):
+        """Finish every queued write, then stop the threads and close the connections. Writes made after
+        this is called raise `sqlite3.ProgrammingError`
+        """
+
+        self._closed = True
+        self._writes.put(None)
+        await asyncio.to_thread(self._writer_thread.join)
+        self._readers.shutdown(wait=True)
+        self.manager.close()
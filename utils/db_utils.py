@@ -1,11 +1,216 @@
 import os
+import queue
 import sqlite3
+from contextlib import contextmanager
+
+from utils.log_utils import emit
+
+
+# Adds every closed timesheet that hasn't been rolled up yet to the daily_hours row for its user and the
+# local day it was checked into
+ROLLUP_QUERY = """WITH pending AS (
+                      SELECT time_id, discord_id, time_in, total_time FROM timesheet
+                      WHERE rolled_up = 0 AND time_out IS NOT NULL
+                  )
+                  INSERT INTO daily_hours(discord_id, day, sessions, total_time, pomodoros, completed_pomodoros,
+                                          help_requests)
+                  SELECT pending.discord_id,
+                         CAST(strftime('%s', pending.time_in, 'unixepoch', 'localtime', 'start of day', 'utc') AS REAL) AS day,
+                         COUNT(*), COALESCE(SUM(pending.total_time), 0), COALESCE(SUM(pomodoros.pomodoros), 0),
+                         COALESCE(SUM(pomodoros.completed), 0), COALESCE(SUM(pomodoros.help_requests), 0)
+                  FROM pending
+                  LEFT JOIN (SELECT pomodoro.timesheet_id, COUNT(*) AS pomodoros,
+                                    SUM(pomodoro.status = 3) AS completed,
+                                    SUM(COALESCE(pomodoro.help_count, 0)) AS help_requests
+                             FROM pomodoro
+                             WHERE pomodoro.timesheet_id IN (SELECT time_id FROM pending)
+                             GROUP BY pomodoro.timesheet_id) AS pomodoros
+                         ON pomodoros.timesheet_id = pending.time_id
+                  GROUP BY pending.discord_id, day
+                  ON CONFLICT (discord_id, day) DO UPDATE SET
+                      sessions = sessions + excluded.sessions,
+                      total_time = total_time + excluded.total_time,
+                      pomodoros = pomodoros + excluded.pomodoros,
+                      completed_pomodoros = completed_pomodoros + excluded.completed_pomodoros,
+                      help_requests = help_requests + excluded.help_requests"""
+
+
+# Schema migrations, applied in order. The database's `PRAGMA user_version` records how many have been
+# applied, so each one runs exactly once. Never edit a migration that has shipped, append a new one instead.
+MIGRATIONS = [
+    # 1: Initial schema
+    [
+        """CREATE TABLE IF NOT EXISTS user (
+        discord_id TEXT PRIMARY KEY,
+        discord_name TEXT,
+        date_registered TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS timesheet(
+        time_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        discord_id TEXT NOT NULL,
+        time_in TEXT NOT NULL,
+        time_out TEXT,
+        total_time REAL,
+        FOREIGN KEY (discord_id) REFERENCES user(discord_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS pomodoro(
+        pomo_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timesheet_id INTEGER NOT NULL,
+        issue TEXT NOT NULL,
+        time_start TEXT NOT NULL,
+        time_finish TEXT,
+        time_delta REAL,
+        status INTEGER,
+        help_count REAL,
+        FOREIGN KEY (timesheet_id) REFERENCES timesheet(time_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS u_help(
+        u_help_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        remark TEXT,
+        pomo_id INTEGER,
+        FOREIGN KEY(pomo_id) REFERENCES pomodoro(pomo_id)
+        )""",
+    ],
+    # 2: Indexes for per-user history and for finding open timesheets and pomodoros. The partial indexes
+    # only hold rows that are still open, so they stay small no matter how much history accumulates.
+    [
+        """CREATE INDEX IF NOT EXISTS timesheet_user_time_in ON timesheet(discord_id, time_in)""",
+        """CREATE INDEX IF NOT EXISTS timesheet_open ON timesheet(discord_id)
+        WHERE time_out IS NULL AND total_time IS NULL""",
+        """CREATE INDEX IF NOT EXISTS pomodoro_timesheet ON pomodoro(timesheet_id)""",
+        """CREATE INDEX IF NOT EXISTS pomodoro_open ON pomodoro(timesheet_id)
+        WHERE time_finish IS NULL AND time_delta IS NULL""",
+    ],
+    # 3: Store Discord IDs as INTEGER and times as REAL epoch seconds instead of TEXT, so range queries
+    # compare numbers and can use the indexes. SQLite can't change a column's type, so each table is
+    # rebuilt and its rows copied over, then the indexes from migration 2 are recreated.
+    [
+        """CREATE TABLE user_typed (
+        discord_id INTEGER PRIMARY KEY,
+        discord_name TEXT,
+        date_registered REAL NOT NULL
+        )""",
+        """INSERT INTO user_typed SELECT CAST(discord_id AS INTEGER), discord_name, CAST(date_registered AS REAL)
+        FROM user""",
+        """DROP TABLE user""",
+        """ALTER TABLE user_typed RENAME TO user""",
+
+        """CREATE TABLE timesheet_typed(
+        time_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        discord_id INTEGER NOT NULL,
+        time_in REAL NOT NULL,
+        time_out REAL,
+        total_time REAL,
+        FOREIGN KEY (discord_id) REFERENCES user(discord_id)
+        )""",
+        """INSERT INTO timesheet_typed SELECT time_id, CAST(discord_id AS INTEGER), CAST(time_in AS REAL),
+        CAST(time_out AS REAL), total_time FROM timesheet""",
+        """DROP TABLE timesheet""",
+        """ALTER TABLE timesheet_typed RENAME TO timesheet""",
+
+        """CREATE TABLE pomodoro_typed(
+        pomo_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timesheet_id INTEGER NOT NULL,
+        issue TEXT NOT NULL,
+        time_start REAL NOT NULL,
+        time_finish REAL,
+        time_delta REAL,
+        status INTEGER,
+        help_count INTEGER,
+        FOREIGN KEY (timesheet_id) REFERENCES timesheet(time_id)
+        )""",
+        """INSERT INTO pomodoro_typed SELECT pomo_id, timesheet_id, issue, CAST(time_start AS REAL),
+        CAST(time_finish AS REAL), time_delta, CAST(status AS INTEGER), CAST(help_count AS INTEGER) FROM pomodoro""",
+        """DROP TABLE pomodoro""",
+        """ALTER TABLE pomodoro_typed RENAME TO pomodoro""",
+
+        """CREATE INDEX timesheet_user_time_in ON timesheet(discord_id, time_in)""",
+        """CREATE INDEX timesheet_open ON timesheet(discord_id)
+        WHERE time_out IS NULL AND total_time IS NULL""",
+        """CREATE INDEX pomodoro_timesheet ON pomodoro(timesheet_id)""",
+        """CREATE INDEX pomodoro_open ON pomodoro(timesheet_id)
+        WHERE time_finish IS NULL AND time_delta IS NULL""",
+    ],
+    # 4: Hours and pomodoro counts per user per local day, kept up to date as timesheets close, and the
+    # pay period calendar reports group the days by. Timesheets that closed before this migration are
+    # rolled up by it.
+    [
+        """CREATE TABLE daily_hours(
+        discord_id INTEGER NOT NULL,
+        day REAL NOT NULL,
+        sessions INTEGER NOT NULL,
+        total_time REAL NOT NULL,
+        pomodoros INTEGER NOT NULL,
+        completed_pomodoros INTEGER NOT NULL,
+        help_requests INTEGER NOT NULL,
+        PRIMARY KEY (discord_id, day)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE pay_period(
+        period_start REAL PRIMARY KEY,
+        period_end REAL NOT NULL
+        )""",
+        """ALTER TABLE timesheet ADD COLUMN rolled_up INTEGER NOT NULL DEFAULT 0""",
+        """CREATE INDEX timesheet_pending_rollup ON timesheet(time_id)
+        WHERE rolled_up = 0 AND time_out IS NOT NULL""",
+        ROLLUP_QUERY,
+        """UPDATE timesheet SET rolled_up = 1 WHERE rolled_up = 0 AND time_out IS NOT NULL""",
+    ],
+    # 5: Outbox of direct messages waiting to be delivered, and the DM channel of every user messaged so far
+    [
+        """CREATE TABLE dm_outbox(
+        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        discord_id INTEGER NOT NULL,
+        content TEXT,
+        view TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt REAL NOT NULL,
+        created REAL NOT NULL,
+        delivered REAL,
+        error TEXT
+        )""",
+        """CREATE INDEX dm_outbox_pending ON dm_outbox(discord_id, message_id) WHERE status = 'pending'""",
+        """CREATE INDEX dm_outbox_finished ON dm_outbox(created) WHERE status != 'pending'""",
+        """CREATE TABLE dm_channel(
+        discord_id INTEGER PRIMARY KEY,
+        channel_id INTEGER NOT NULL
+        )""",
+    ],
+    # 6: Discord ID of each delivered direct message, so it can be deleted without searching the DM history
+    [
+        """ALTER TABLE dm_outbox ADD COLUMN sent_message_id INTEGER""",
+    ],
+    # 7: At most one open timesheet per user and one open pomodoro per timesheet, enforced by making the open
+    # indexes from migration 3 unique. Duplicates left by concurrent clicks are closed first with no time
+    # counted, keeping the oldest, which is the one the check-in state was loaded with.
+    [
+        """UPDATE pomodoro SET time_finish = time_start, time_delta = 0, status = 2
+        WHERE time_finish IS NULL AND time_delta IS NULL AND (
+            pomo_id NOT IN (SELECT MIN(pomo_id) FROM pomodoro WHERE time_finish IS NULL AND time_delta IS NULL
+                            GROUP BY timesheet_id)
+            OR timesheet_id IN (SELECT time_id FROM timesheet WHERE time_out IS NULL AND total_time IS NULL
+                                AND time_id NOT IN (SELECT MIN(time_id) FROM timesheet
+                                                    WHERE time_out IS NULL AND total_time IS NULL
+                                                    GROUP BY discord_id)))""",
+        """UPDATE timesheet SET time_out = time_in, total_time = 0
+        WHERE time_out IS NULL AND total_time IS NULL
+        AND time_id NOT IN (SELECT MIN(time_id) FROM timesheet WHERE time_out IS NULL AND total_time IS NULL
+                            GROUP BY discord_id)""",
+        """DROP INDEX timesheet_open""",
+        """CREATE UNIQUE INDEX timesheet_open ON timesheet(discord_id)
+        WHERE time_out IS NULL AND total_time IS NULL""",
+        """DROP INDEX pomodoro_open""",
+        """CREATE UNIQUE INDEX pomodoro_open ON pomodoro(timesheet_id)
+        WHERE time_finish IS NULL AND time_delta IS NULL""",
+    ],
+]
 
 
 def initialize_db(db_location) -> None:
     """
-    Create a new database file in SQLITE3 with Tables.
-    The tables created are empty when first initialized
+    Create the database file in SQLITE3 if needed and bring its schema up to date.
+    Every migration in `MIGRATIONS` newer than the database's schema version is applied in its own
+    transaction, so a failed migration leaves the database at the last version that applied cleanly.
 
     Args:
         db_location(string): Path to where the database file is stored.
@@ -14,54 +219,24 @@ def initialize_db(db_location) -> None:
     Output:
         An error if raised
     """
-    conn = sqlite3.connect(db_location)
-
-    cursor = conn.cursor()
-
-    print("=========Creating database===============")
-    create_user_table_query = """ CREATE TABLE IF NOT EXISTS user (
-    discord_id TEXT PRIMARY KEY,
-    discord_name TEXT,
-    date_registered TEXT NOT NULL
-    )"""
-
-    create_timesheet_table_query = """ CREATE TABLE IF NOT EXISTS timesheet(
-    time_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    discord_id TEXT NOT NULL,
-    time_in TEXT NOT NULL,
-    time_out TEXT,
-    total_time REAL,
-    FOREIGN KEY (discord_id) REFERENCES user(discord_id)
-    )"""
-
-    create_pomodoro_table_query = """ CREATE TABLE IF NOT EXISTS pomodoro(
-    pomo_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timesheet_id INTEGER NOT NULL,
-    issue TEXT NOT NULL,
-    time_start TEXT NOT NULL,
-    time_finish TEXT,
-    time_delta REAL,
-    status INTEGER,
-    help_count REAL,
-    FOREIGN KEY (timesheet_id) REFERENCES timesheet(time_id)
-    )"""
-
-    create_u_help_table_query = """ CREATE TABLE IF NOT EXISTS u_help(
-    u_help_id INTEGER PRIMARY KEY AUTOINCREMENT,
-    remark TEXT,
-    pomo_id INTEGER,
-    FOREIGN KEY(pomo_id) REFERENCES pomodoro(pomo_id)
-    )"""
-
-    try:
-        cursor.execute(create_user_table_query)
-        cursor.execute(create_timesheet_table_query)
-        cursor.execute(create_pomodoro_table_query)
-        cursor.execute(create_u_help_table_query)
-        conn.commit()
-        print("All tables created")
-    except Exception as e:
-        print(f'Could not create table because {e} occured')
+    conn = sqlite3.connect(db_location, isolation_level=None)
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < len(MIGRATIONS):
+        emit(f"Migrating database from schema version {version} to {len(MIGRATIONS)}", level='INFO', cog='db_utils')
+
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+            emit(f"Applied database migration {number}", level='INFO', cog='db_utils')
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            emit(f'Could not apply database migration {number} because {e} occured', level='ERROR', cog='db_utils')
+            break
     conn.close()
 
 
@@ -77,27 +252,99 @@ def create_connection(db_file: str):
     if os.path.exists(db_file):
         try:
             conn = sqlite3.connect(db_file)
-            print(f'Connected to the Database {db_file}')
+            emit(f'Connected to the Database {db_file}', level='DEBUG', cog='db_utils')
             return conn
         except sqlite3.Error as e:
-            print(f'Could not connect to database because {e}')
+            emit(f'Could not connect to database because {e}', level='ERROR', cog='db_utils')
         return conn
     else:
-        print("Error! database file does not exist")
+        emit("Error! database file does not exist", level='ERROR', cog='db_utils')
         return conn
 
 
-def insert_user(conn, discord_id: str, discord_name: str,
-                date_registered: str) -> str:
+class ConnectionManager:
+    """
+    Long-lived connections to the database, opened once and owned by a cog.
+    The database is switched to WAL mode so readers never block the writer, and every connection is
+    tuned with the pragmas below. One connection is used for all writes, and a small pool of read-only
+    connections is handed out for queries that don't write.
+
+    Args:
+        db_file (str): The name and path to the database file
+        readers (int): Number of read-only connections in the pool
+    """
+
+    PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",      # Safe with WAL, only the last commits can be lost on power loss
+        "PRAGMA cache_size = -8000",        # 8 MB page cache per connection
+        "PRAGMA mmap_size = 67108864",      # Memory map up to 64 MB of the database file
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    def __init__(self, db_file: str, readers: int = 2):
+        self.db_file = db_file
+        self.writer = self._connect()
+        self.writer.execute("PRAGMA journal_mode = WAL")
+
+        self.reader_count = readers
+        self._readers = queue.LifoQueue()
+        self._all_readers = []
+        for _ in range(readers):
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = ON")
+            self._readers.put(conn)
+            self._all_readers.append(conn)
+
+        emit(f'Opened connections to the Database {db_file}', level='DEBUG', cog='db_utils')
+
+    def _connect(self):
+        """
+        Open a tuned connection to the database
+
+        Output:
+            returns an object `conn` that represents the connection the database
+        """
+        conn = sqlite3.connect(self.db_file, timeout=5.0, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """
+        Borrow a read-only connection from the pool for the duration of a `with` block
+
+        Output:
+            yields a read-only connection that is returned to the pool afterwards
+        """
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self):
+        """
+        Close the writer and every read-only connection
+        """
+        for conn in self._all_readers:
+            conn.close()
+        self._all_readers.clear()
+        self.writer.close()
+        emit(f'Closed connections to the Database {self.db_file}', level='DEBUG', cog='db_utils')
+
+
+def insert_user(conn, discord_id: int, discord_name: str,
+                date_registered: float) -> str:
     """
     Takes the arguments to create a new record in the User Table
     discord_id and date_registered are NOT NULL in the database and must be provided
 
     Args:
         conn: Connection object returned by the `create_connection` function
-        discord_id (str): The discord user id of the user
+        discord_id (int): The discord user id of the user
         discord_name (str): The name of the user
-        date_registered(str): The date and time when the user hits the register button
+        date_registered(float): The epoch time when the user hits the register button
     """
 
     if conn is not None:
@@ -107,37 +354,37 @@ def insert_user(conn, discord_id: str, discord_name: str,
             date_registered) VALUES(?,?,?)"""
             c.execute(insert_user_query, (discord_id, discord_name,
                                           date_registered))
-            print(f"User {discord_id} has been inserted into the datasbase.")
+            emit(f"User {discord_id} has been inserted into the datasbase.", level='DEBUG', cog='db_utils')
         except sqlite3.IntegrityError as e:
             if "UNIQUE constraint failed" in str(e):
-                print(f"{discord_id} already exists in the database.")
+                emit(f"{discord_id} already exists in the database.", level='DEBUG', cog='db_utils')
                 return "User already exists"
             else:
-                print(e)
+                emit(str(e), level='ERROR', cog='db_utils')
                 return "Error"
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return "Error"
         conn.commit()
         return None  # No error
     else:
         # this check should be redundunt
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
         return "Could not connect to database"
 
 
-def insert_timesheet(conn, discord_id: str, time_in: str, time_out: str = None, total_time: str = None) -> int:
+def insert_timesheet(conn, discord_id: int, time_in: float, time_out: float = None, total_time: float = None) -> int:
     """
     Takes the arguments to create a new record in the timesheet Table
     discord_id and time_in are NOT NULL in the database and must be provided
 
     Args:
         conn: Connection object returned by the `create_connection` function
-        discord_id (str): The discord user id of the user
-        time_in (str): The datetime object converted into String of when the user checks-in
-        time_out (str): The datetime object converted into String of when the user checks-out
-        time_out (float): The time delta of time in and time out when the user checks out
+        discord_id (int): The discord user id of the user
+        time_in (float): The epoch time of when the user checks-in
+        time_out (float): The epoch time of when the user checks-out
+        total_time (float): The time delta of time in and time out when the user checks out
 
     Output:
         Returns timesheet_id of the last/current inserted record
@@ -149,20 +396,24 @@ def insert_timesheet(conn, discord_id: str, time_in: str, time_out: str = None,
             time_out, total_time) VALUES(?,?,?,?)"""
             c.execute(insert_timesheet_query, (discord_id, time_in,
                                                time_out, total_time))
-            print(f"User {discord_id} has been checked in at {time_in}")
+            emit(f"User {discord_id} has been checked in at {time_in}", level='DEBUG', cog='db_utils')
+        except sqlite3.IntegrityError:
+            emit(f"User {discord_id} already has an open timesheet", level='WARNING', cog='db_utils')
+            conn.rollback()
+            return None
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
         conn.commit()
         return c.lastrowid  # returns the id of the new record
     else:
         # this check should be redundunt
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
-def insert_pomodoro(conn, timesheet_id: int, issue: str, time_start: str, time_finish: str = None,
-                    time_delta: float = None, status: int = None, help_count: float = None) -> int:
+def insert_pomodoro(conn, timesheet_id: int, issue: str, time_start: float, time_finish: float = None,
+                    time_delta: float = None, status: int = None, help_count: int = None) -> int:
     """
     Takes the arguments to create a new record in the pomodoro Table
     timesheet_id, issue, and time_start are NOT NULL in the database and must be provided
@@ -171,11 +422,11 @@ def insert_pomodoro(conn, timesheet_id: int, issue: str, time_start: str, time_f
         conn: Connection object returned by the `create_connection` function
         timesheet_id (int): The current timesheet_id of the user who's invoking the pomodoro function for a given day
         issue (str): Description of the issue the user is having as entered by the user.
-        time_start (str): The datetime object converted into String of when the user starts pomodoro
-        time_finish (str): The datetime object converted into String of when the user stops pomo
+        time_start (float): The epoch time of when the user starts pomodoro
+        time_finish (float): The epoch time of when the user stops pomo
         time_delta (float): The time delta of time start and time finish from when user starts the pomodoro and stops it
         status (int): 1 or 0 as flag for completion of the pomodoro
-        help_count (float): number of times the user has requested help/hit the help button
+        help_count (int): number of times the user has requested help/hit the help button
 
     Output:
         Returns pomo_id of the last/current inserted record
@@ -187,17 +438,20 @@ def insert_pomodoro(conn, timesheet_id: int, issue: str, time_start: str, time_f
             time_start, time_finish, time_delta, status, help_count) VALUES(?,?,?,?,?,?,?)"""
             c.execute(insert_pomodoro_query, (timesheet_id, issue, time_start, time_finish,
                                               time_delta, status, help_count))
-            print(
-                f"New pomodoro for Timesheet id {timesheet_id} recorded on {time_start}")
+            emit(f"New pomodoro for Timesheet id {timesheet_id} recorded on {time_start}", level='DEBUG', cog='db_utils')
+        except sqlite3.IntegrityError:
+            emit(f"Timesheet {timesheet_id} already has an open pomodoro", level='WARNING', cog='db_utils')
+            conn.rollback()
+            return None
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
         conn.commit()
         return c.lastrowid  # returns the id of the new record
     else:
         # this check should be redundunt
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
 def insert_user_help(conn, remark: str, pomo_id: int) -> int:
@@ -216,20 +470,19 @@ def insert_user_help(conn, remark: str, pomo_id: int) -> int:
             c = conn.cursor()
             insert_user_help_query = """ INSERT INTO u_help(remark, pomo_id) VALUES(?,?)"""
             c.execute(insert_user_help_query, (remark, pomo_id))
-            print(
-                f"New help record for Pomo id {pomo_id} recorded.")
+            emit(f"New help record for Pomo id {pomo_id} recorded.", level='DEBUG', cog='db_utils')
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
         conn.commit()
         return c.lastrowid  # returns the id of the new record
     else:
         # this check should be redundunt
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
-def update_timesheet(conn, time_id: int, discord_id: str, time_in: str, time_out: str, total_time: float) -> bool:
+def update_timesheet(conn, time_id: int, discord_id: int, time_in: float, time_out: float, total_time: float) -> bool:
     """
         Takes the arguments to update an existing record in the timesheet Table
         discord_id and time_in are NOT NULL in the database and must be provided
@@ -237,43 +490,46 @@ def update_timesheet(conn, time_id: int, discord_id: str, time_in: str, time_out
         Args:
             conn: Connection object returned by the `create_connection` function
             time_id (int): The timesheed id of the user that needs to be updated
-            discord_id (str): The discord id of the user
-            time_in (str): The datetime object coverted into String of when the user checks-in.
+            discord_id (int): The discord id of the user
+            time_in (float): The epoch time of when the user checks-in.
                             Not used when updating the record
-            time_out (str): The datetime object converted into String of when the user checks-out
+            time_out (float): The epoch time of when the user checks-out
             total_time (float): The time delta of time in and time out
                                 obtained after user checks out
 
         Output:
             Returns boolean value to signify if
-                the update operatation was Completed(True) or failed(False)
+                the update operatation was Completed(True) or failed(False),
+                or None if the timesheet had already been closed
      """
     if conn is not None:
         try:
             c = conn.cursor()
-            update_timesheet_query = """ UPDATE timesheet SET time_out = ?, total_time = ? where discord_id = ? and time_id = ?"""
+            update_timesheet_query = """ UPDATE timesheet SET time_out = ?, total_time = ? where discord_id = ? and time_id = ? and time_out IS NULL"""
             c.execute(update_timesheet_query,
                       (time_out, total_time, discord_id, time_id))
-            print(
-                f"User {discord_id} has been updated with checkout entry @ {time_out}")
+            if c.rowcount == 0:
+                emit(f"Timesheet {time_id} of user {discord_id} was already closed", level='WARNING', cog='db_utils')
+                return None
+            emit(f"User {discord_id} has been updated with checkout entry @ {time_out}", level='DEBUG', cog='db_utils')
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return False
         conn.commit()
         return True
     else:
-        print("Error! Cannot create database connection.")
+        emit("Error! Cannot create database connection.", level='ERROR', cog='db_utils')
         return False
 
 
-def get_timesheet_id(conn, discord_id: str):
+def get_timesheet_id(conn, discord_id: int):
     """
     Given a Discord ID, find the timesheet ID that has been opened by that user
 
     Args:
         conn: Connection object returned by the `create_connection` function
-        discord_id (str): A Discord user ID
+        discord_id (int): A Discord user ID
     Outputs:
         timesheet_id (int): the timesheet ID open for a particular user
     """
@@ -287,22 +543,22 @@ def get_timesheet_id(conn, discord_id: str):
             timesheet = c.fetchall()
 
             if (len(timesheet) > 1):
-                print("Error! Multiple open timesheets for user.")
+                emit("Error! Multiple open timesheets for user.", level='ERROR', cog='db_utils')
                 return None
             elif (len(timesheet) != 1):
-                print("Error! No timesheet open for user.")
+                emit("Error! No timesheet open for user.", level='DEBUG', cog='db_utils')
             else:
                 return timesheet[0][0]
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
-def update_pomodoro(conn, pomo_id: int,  timesheet_id: int, issue: str, time_start: str, time_finish: str = None,
-                    time_delta: float = None, status: int = None, help_count: float = None):
+def update_pomodoro(conn, pomo_id: int,  timesheet_id: int, issue: str, time_start: float, time_finish: float = None,
+                    time_delta: float = None, status: int = None, help_count: int = None):
     """
         Takes the arguments to update an existing record in the pomoodoro Table
         timesheet_id, issue, and time_start are NOT NULL in the database and must be provided
@@ -312,11 +568,11 @@ def update_pomodoro(conn, pomo_id: int,  timesheet_id: int, issue: str, time_sta
         pomo_id (int): The `int` pomodoro_id of the pomodoro user is working through
         timesheet_id (int): The current timesheet_id of the user who's invoking the pomodoro function for a given day
         issue (str): Description of the issue the user is having as entered by the user.
-        time_start (str): The datetime object converted into String of when the user starts pomodoro
-        time_finish (str): The datetime object converted into String of when the user stops pomo
+        time_start (float): The epoch time of when the user starts pomodoro
+        time_finish (float): The epoch time of when the user stops pomo
         time_delta (float): The time delta of time start and time finish from when user starts the pomodoro and stops it
         status (int): 0 for not checked, 1 for checked, 2 for completed as "not done", 3 for completed as "done"
-        help_count (float): number of times the user has requested help/hit the help buttonime out
+        help_count (int): number of times the user has requested help/hit the help buttonime out
                                 obtained after user checks out
 
         Output:
@@ -329,27 +585,26 @@ def update_pomodoro(conn, pomo_id: int,  timesheet_id: int, issue: str, time_sta
             update_pomodoro_query = """ UPDATE pomodoro SET time_finish = ?, time_delta = ?, status = ?, help_count = ? where pomo_id = ? and timesheet_id = ?"""
             c.execute(update_pomodoro_query,
                       (time_finish, time_delta, status, help_count, pomo_id, timesheet_id))
-            print(
-                f"Pomodoro {pomo_id} has been updated for timesheet {timesheet_id}")
+            emit(f"Pomodoro {pomo_id} has been updated for timesheet {timesheet_id}", level='DEBUG', cog='db_utils')
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return False
         conn.commit()
         return True
     else:
-        print("Error! Cannot create database connection.")
+        emit("Error! Cannot create database connection.", level='ERROR', cog='db_utils')
         return False
 
 
-def get_timesheet(conn, timesheet_id: int, discord_id: str):
+def get_timesheet(conn, timesheet_id: int, discord_id: int):
     """
     Given a Discord ID, find the timesheet ID that has been opened by that user
 
     Args:
         conn: Connection object returned by the `create_connection` function
         timesheet_id (int): A timesheet ID
-        discord_id (str): A Discord user ID
+        discord_id (int): A Discord user ID
     Outputs:
         timesheet (list): the timesheet open for a particular user
     """
@@ -363,28 +618,28 @@ def get_timesheet(conn, timesheet_id: int, discord_id: str):
             timesheet = c.fetchall()
 
             if (len(timesheet) > 1):
-                print("Error! Multiple open timesheets for user.")
+                emit("Error! Multiple open timesheets for user.", level='ERROR', cog='db_utils')
                 return None
             elif (len(timesheet) != 1):
-                print("Error! No timesheet open for user.")
+                emit("Error! No timesheet open for user.", level='DEBUG', cog='db_utils')
             else:
                 return timesheet[0]
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
-def get_pomodoro_id(conn, discord_id: str):
+def get_pomodoro_id(conn, discord_id: int):
     """
     Given a Discord ID, find the pomodoro ID that has been opened by that user
 
     Args:
         conn: Connection object returned by the `create_connection` function
         timesheet_id (int): A timesheet ID
-        discord_id (str): A Discord user ID
+        discord_id (int): A Discord user ID
     Outputs:
         timesheet (list): the pomodoro open for a particular user
     """
@@ -398,19 +653,19 @@ def get_pomodoro_id(conn, discord_id: str):
             timesheet = c.fetchall()
 
             if (len(timesheet) > 1):
-                print("Error! Multiple open pomodoros for user.")
+                emit("Error! Multiple open pomodoros for user.", level='ERROR', cog='db_utils')
                 return None
             elif (len(timesheet) != 1):
-                print("Error! No pomodoro open for user.")
+                emit("Error! No pomodoro open for user.", level='DEBUG', cog='db_utils')
                 return None
             else:
                 return timesheet[0][0]
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
 def get_pomodoro(conn, pomodoro_id: int, timesheet_id: int):
@@ -420,7 +675,7 @@ def get_pomodoro(conn, pomodoro_id: int, timesheet_id: int):
     Args:
         conn: Connection object returned by the `create_connection` function
         timesheet_id (int): A timesheet ID
-        discord_id (str): A Discord user ID
+        discord_id (int): A Discord user ID
     Outputs:
         timesheet (list): the timesheet open for a particular user
     """
@@ -434,18 +689,18 @@ def get_pomodoro(conn, pomodoro_id: int, timesheet_id: int):
             timesheet = c.fetchall()
 
             if (len(timesheet) > 1):
-                print("Error! Multiple open pomodoros for user.")
+                emit("Error! Multiple open pomodoros for user.", level='ERROR', cog='db_utils')
                 return None
             elif (len(timesheet) != 1):
-                print("Error! No pomodoro open for user.")
+                emit("Error! No pomodoro open for user.", level='DEBUG', cog='db_utils')
             else:
                 return timesheet[0]
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
 def get_all_open_pomodoros(conn):
@@ -471,11 +726,11 @@ def get_all_open_pomodoros(conn):
             else:
                 return pomodoros
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
 def get_all_open_timesheets(conn):
@@ -501,16 +756,16 @@ def get_all_open_timesheets(conn):
             else:
                 return timesheets
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
 
-def close_all_pomodoros(conn, time_id: str, end_time: float):
+def close_all_pomodoros(conn, time_id: int, end_time: float):
     """
-    Close all open pomodoros for a provided time_id
+    Close all open pomodoros for a provided time_id in a single UPDATE
 
     Args:
         conn: Connection object returned by the `create_connection` function
@@ -521,36 +776,104 @@ def close_all_pomodoros(conn, time_id: str, end_time: float):
         try:
             c = conn.cursor()
 
-            pomodoro_query = """SELECT * FROM pomodoro WHERE timesheet_id = ? AND time_finish is NULL AND time_delta IS NULL"""
-            c.execute(pomodoro_query, (time_id,))
+            pomodoro_query = """UPDATE pomodoro SET time_finish = ?, time_delta = ? - time_start, status = 2
+                                WHERE timesheet_id = ? AND time_finish IS NULL AND time_delta IS NULL"""
+            c.execute(pomodoro_query, (end_time, end_time, time_id))
+            emit(f"Closed {c.rowcount} pomodoros for timesheet {time_id}", level='DEBUG', cog='db_utils')
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+        conn.commit()
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
 
-            pomodoros = c.fetchall()
 
-            if (len(pomodoros) > 0):
-                for pomodoro in pomodoros:
-                    start_time = float(pomodoro[3])
-                    total_time = end_time - start_time
+def close_stale_timesheets(conn, opened_before: float, end_time: float):
+    """
+    Close every timesheet opened before a cutoff, along with its open pomodoros.
+    Both tables are closed with one set-based UPDATE each, in a single transaction, with the time deltas
+    computed by SQLite.
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        opened_before (float): Epoch time; open timesheets that checked in at or before it are closed
+        end_time (float): Epoch time to close the timesheets and pomodoros at
+    Outputs:
+        closed (list): (time_id, discord_id) of every timesheet that was closed
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+
+            stale = """time_out IS NULL AND total_time IS NULL AND time_in <= ?"""
+            pomodoro_query = f"""UPDATE pomodoro SET time_finish = ?, time_delta = ? - time_start, status = 2
+                                 WHERE time_finish IS NULL AND time_delta IS NULL
+                                 AND timesheet_id IN (SELECT time_id FROM timesheet WHERE {stale})"""
+            c.execute(pomodoro_query, (end_time, end_time, opened_before))
+
+            c.execute(f"""SELECT time_id, discord_id FROM timesheet WHERE {stale}""", (opened_before,))
+            closed = c.fetchall()
 
-                    update_pomodoro(
-                        conn, pomodoro[0], pomodoro[1], pomodoro[2], pomodoro[3], end_time, total_time, 2)
+            timesheet_query = f"""UPDATE timesheet SET time_out = ?, total_time = ? - time_in WHERE {stale}"""
+            c.execute(timesheet_query, (end_time, end_time, opened_before))
+            emit(f"Closed {len(closed)} stale timesheets", level='DEBUG', cog='db_utils')
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
+        conn.commit()
+        return closed
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def close_timesheet(conn, time_id: int, end_time: float):
+    """
+    Close a timesheet that is still open, along with its open pomodoros, in a single transaction.
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        time_id (int): ID of the timesheet
+        end_time (float): Epoch time to close the timesheet and its pomodoros at
+    Outputs:
+        Returns True if the timesheet was closed, None if it had already been closed, or False if it failed
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+
+            timesheet_query = """UPDATE timesheet SET time_out = ?, total_time = ? - time_in
+                                 WHERE time_id = ? AND time_out IS NULL"""
+            c.execute(timesheet_query, (end_time, end_time, time_id))
+            if c.rowcount == 0:
+                return None
+
+            pomodoro_query = """UPDATE pomodoro SET time_finish = ?, time_delta = ? - time_start, status = 2
+                                WHERE timesheet_id = ? AND time_finish IS NULL AND time_delta IS NULL"""
+            c.execute(pomodoro_query, (end_time, end_time, time_id))
+            emit(f"Closed timesheet {time_id}", level='DEBUG', cog='db_utils')
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return False
+        conn.commit()
+        return True
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+        return False
 
 
-def get_user_report(conn, discord_id: str, start_date: str, end_date: str):
+def get_user_report(conn, discord_id: int, start_date: float, end_date: float):
     """
     Returns all timesheet record, total hours worked, complete pomodor records.
 
     Args: 
         conn: Connection object returned by the `create_connection` function
-        start_date: The desired start date for the report
-        end_date: The desired end date for the report
+        discord_id (int): A Discord user ID
+        start_date (float): Epoch time the report starts at
+        end_date (float): Epoch time the report ends at
     """
-    # print(discord_id, start_date, end_date)
     if conn is not None:
         try:
             c = conn.cursor()
@@ -561,25 +884,386 @@ def get_user_report(conn, discord_id: str, start_date: str, end_date: str):
             complete_pomodoro_query = """SELECT pomodoro.timesheet_id, pomodoro.pomo_id,
                                             pomodoro.status,pomodoro.time_delta 
                                             FROM pomodoro JOIN timesheet ON pomodoro.timesheet_id=timesheet.time_id 
-                                            WHERE timesheet.discord_id = ? AND status = 1;"""
+                                            WHERE timesheet.discord_id = ? AND timesheet.time_in BETWEEN ? and ?
+                                            AND status = 1;"""
             c.execute(record_query, (discord_id, start_date, end_date))
             all_records = c.fetchall()
-            # print(all_records)
 
             c.execute(sum_query, (discord_id, start_date, end_date))
             total_hours = c.fetchall()
-            # print(total_hours)
 
-            c.execute(complete_pomodoro_query, (discord_id,))
+            c.execute(complete_pomodoro_query, (discord_id, start_date, end_date))
             complete_pomodoros = c.fetchall()
-            # print(complete_pomodoros)
 
             return all_records, total_hours, complete_pomodoros
         except sqlite3.Error as e:
-            print(e)
+            emit(str(e), level='ERROR', cog='db_utils')
             conn.rollback()
             return None
     else:
-        print("Error! Cannot create database connection")
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
 
 
+
+def get_role_report(conn, discord_ids: list, start: float, end: float):
+    """
+    Returns hours and pomodoro totals for many users, grouped by user and pay period, in one query.
+    Totals are read from the daily_hours rollup and grouped by the pay_period calendar, which must cover
+    the range. The first period starts at `start` even if its calendar period started earlier.
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        discord_ids (list): Discord user IDs to report on
+        start (float): Epoch time of the first day to report on
+        end (float): Epoch time the report ends at
+    Outputs:
+        rows (list): (discord_id, period_start, sessions, total_time, pomodoros, completed_pomodoros,
+                     help_requests) for every user and period with at least one closed timesheet
+    """
+    if conn is not None:
+        if not discord_ids:
+            return []
+        try:
+            c = conn.cursor()
+
+            member_values = ", ".join("(?)" for _ in discord_ids)
+            report_query = f"""WITH members(discord_id) AS (VALUES {member_values})
+                                SELECT daily_hours.discord_id, MAX(pay_period.period_start, ?) AS period,
+                                       SUM(daily_hours.sessions), SUM(daily_hours.total_time),
+                                       SUM(daily_hours.pomodoros), SUM(daily_hours.completed_pomodoros),
+                                       SUM(daily_hours.help_requests)
+                                FROM members
+                                JOIN daily_hours ON daily_hours.discord_id = members.discord_id
+                                    AND daily_hours.day >= ? AND daily_hours.day < ?
+                                JOIN pay_period ON daily_hours.day >= pay_period.period_start
+                                    AND daily_hours.day < pay_period.period_end
+                                GROUP BY daily_hours.discord_id, period
+                                ORDER BY daily_hours.discord_id, period"""
+
+            c.execute(report_query, list(discord_ids) + [start, start, end])
+            return c.fetchall()
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def insert_pay_periods(conn, periods: list):
+    """
+    Add pay periods to the pay_period calendar, skipping ones that are already in it
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        periods (list): (start, end) epoch times of each pay period
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.executemany("""INSERT OR IGNORE INTO pay_period(period_start, period_end) VALUES(?,?)""", periods)
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+        conn.commit()
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def rollup_closed_timesheets(conn):
+    """
+    Add every closed timesheet that hasn't been rolled up yet to the daily_hours rollup
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+    Outputs:
+        count (int): Number of timesheets rolled up
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute(ROLLUP_QUERY)
+            c.execute("""UPDATE timesheet SET rolled_up = 1 WHERE rolled_up = 0 AND time_out IS NOT NULL""")
+            count = c.rowcount
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+        conn.commit()
+        return count
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def rebuild_daily_hours(conn):
+    """
+    Rebuild the daily_hours rollup from every closed timesheet
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+    Outputs:
+        count (int): Number of timesheets rolled up
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""DELETE FROM daily_hours""")
+            c.execute("""UPDATE timesheet SET rolled_up = 0 WHERE rolled_up = 1""")
+            c.execute(ROLLUP_QUERY)
+            c.execute("""UPDATE timesheet SET rolled_up = 1 WHERE rolled_up = 0 AND time_out IS NOT NULL""")
+            count = c.rowcount
+            emit(f"Rebuilt daily hours from {count} timesheets", level='INFO', cog='db_utils')
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+        conn.commit()
+        return count
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def enqueue_dm(conn, discord_id: int, content: str, view: str, now: float) -> int:
+    """
+    Add a direct message to the outbox
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        discord_id (int): The user to message
+        content (str): The text of the message, or None
+        view (str): Name of the view to attach to the message, or None
+        now (float): Epoch time the message was queued at
+    Output:
+        Returns the message_id of the queued message
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""INSERT INTO dm_outbox(discord_id, content, view, next_attempt, created) VALUES(?,?,?,?,?)""",
+                      (discord_id, content, view, now, now))
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+        conn.commit()
+        return c.lastrowid
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+# Only the oldest pending message of each user is ever sent, so a user's messages arrive in order even when
+# one of them has to be retried
+NEXT_DMS = """SELECT MIN(message_id) FROM dm_outbox WHERE status = 'pending' GROUP BY discord_id"""
+
+
+def get_due_dms(conn, now: float, limit: int):
+    """
+    Return the queued direct messages that are due to be sent
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        now (float): The current epoch time
+        limit (int): Maximum number of messages to return
+    Outputs:
+        messages (list): (message_id, discord_id, content, view, attempts) of each due message, oldest first
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute(f"""SELECT message_id, discord_id, content, view, attempts FROM dm_outbox
+                          WHERE message_id IN ({NEXT_DMS}) AND next_attempt <= ?
+                          ORDER BY message_id LIMIT ?""", (now, limit))
+            return c.fetchall()
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def get_next_dm_attempt(conn):
+    """
+    Return when the next queued direct message is due
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+    Outputs:
+        next_attempt (float): Epoch time the next message is due, or None if the outbox is empty
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute(f"""SELECT MIN(next_attempt) FROM dm_outbox WHERE message_id IN ({NEXT_DMS})""")
+            return c.fetchone()[0]
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def update_dm_status(conn, message_id: int, status: str, attempts: int, next_attempt: float, delivered: float = None,
+                     error: str = None, sent_message_id: int = None) -> bool:
+    """
+    Record the outcome of an attempt to deliver a queued direct message
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        message_id (int): The queued message
+        status (str): 'pending' to retry, 'sent' once delivered, or 'failed' once it can't be delivered.
+            Messages withdrawn with `retract_dm` are 'cancelled'
+        attempts (int): Number of attempts made so far
+        next_attempt (float): Epoch time to retry at
+        delivered (float): Epoch time the message was delivered at
+        error (str): The last error, if any
+        sent_message_id (int): Discord ID of the delivered message
+    Output:
+        Returns boolean value to signify if
+            the update operatation was Completed(True) or failed(False)
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""UPDATE dm_outbox SET status = ?, attempts = ?, next_attempt = ?, delivered = ?, error = ?,
+                         sent_message_id = ? WHERE message_id = ?""",
+                      (status, attempts, next_attempt, delivered, error, sent_message_id, message_id))
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return False
+        conn.commit()
+        return True
+    else:
+        emit("Error! Cannot create database connection.", level='ERROR', cog='db_utils')
+        return False
+
+
+def retract_dm(conn, message_id: int):
+    """
+    Withdraw a queued direct message. A message that hasn't been delivered yet is cancelled so it is never sent
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        message_id (int): The queued message
+    Outputs:
+        sent (tuple): (discord_id, sent_message_id) if the message was already delivered and has to be deleted, otherwise None
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""UPDATE dm_outbox SET status = 'cancelled' WHERE message_id = ? AND status = 'pending'""",
+                      (message_id,))
+            if c.rowcount:
+                conn.commit()
+                return None
+            c.execute("""SELECT discord_id, sent_message_id FROM dm_outbox
+                         WHERE message_id = ? AND status = 'sent' AND sent_message_id IS NOT NULL""", (message_id,))
+            return c.fetchone()
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def purge_dm_outbox(conn, before: float):
+    """
+    Delete delivered and failed direct messages that were queued before a cutoff
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        before (float): Epoch time cutoff
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""DELETE FROM dm_outbox WHERE status != 'pending' AND created < ?""", (before,))
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+        conn.commit()
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def get_dm_channels(conn):
+    """
+    Return the DM channel of every user that has been messaged
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+    Outputs:
+        channels (list): (discord_id, channel_id) of every known DM channel
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""SELECT discord_id, channel_id FROM dm_channel""")
+            return c.fetchall()
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def set_dm_channel(conn, discord_id: int, channel_id: int):
+    """
+    Remember the DM channel of a user, or forget it when `channel_id` is None
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+        discord_id (int): The user
+        channel_id (int): ID of the DM channel, or None
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            if channel_id is None:
+                c.execute("""DELETE FROM dm_channel WHERE discord_id = ?""", (discord_id,))
+            else:
+                c.execute("""INSERT OR REPLACE INTO dm_channel(discord_id, channel_id) VALUES(?,?)""",
+                          (discord_id, channel_id))
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+        conn.commit()
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
+
+
+def get_open_checkins(conn):
+    """
+    Return every open timesheet along with its open pomodoro, if it has one
+
+    Args:
+        conn: Connection object returned by the `create_connection` function
+    Outputs:
+        checkins (list): (time_id, discord_id, time_in, pomo_id, issue, time_start, status, help_count) of each
+                         open timesheet, with the pomodoro columns NULL when no pomodoro is open
+    """
+    if conn is not None:
+        try:
+            c = conn.cursor()
+            c.execute("""SELECT timesheet.time_id, timesheet.discord_id, timesheet.time_in, pomodoro.pomo_id,
+                                pomodoro.issue, pomodoro.time_start, pomodoro.status, pomodoro.help_count
+                         FROM timesheet
+                         LEFT JOIN pomodoro ON pomodoro.timesheet_id = timesheet.time_id
+                             AND pomodoro.time_finish IS NULL AND pomodoro.time_delta IS NULL
+                         WHERE timesheet.time_out IS NULL AND timesheet.total_time IS NULL
+                         ORDER BY timesheet.time_id, pomodoro.pomo_id""")
+            return c.fetchall()
+        except sqlite3.Error as e:
+            emit(str(e), level='ERROR', cog='db_utils')
+            conn.rollback()
+            return None
+    else:
+        emit("Error! Cannot create database connection", level='ERROR', cog='db_utils')
@@ -0,0 +1,284 @@
+import asyncio
+import time
+
+import aiohttp
+import discord
+
+from utils.db_utils import (enqueue_dm, get_due_dms, get_next_dm_attempt, update_dm_status, retract_dm,
+                            purge_dm_outbox, get_dm_channels, set_dm_channel)
+from utils.log_utils import emit
+
+
+class DMOutbox:
+    """Durable queue of direct messages, delivered by a background worker
+    Messages are written to the `dm_outbox` table before anything is sent, so they survive restarts. The
+    worker sends them one at a time, at most one every `interval` seconds, oldest first and in order for
+    each user. Failed sends are retried with exponential backoff, and every message's delivery status is
+    recorded, along with the ID of the message once it is delivered. DM channel IDs are cached in memory
+    and in the `dm_channel` table, so a user's DM channel is only created once.
+
+    Messages can carry a view, given by the name it was registered under with `register_view`, since views
+    can't be stored in the database.
+
+    While the outbox isn't running, such as after the Checkin cog that owns the database is unloaded,
+    messages are sent right away instead, without being recorded or retried. Delivered and failed messages
+    older than `retention` are purged when the outbox starts and every `purge_interval` seconds after that.
+
+    Args:
+        interval (float): Minimum seconds between two sends
+        batch_size (int): Number of due messages read from the database at once
+        max_attempts (int): Attempts before a message is marked as failed
+        base_delay (float): Seconds before the first retry, doubled for every retry after it
+        max_delay (float): Longest delay between two retries
+        retention (float): Seconds to keep delivered and failed messages for
+        purge_interval (float): Seconds between two purges of old messages
+    """
+
+    def __init__(self, interval=0.25, batch_size=20, max_attempts=8, base_delay=5.0, max_delay=60 * 60,
+                 retention=30 * 24 * 60 * 60, purge_interval=24 * 60 * 60):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retention = retention
+        self.purge_interval = purge_interval
+
+        self.bot = None
+        self.db = None
+        self._views = {}
+        self._channels = {}
+        self._sending = None
+        self._retracted = False
+        self._purged_at = 0.0
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def register_view(self, name, factory):
+        """Make a view available to queued messages
+
+        Args:
+            name (str): Name messages refer to the view by
+            factory (Callable[[], discord.ui.View]): Builds a new instance of the view
+        """
+
+        self._views[name] = factory
+
+    async def start(self, bot, db):
+        """Start delivering messages
+
+        Args:
+            bot (discord.ext.commands.Bot): The bot to send with
+            db (DatabaseGateway): Database holding the outbox
+        """
+
+        self.bot = bot
+        self.db = db
+        await self._purge()
+        self._channels = dict(await self.db.read(get_dm_channels) or [])
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop delivering messages. Messages still queued are sent after the next start, and new messages are
+        sent right away until then
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.db = None
+
+    async def send(self, user_id, content=None, view=None):
+        """Queue a direct message
+
+        Args:
+            user_id (int): ID of the user to message
+            content (str): The text of the message
+            view (str): Name of a registered view to attach
+
+        Returns:
+            message_id (int): ID of the queued message, or None if it could not be queued
+        """
+
+        if self.db is None:
+            await self._send_now(user_id, content, view)
+            return None
+
+        message_id = await self.db.write(enqueue_dm, user_id, content, view, time.time())
+        self._wake.set()
+        return message_id
+
+    async def _send_now(self, user_id, content, view):
+        """Send a message right away, for when the outbox isn't running"""
+
+        if self.bot is None:
+            emit(f'Could not DM {user_id} because the outbox was never started', level='ERROR', cog='dm_outbox')
+            return
+        try:
+            channel = await self.channel(user_id)
+            if view is not None:
+                await channel.send(content, view=self._views[view]())
+            else:
+                await channel.send(content)
+        except discord.HTTPException as e:
+            emit(f'Could not DM {user_id} because {e}', level='ERROR', cog='dm_outbox')
+
+    async def retract(self, message_id):
+        """Withdraw a queued message, deleting it if it was already delivered
+
+        Args:
+            message_id (int): ID of the queued message, as returned by `send`
+        """
+
+        if self.db is None:
+            return
+
+        sent = await self.db.write(retract_dm, message_id)
+        if sent is None:
+            # A message that is being sent right now is deleted by the worker once it is delivered
+            if message_id == self._sending:
+                self._retracted = True
+            return
+        await self._delete(*sent)
+
+    async def _delete(self, user_id, sent_message_id):
+        """Delete a delivered message"""
+
+        channel = await self.channel(user_id)
+        try:
+            await channel.get_partial_message(sent_message_id).delete()
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            emit(f'Could not delete DM {sent_message_id} to {user_id} because {e}', level='WARNING', cog='dm_outbox')
+
+    async def channel(self, user_id):
+        """Get the DM channel of a user, creating it only if it isn't cached
+
+        Args:
+            user_id (int): ID of the user
+
+        Returns:
+            channel (discord.PartialMessageable): The DM channel
+        """
+
+        if self.bot is None:
+            raise RuntimeError('The DM outbox has to be started before it can open DM channels')
+
+        channel_id = self._channels.get(user_id)
+        if channel_id is None:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            channel_id = (await user.create_dm()).id
+            self._channels[user_id] = channel_id
+            if self.db is not None:
+                await self.db.write(set_dm_channel, user_id, channel_id)
+        return self.bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+
+    async def _purge(self):
+        """Delete delivered and failed messages older than `retention`"""
+
+        self._purged_at = time.time()
+        await self.db.write(purge_dm_outbox, self._purged_at - self.retention)
+
+    async def _forget_channel(self, user_id):
+        """Forget a cached DM channel that no longer works"""
+
+        if self._channels.pop(user_id, None) is not None:
+            await self.db.write(set_dm_channel, user_id, None)
+
+    async def _run(self):
+        """Send due messages, then sleep until the next one is due or a new one is queued"""
+
+        await self.bot.wait_until_ready()
+        while True:
+            self._wake.clear()
+            if time.time() - self._purged_at >= self.purge_interval:
+                await self._purge()
+
+            messages = await self.db.read(get_due_dms, time.time(), self.batch_size)
+            if messages:
+                for message in messages:
+                    await self._deliver(*message)
+                    await asyncio.sleep(self.interval)
+                continue
+
+            # Sleep no later than the next purge
+            next_attempt = await self.db.read(get_next_dm_attempt)
+            wake_at = self._purged_at + self.purge_interval
+            if next_attempt is not None:
+                wake_at = min(wake_at, next_attempt)
+            timeout = max(wake_at - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, message_id, user_id, content, view, attempts):
+        """Try to send one queued message and record the outcome
+
+        Args:
+            message_id (int): The queued message
+            user_id (int): ID of the recipient
+            content (str): The text of the message
+            view (str): Name of the view to attach
+            attempts (int): Attempts made before this one
+        """
+
+        attempts += 1
+        self._sending, self._retracted = message_id, False
+        try:
+            channel = await self.channel(user_id)
+            if view is not None:
+                sent = await channel.send(content, view=self._views[view]())
+            else:
+                sent = await channel.send(content)
+        except discord.NotFound as e:
+            # The cached DM channel is gone, or the user no longer exists
+            await self._forget_channel(user_id)
+            await self._retry(message_id, user_id, attempts, e)
+        except discord.Forbidden as e:
+            await self._fail(message_id, user_id, attempts, e)
+        except discord.HTTPException as e:
+            if e.status >= 500:
+                await self._retry(message_id, user_id, attempts, e)
+            else:
+                await self._fail(message_id, user_id, attempts, e)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            await self._retry(message_id, user_id, attempts, e)
+        except Exception as e:
+            await self._fail(message_id, user_id, attempts, e)
+        else:
+            now = time.time()
+            await self.db.write(update_dm_status, message_id, 'sent', attempts, now, now, None, sent.id)
+            if self._retracted:
+                await self._delete(user_id, sent.id)
+        finally:
+            self._sending = None
+
+    async def _retry(self, message_id, user_id, attempts, error):
+        """Schedule another attempt with exponential backoff, or give up after `max_attempts`"""
+
+        if self._retracted:
+            await self.db.write(update_dm_status, message_id, 'cancelled', attempts, time.time(), None, str(error))
+            return
+
+        if attempts >= self.max_attempts:
+            await self._fail(message_id, user_id, attempts, error)
+            return
+
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        emit(f'Could not DM {user_id} because {error}, retrying in {delay:.0f} seconds', level='WARNING', cog='dm_outbox')
+        await self.db.write(update_dm_status, message_id, 'pending', attempts, time.time() + delay, None, str(error))
+
+    async def _fail(self, message_id, user_id, attempts, error):
+        """Mark a message as undeliverable"""
+
+        emit(f'Could not DM {user_id} after {attempts} attempts because {error}', level='ERROR', cog='dm_outbox')
+        await self.db.write(update_dm_status, message_id, 'failed', attempts, time.time(), None, str(error))
+
+
+dm_outbox = DMOutbox()
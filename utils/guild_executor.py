@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import aiohttp
+import discord
+
+from utils.log_utils import emit
+from utils.utils import chunk_lines
+
+
+class GuildExecutor:
+    """Runs independent guild mutation jobs concurrently, reporting progress in a single message
+    At most `concurrency` jobs run at once. Inside a job every API call goes through `call` with the name of
+    its route, and at most `per_route` calls to one route are in flight at a time, so a busy bucket such as
+    channel creation queues its own calls instead of occupying every job. discord.py already waits out the
+    rate limit of each bucket; calls that still come back rate limited are retried after the delay Discord asks
+    for. Calls that fail with a server error or a connection error are retried with exponential backoff, unless
+    their route creates something: such a call may have succeeded before it failed, and retrying it would
+    create a duplicate, so it is left to the journal to check the guild when the run is resumed.
+
+    A failing job doesn't stop the others. The progress message is edited at most every `progress_interval`
+    seconds and ends with the failures.
+
+    Args:
+        concurrency (int): Jobs that run at the same time
+        per_route (int): Calls to one route that are in flight at the same time
+        retries (int): Retries of a call that was rate limited or failed with a server error
+        base_delay (float): Seconds before the first retry, doubled for every retry after it
+        progress_interval (float): Minimum seconds between two edits of the progress message
+    """
+
+    # Routes starting with this create an object, so they are only retried when rate limited
+    CREATE_PREFIX = 'create_'
+
+    def __init__(self, concurrency=4, per_route=2, retries=3, base_delay=1.0, progress_interval=2.0):
+        self.concurrency = concurrency
+        self.per_route = per_route
+        self.retries = retries
+        self.base_delay = base_delay
+        self.progress_interval = progress_interval
+
+        self._routes = {}
+
+    async def call(self, route, func, *args, **kwargs):
+        """Make one API call, waiting for a free slot on its route and retrying it if needed
+
+        Args:
+            route (str): Name of the route the call uses, such as 'create_channel'
+            func (Callable[..., Awaitable]): The call
+            *args: Arguments of the call
+            **kwargs: Keyword arguments of the call
+
+        Returns:
+            result: What the call returned
+        """
+
+        semaphore = self._routes.get(route)
+        if semaphore is None:
+            semaphore = self._routes[route] = asyncio.Semaphore(self.per_route)
+
+        creates = route.startswith(self.CREATE_PREFIX)
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    return await func(*args, **kwargs)
+            except discord.RateLimited as e:
+                # Raised before the request is made, when the wait is longer than discord.py is willing to sleep
+                if attempt == self.retries:
+                    raise
+                delay = e.retry_after
+            except discord.HTTPException as e:
+                if attempt == self.retries or (e.status != 429 and (e.status < 500 or creates)):
+                    raise
+                retry_after = e.response.headers.get('Retry-After') if e.status == 429 else None
+                delay = float(retry_after) if retry_after else self.base_delay * 2 ** attempt
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries or creates:
+                    raise
+                delay = self.base_delay * 2 ** attempt
+            emit(f'{route} failed, retrying in {delay:.1f} seconds', level='WARNING', cog='guild_executor')
+            await asyncio.sleep(delay)
+
+    async def run(self, channel, title, jobs):
+        """Run jobs and keep a progress message in a channel up to date
+
+        Args:
+            channel (discord.abc.Messageable): Where to post the progress message
+            title (str): What the jobs do, shown at the top of the progress message
+            jobs (List[Tuple[str, Callable[[], Awaitable]]]): Name and coroutine function of each job
+
+        Returns:
+            failures (List[Tuple[str, Exception]]): Name and error of every job that failed
+        """
+
+        total = len(jobs)
+        done = 0
+        failures = []
+        start = time.monotonic()
+
+        message = await channel.send(self._progress(title, done, total, failures, start))
+        last_edit = time.monotonic()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_job(name, job):
+            nonlocal done, last_edit
+            async with semaphore:
+                try:
+                    await job()
+                except Exception as e:
+                    emit(f'{title}: {name} failed because {e}', level='ERROR', cog='guild_executor')
+                    failures.append((name, e))
+            done += 1
+
+            # Edits are skipped while one was made recently; the final edit below shows the end state
+            if time.monotonic() - last_edit >= self.progress_interval and done < total:
+                last_edit = time.monotonic()
+                try:
+                    await message.edit(content=self._progress(title, done, total, failures, start)[:2000])
+                except discord.HTTPException:
+                    pass
+
+        await asyncio.gather(*(run_job(name, job) for name, job in jobs))
+
+        content = self._progress(title, done, total, failures, start)
+        if len(content) <= 2000:
+            await message.edit(content=content)
+            return failures
+
+        # A long list of failures doesn't fit in the progress message, so it continues in new messages
+        summary, failure_lines = content.split('\n', 1)
+        await message.edit(content=summary)
+        for chunk in chunk_lines(failure_lines):
+            await channel.send(chunk)
+        return failures
+
+    @staticmethod
+    def _progress(title, done, total, failures, start):
+        """Render the progress message, a line for the counts followed by a line for each failure"""
+
+        elapsed = time.monotonic() - start
+        lines = [f'**{title}**: {done}/{total} done, {len(failures)} failed ({elapsed:.0f}s)']
+        if done == total:
+            lines[0] += ' - finished'
+        for name, error in failures:
+            lines.append(f'- {name}: {error}')
+        return '\n'.join(lines)
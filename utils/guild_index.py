@@ -0,0 +1,309 @@
+import discord
+
+
+class _GuildNames:
+    """Name to ID maps for a single guild
+    Names map to a list of IDs since Discord allows duplicate names. The first ID is the object that was
+    indexed first, matching the order a linear scan of the guild would find them in. Emojis are stored as
+    objects since they are replaced wholesale whenever a guild's emojis change.
+    """
+
+    def __init__(self):
+        self.roles = {}
+        self.channels = {}
+        self.categories = {}
+        self.members = {}
+        self.emojis = {}
+        self.members_complete = False
+
+
+def _add(names, name, object_id):
+    """Add an ID under a name
+
+    Args:
+        names (dict): The name to ID list map
+        name (str): The object's name
+        object_id (int): The object's ID
+    """
+
+    ids = names.setdefault(name, [])
+    if object_id not in ids:
+        ids.append(object_id)
+
+
+def _remove(names, name, object_id):
+    """Remove an ID from under a name, dropping the name once it has no IDs left
+
+    Args:
+        names (dict): The name to ID list map
+        name (str): The object's name
+        object_id (int): The object's ID
+    """
+
+    ids = names.get(name)
+    if ids is not None and object_id in ids:
+        ids.remove(object_id)
+        if not ids:
+            del names[name]
+
+
+class GuildIndex:
+    """Per-guild name index for roles, channels, categories, members and emojis
+    Each guild is indexed the first time it is looked up. After that the index is kept current by the
+    gateway events forwarded from the Listeners cog, so a lookup by name is a dictionary access no matter
+    how many roles or channels the guild has. IDs are resolved through the guild's own ID caches, so the
+    returned objects are always the current ones.
+    """
+
+    def __init__(self):
+        self._guilds = {}
+
+    def _names(self, guild):
+        """Get the index of a guild, building it on first use
+
+        Args:
+            guild (discord.Guild): The guild
+
+        Returns:
+            names (_GuildNames): The guild's index
+        """
+
+        names = self._guilds.get(guild.id)
+        if names is None:
+            names = self.build(guild)
+        elif not names.members_complete and guild.chunked:
+            self._index_members(guild, names)
+        return names
+
+    def build(self, guild):
+        """Index every role, channel, category, member and emoji of a guild
+
+        Args:
+            guild (discord.Guild): The guild to index
+
+        Returns:
+            names (_GuildNames): The guild's index
+        """
+
+        names = _GuildNames()
+        for role in guild.roles:
+            _add(names.roles, role.name, role.id)
+        for channel in guild.channels:
+            self._add_channel(names, channel)
+        for emoji in guild.emojis:
+            _add(names.emojis, emoji.name, emoji)
+        self._index_members(guild, names)
+
+        self._guilds[guild.id] = names
+        return names
+
+    def _index_members(self, guild, names):
+        """Index the members of a guild
+        Members are indexed again once the guild finishes chunking if the member cache was incomplete.
+
+        Args:
+            guild (discord.Guild): The guild
+            names (_GuildNames): The guild's index
+        """
+
+        names.members = {}
+        for member in guild.members:
+            _add(names.members, member.name, member.id)
+        names.members_complete = guild.chunked
+
+    def forget(self, guild):
+        """Drop the index of a guild the bot has left
+
+        Args:
+            guild (discord.Guild): The guild that was left
+        """
+
+        self._guilds.pop(guild.id, None)
+
+    @staticmethod
+    def _add_channel(names, channel):
+        """Add a channel to the category or channel map depending on its type"""
+
+        if isinstance(channel, discord.CategoryChannel):
+            _add(names.categories, channel.name, channel.id)
+        else:
+            _add(names.channels, channel.name, channel.id)
+
+    @staticmethod
+    def _remove_channel(names, channel):
+        """Remove a channel from the category or channel map depending on its type"""
+
+        if isinstance(channel, discord.CategoryChannel):
+            _remove(names.categories, channel.name, channel.id)
+        else:
+            _remove(names.channels, channel.name, channel.id)
+
+    # Lookups
+
+    def role(self, guild, name):
+        """Find a role by name
+
+        Args:
+            guild (discord.Guild): The guild to search
+            name (str): The role's name
+
+        Returns:
+            role (discord.Role): The role, or None if there is none with that name
+        """
+
+        return self._resolve(self._names(guild).roles, name, guild.get_role)
+
+    def channel(self, guild, name):
+        """Find a text, voice, stage or forum channel by name
+
+        Args:
+            guild (discord.Guild): The guild to search
+            name (str): The channel's name
+
+        Returns:
+            channel (discord.abc.GuildChannel): The channel, or None if there is none with that name
+        """
+
+        return self._resolve(self._names(guild).channels, name, guild.get_channel)
+
+    def category(self, guild, name):
+        """Find a category by name
+
+        Args:
+            guild (discord.Guild): The guild to search
+            name (str): The category's name
+
+        Returns:
+            category (discord.CategoryChannel): The category, or None if there is none with that name
+        """
+
+        return self._resolve(self._names(guild).categories, name, guild.get_channel)
+
+    def member(self, guild, name):
+        """Find a member by username
+
+        Args:
+            guild (discord.Guild): The guild to search
+            name (str): The member's username
+
+        Returns:
+            member (discord.Member): The member, or None if there is none with that username
+        """
+
+        return self._resolve(self._names(guild).members, name, guild.get_member)
+
+    def emoji(self, guild, name):
+        """Find a custom emoji by name
+
+        Args:
+            guild (discord.Guild): The guild to search
+            name (str): The emoji's name
+
+        Returns:
+            emoji (discord.Emoji): The emoji, or None if there is none with that name
+        """
+
+        emojis = self._names(guild).emojis.get(name)
+        return emojis[0] if emojis else None
+
+    @staticmethod
+    def _resolve(names, name, getter):
+        """Resolve the first ID under a name that still exists
+
+        Args:
+            names (dict): The name to ID list map
+            name (str): The name to look up
+            getter (Callable[[int], object]): The guild's lookup by ID
+
+        Returns:
+            The first object found, or None
+        """
+
+        for object_id in names.get(name, ()):
+            found = getter(object_id)
+            if found is not None:
+                return found
+        return None
+
+    # Gateway event handlers
+
+    def role_created(self, role):
+        """Index a created role"""
+
+        names = self._guilds.get(role.guild.id)
+        if names is not None:
+            _add(names.roles, role.name, role.id)
+
+    def role_deleted(self, role):
+        """Unindex a deleted role"""
+
+        names = self._guilds.get(role.guild.id)
+        if names is not None:
+            _remove(names.roles, role.name, role.id)
+
+    def role_updated(self, before, after):
+        """Reindex a renamed role"""
+
+        names = self._guilds.get(after.guild.id)
+        if names is not None and before.name != after.name:
+            _remove(names.roles, before.name, before.id)
+            _add(names.roles, after.name, after.id)
+
+    def channel_created(self, channel):
+        """Index a created channel or category"""
+
+        names = self._guilds.get(channel.guild.id)
+        if names is not None:
+            self._add_channel(names, channel)
+
+    def channel_deleted(self, channel):
+        """Unindex a deleted channel or category"""
+
+        names = self._guilds.get(channel.guild.id)
+        if names is not None:
+            self._remove_channel(names, channel)
+
+    def channel_updated(self, before, after):
+        """Reindex a renamed channel or category"""
+
+        names = self._guilds.get(after.guild.id)
+        if names is not None and before.name != after.name:
+            self._remove_channel(names, before)
+            self._add_channel(names, after)
+
+    def emojis_updated(self, guild, after):
+        """Reindex a guild's emojis from its new emoji list"""
+
+        names = self._guilds.get(guild.id)
+        if names is not None:
+            names.emojis = {}
+            for emoji in after:
+                _add(names.emojis, emoji.name, emoji)
+
+    def member_joined(self, member):
+        """Index a member that joined"""
+
+        names = self._guilds.get(member.guild.id)
+        if names is not None:
+            _add(names.members, member.name, member.id)
+
+    def member_removed(self, member):
+        """Unindex a member that left"""
+
+        names = self._guilds.get(member.guild.id)
+        if names is not None:
+            _remove(names.members, member.name, member.id)
+
+    def user_updated(self, before, after):
+        """Reindex a user that changed their username in every guild shared with the bot"""
+
+        if before.name == after.name:
+            return
+        for guild in after.mutual_guilds:
+            names = self._guilds.get(guild.id)
+            if names is not None:
+                _remove(names.members, before.name, before.id)
+                _add(names.members, after.name, after.id)
+
+
+guild_index = GuildIndex()
@@ -0,0 +1,172 @@
+import time
+
+import discord
+
+from utils.log_utils import emit
+
+
+class RouteStats:
+    """Dispatch counters and latency of one route"""
+
+    __slots__ = ('count', 'errors', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class InteractionRouter:
+    """Dispatches component and modal interactions to the one handler registered for their custom_id
+    Custom IDs are structured as `namespace:action:args`. Handlers are registered for a namespace and action
+    and called with the interaction and the args, which may contain more colons or be empty. Finding the
+    handler is a single dictionary lookup, so the work done per interaction doesn't grow with the number of
+    cogs or routes, and only the bot's single `on_interaction` listener has to call `dispatch`.
+
+    Buttons sent before custom IDs were structured are still out there on old messages, so legacy IDs can be
+    mapped onto routes too, either exactly or by prefix. Prefixes are only tried for IDs without a colon,
+    longest first, and the rest of the ID becomes the args.
+
+    The number of dispatches, errors and the handler latency of every route are kept for `summary`.
+    """
+
+    SEPARATOR = ':'
+
+    def __init__(self):
+        self._routes = {}
+        self._owners = {}
+        self._legacy = {}
+        self._legacy_prefixes = []
+        self.stats = {}
+        self.unrouted = 0
+
+    def add_route(self, namespace, action, handler, owner=None):
+        """Register the handler of a route, replacing the one already registered for it
+
+        Args:
+            namespace (str): First part of the custom ID, usually the cog
+            action (str): Second part of the custom ID
+            handler (Callable[[discord.Interaction, str], Awaitable]): Called with the interaction and the args
+            owner (object): What registered the route, so `remove_routes` can drop all of its routes at once
+        """
+
+        route = (namespace, action)
+        self._routes[route] = handler
+        self._owners[route] = owner
+        self.stats.setdefault(route, RouteStats())
+
+    def add_legacy(self, custom_id, namespace, action, prefix=False):
+        """Send a custom ID from before IDs were structured to a route
+
+        Args:
+            custom_id (str): The legacy custom ID, or its start if `prefix` is set
+            namespace (str): Namespace of the route
+            action (str): Action of the route
+            prefix (bool): Whether to match every custom ID starting with `custom_id`, passing the rest as args
+        """
+
+        route = (namespace, action)
+        if prefix:
+            self._legacy_prefixes = [entry for entry in self._legacy_prefixes if entry[0] != custom_id]
+            self._legacy_prefixes.append((custom_id, route))
+            self._legacy_prefixes.sort(key=lambda entry: len(entry[0]), reverse=True)
+        else:
+            self._legacy[custom_id] = route
+
+    def remove_routes(self, owner):
+        """Drop every route registered by an owner, along with legacy IDs pointing at them
+
+        Args:
+            owner (object): The owner given to `add_route`
+        """
+
+        routes = {route for route, route_owner in self._owners.items() if route_owner is owner}
+        for route in routes:
+            del self._routes[route]
+            del self._owners[route]
+        self._legacy = {custom_id: route for custom_id, route in self._legacy.items() if route not in routes}
+        self._legacy_prefixes = [entry for entry in self._legacy_prefixes if entry[1] not in routes]
+
+    def resolve(self, custom_id):
+        """Find the route of a custom ID
+
+        Args:
+            custom_id (str): The custom ID of a component or modal
+
+        Returns:
+            route (Tuple[Tuple[str, str], str]): The (namespace, action) route and the args, or None if no route matches
+        """
+
+        if self.SEPARATOR in custom_id:
+            namespace, _, rest = custom_id.partition(self.SEPARATOR)
+            action, _, args = rest.partition(self.SEPARATOR)
+            route = (namespace, action)
+            return (route, args) if route in self._routes else None
+
+        route = self._legacy.get(custom_id)
+        if route is not None:
+            return route, ''
+        for prefix, route in self._legacy_prefixes:
+            if custom_id.startswith(prefix):
+                return route, custom_id[len(prefix):]
+        return None
+
+    async def dispatch(self, interaction: discord.Interaction):
+        """Call the handler of an interaction's custom ID, if it has one
+
+        Args:
+            interaction (discord.Interaction): Any interaction. Ones without a custom ID are ignored
+
+        Returns:
+            handled (bool): Whether a handler was called
+        """
+
+        custom_id = (interaction.data or {}).get('custom_id')
+        if custom_id is None or interaction.response.is_done():
+            return False
+
+        resolved = self.resolve(custom_id)
+        if resolved is None:
+            self.unrouted += 1
+            return False
+        route, args = resolved
+
+        stats = self.stats[route]
+        start = time.perf_counter()
+        try:
+            await self._routes[route](interaction, args)
+        except Exception as e:
+            stats.errors += 1
+            emit(f'Interaction {custom_id} from {interaction.user} failed because {e}', level='ERROR',
+                 cog='interaction_router')
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+        return True
+
+    def summary(self, limit=5):
+        """Summarize the busiest routes
+
+        Args:
+            limit (int): Number of routes to include
+
+        Returns:
+            summary (str): Dispatches, errors and latency of each route as a single line
+        """
+
+        routes = sorted(((route, stats) for route, stats in self.stats.items() if stats.count),
+                        key=lambda item: item[1].count, reverse=True)
+        parts = [f'{namespace}:{action} {stats.count}x avg {stats.average * 1000:.0f}ms max {stats.max * 1000:.0f}ms'
+                 + (f' {stats.errors} errors' if stats.errors else '')
+                 for (namespace, action), stats in routes[:limit]]
+        return 'Interactions: ' + (', '.join(parts) if parts else 'none routed') + f', {self.unrouted} unrouted'
+
+
+router = InteractionRouter()
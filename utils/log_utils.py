@@ -0,0 +1,758 @@
+import asyncio
+import collections
+import datetime
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import discord
+
+
+class LogFile:
+    """Append-only log file with size and time based rotation
+    Lines are held in a bounded buffer and appended to the file when the buffer fills, when the flush
+    interval elapses, or when the bot shuts down. Once the current segment grows past `max_bytes` or
+    becomes older than `max_age` seconds it is renamed with a timestamp suffix and gzipped, and only the
+    newest `backup_count` compressed segments are kept.
+
+    Args:
+        path (str): Path of the active log file
+        max_bytes (int): Size in bytes at which the active segment is rotated
+        max_age (float): Age in seconds at which the active segment is rotated
+        backup_count (int): Number of compressed segments to keep
+        buffer_lines (int): Number of buffered lines that forces a flush
+        flush_interval (float): Seconds between background flushes
+    """
+
+    def __init__(self, path='log', max_bytes=5 * 1024 * 1024, max_age=7 * 24 * 60 * 60, backup_count=20,
+                 buffer_lines=256, flush_interval=5.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.buffer_lines = buffer_lines
+        self.flush_interval = flush_interval
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._task = None
+
+        # An existing segment is considered to have started when it was last written to
+        try:
+            self._size = os.path.getsize(path)
+            self._opened_at = os.path.getmtime(path)
+        except FileNotFoundError:
+            self._size = 0
+            self._opened_at = time.time()
+
+    def write(self, line):
+        """Buffer a line to be appended to the log file
+        Flushes immediately if the buffer is full so memory use stays bounded.
+
+        Args:
+            line (str): The line to write, without a trailing newline
+        """
+
+        with self._lock:
+            self._buffer.append(line + '\n')
+            full = len(self._buffer) >= self.buffer_lines
+        if full:
+            self.flush()
+
+    def write_records(self, records):
+        """Buffer log records as JSON lines
+
+        Args:
+            records (List[dict]): The records to write
+        """
+
+        for record in records:
+            self.write(json.dumps(record, default=str))
+
+    async def handle(self, records):
+        """Pipeline sink entry point, writes records from a worker thread so the event loop never blocks
+
+        Args:
+            records (List[dict]): The records to write
+        """
+
+        await asyncio.to_thread(self.write_records, records)
+
+    def flush(self):
+        """Append all buffered lines to the active segment, rotating it first if needed"""
+
+        with self._lock:
+            if not self._buffer:
+                return
+
+            if self._should_rotate():
+                self.rotate()
+
+            data = ''.join(self._buffer)
+            self._buffer.clear()
+            with open(self.path, mode='a') as f:
+                f.write(data)
+            self._size += len(data.encode())
+
+    def _should_rotate(self):
+        """Checks whether the active segment is too large or too old
+
+        Returns:
+            (bool): Whether the active segment should be rotated
+        """
+
+        if self._size == 0:
+            return False
+        return self._size >= self.max_bytes or time.time() - self._opened_at >= self.max_age
+
+    def rotate(self):
+        """Close off the active segment
+        Renames the active file with a timestamp suffix, compresses it with gzip, and removes the oldest
+        compressed segments past `backup_count`.
+        """
+
+        if not os.path.exists(self.path):
+            return
+
+        # Microseconds keep rotations in the same second apart, and the name is bumped if it is still taken
+        now = datetime.datetime.now()
+        rotated = f"{self.path}.{now.strftime('%Y%m%d-%H%M%S-%f')}"
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            now += datetime.timedelta(microseconds=1)
+            rotated = f"{self.path}.{now.strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, rotated)
+
+        with open(rotated, mode='rb') as f_in, gzip.open(rotated + '.gz', mode='wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(rotated)
+
+        self._size = 0
+        self._opened_at = time.time()
+        self._prune()
+
+    def _prune(self):
+        """Delete the oldest compressed segments beyond `backup_count`"""
+
+        directory = os.path.dirname(self.path) or '.'
+        prefix = os.path.basename(self.path) + '.'
+        segments = sorted(name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith('.gz'))
+
+        for name in segments[:max(len(segments) - self.backup_count, 0)]:
+            os.remove(os.path.join(directory, name))
+
+    def start(self):
+        """Start the background flush task on the running event loop if it is not already running"""
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Flush the buffer every `flush_interval` seconds"""
+
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """Stop the background flush task and write out anything still buffered"""
+
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self.flush()
+
+
+class ChannelLogSink:
+    """Batched log sink for the `bot-logs` channel of every guild
+    The ID of each guild's log channel is resolved once and then kept current through the channel events
+    forwarded by the Listeners cog. Lines are queued and sent on an interval, packed into as few messages
+    as Discord's message length limit allows.
+
+    Args:
+        channel_name (str): Name of the channel to log to in each guild
+        flush_interval (float): Seconds between sends
+        max_length (int): Maximum number of characters per message
+        max_pending (int): Maximum number of queued lines, the oldest are dropped past this
+    """
+
+    def __init__(self, channel_name='bot-logs', flush_interval=2.0, max_length=2000, max_pending=2000):
+        self.channel_name = channel_name
+        self.flush_interval = flush_interval
+        self.max_length = max_length
+        self.max_pending = max_pending
+
+        self._bot = None
+        self._channels = {}
+        self._pending = []
+        self._dropped = 0
+        self._task = None
+
+    def resolve(self, guild):
+        """Look up the log channel of a guild and cache its ID
+
+        Args:
+            guild (discord.Guild): The guild to search
+        """
+
+        for channel in guild.text_channels:
+            if channel.name == self.channel_name:
+                self._channels[guild.id] = channel.id
+                return
+        self._channels.pop(guild.id, None)
+
+    def forget(self, guild):
+        """Drop the cached log channel of a guild the bot has left
+
+        Args:
+            guild (discord.Guild): The guild that was left
+        """
+
+        self._channels.pop(guild.id, None)
+
+    def channel_created(self, channel):
+        """Cache a newly created log channel
+
+        Args:
+            channel (discord.abc.GuildChannel): The created channel
+        """
+
+        if isinstance(channel, discord.TextChannel) and channel.name == self.channel_name:
+            self._channels.setdefault(channel.guild.id, channel.id)
+
+    def channel_deleted(self, channel):
+        """Forget a deleted log channel, falling back to another channel with the same name if one exists
+
+        Args:
+            channel (discord.abc.GuildChannel): The deleted channel
+        """
+
+        if self._channels.get(channel.guild.id) == channel.id:
+            self.resolve(channel.guild)
+
+    def channel_updated(self, before, after):
+        """Track log channels being renamed to or away from the log channel name
+
+        Args:
+            before (discord.abc.GuildChannel): The channel before the update
+            after (discord.abc.GuildChannel): The channel after the update
+        """
+
+        if before.name != after.name and self.channel_name in (before.name, after.name):
+            self.resolve(after.guild)
+
+    def write(self, line):
+        """Queue a line to be sent to every log channel
+
+        Args:
+            line (str): The line to send
+        """
+
+        self._pending.append(line)
+        if len(self._pending) > self.max_pending:
+            overflow = len(self._pending) - self.max_pending
+            del self._pending[:overflow]
+            self._dropped += overflow
+
+    def write_records(self, records):
+        """Queue the text of each record
+
+        Args:
+            records (List[dict]): The records to send
+        """
+
+        for record in records:
+            self.write(record['message'])
+
+    async def handle(self, records):
+        """Pipeline sink entry point
+
+        Args:
+            records (List[dict]): The records to send
+        """
+
+        self.write_records(records)
+
+    def start(self, bot):
+        """Start the background send task on the running event loop if it is not already running
+        Resolves the log channel of every guild the bot is in the first time it is called.
+
+        Args:
+            bot (discord.ext.commands.bot.Bot): The bot object
+        """
+
+        if self._bot is None:
+            self._bot = bot
+            for guild in bot.guilds:
+                self.resolve(guild)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Send queued lines every `flush_interval` seconds"""
+
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Send all queued lines to every cached log channel"""
+
+        if not self._pending or self._bot is None:
+            return
+
+        lines = self._pending
+        self._pending = []
+        if self._dropped:
+            lines.insert(0, f'({self._dropped} log lines dropped)')
+            self._dropped = 0
+
+        messages = pack_lines(lines, self.max_length)
+        for channel_id in list(self._channels.values()):
+            channel = self._bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            for message in messages:
+                try:
+                    await channel.send(message)
+                except discord.errors.HTTPException:
+                    pass
+
+
+def pack_lines(lines, max_length=2000):
+    """Pack lines into as few messages as possible
+    Lines are joined with newlines until the next one would push the message past `max_length`. Lines
+    longer than `max_length` are split across messages. Messages with no visible content are dropped
+    since Discord rejects them.
+
+    Args:
+        lines (List[str]): The lines to pack
+        max_length (int): Maximum number of characters per message
+
+    Returns:
+        messages (List[str]): The packed messages
+    """
+
+    messages = []
+    current = ''
+
+    for line in lines:
+        # Split oversized lines into chunks that each fit in a message
+        chunks = [line[i:i + max_length] for i in range(0, len(line), max_length)] or ['']
+
+        for chunk in chunks:
+            if not current:
+                current = chunk
+            elif len(current) + 1 + len(chunk) <= max_length:
+                current += '\n' + chunk
+            else:
+                messages.append(current)
+                current = chunk
+
+    messages.append(current)
+    return [message for message in messages if message.strip()]
+
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+
+def format_record(record):
+    """Render a log record as a human readable line
+
+    Args:
+        record (dict): The record to render
+
+    Returns:
+        line (str): The record's message, prefixed with its timestamp unless the record opted out
+    """
+
+    if not record.get('stamped', True):
+        return ' ' + record['message']
+    return f"[{record['time']}] {record['message']}"
+
+
+class StdoutSink:
+    """Pipeline sink that prints records to stdout"""
+
+    def write_records(self, records):
+        """Print records
+
+        Args:
+            records (List[dict]): The records to print
+        """
+
+        for record in records:
+            print(format_record(record))
+
+    async def handle(self, records):
+        """Pipeline sink entry point
+
+        Args:
+            records (List[dict]): The records to print
+        """
+
+        self.write_records(records)
+
+
+class LogPipeline:
+    """Non-blocking, structured log pipeline
+    Records are put on a bounded in-memory queue and a background task drains the queue into each sink.
+    Emitting never waits on I/O and is safe to call from worker threads. When the queue is full the
+    overflow policy decides which record is lost: 'drop_oldest' discards the oldest queued record,
+    'drop_newest' discards the record being emitted. Dropped records are counted and reported with a
+    warning once the queue drains.
+
+    Args:
+        max_queue (int): Maximum number of queued records
+        overflow (str): Overflow policy, either 'drop_oldest' or 'drop_newest'
+    """
+
+    def __init__(self, max_queue=10000, overflow='drop_oldest'):
+        if overflow not in ('drop_oldest', 'drop_newest'):
+            raise ValueError(f'Unknown overflow policy {overflow}')
+
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.dropped = 0
+
+        self._queue = collections.deque()
+        self._sinks = []
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def add_sink(self, sink, level='INFO'):
+        """Register a sink to receive records at or above a level
+
+        Args:
+            sink: An object with an async `handle(records)` method, and optionally `write_records(records)`
+                to receive records synchronously at shutdown
+            level (str): Minimum level of records passed to the sink
+        """
+
+        self._sinks.append((LEVELS[level], sink))
+
+    def emit(self, message, level='INFO', stamped=True, **fields):
+        """Queue a structured log record
+
+        Args:
+            message (str): The log message
+            level (str): One of DEBUG, INFO, WARNING or ERROR
+            stamped (bool): Whether human readable output includes the timestamp
+            **fields: Extra structured fields such as cog, command, user and guild
+        """
+
+        now = datetime.datetime.now()
+        record = {
+            'time': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'ts': now.timestamp(),
+            'level': level,
+            'message': message,
+        }
+        record.update({key: value for key, value in fields.items() if value is not None})
+        if not stamped:
+            record['stamped'] = False
+
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            if self.overflow == 'drop_newest':
+                return
+            self._queue.popleft()
+        self._queue.append(record)
+
+        # Wake the consumer, which is only safe to do directly from the loop's own thread
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+
+            if running is self._loop:
+                self._wakeup.set()
+            else:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    @property
+    def running(self):
+        """Whether the consumer task is running on an event loop"""
+
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the consumer task on the running event loop if it is not already running"""
+
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._consume())
+            if self._queue:
+                self._wakeup.set()
+
+    async def _consume(self):
+        """Wait for records and drain them into the sinks"""
+
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.drain()
+
+    def _take(self):
+        """Remove every queued record, adding a warning if any were dropped
+
+        Returns:
+            records (List[dict]): The queued records, oldest first
+        """
+
+        records = []
+        while self._queue:
+            records.append(self._queue.popleft())
+
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            records.append({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'ts': time.time(), 'level': 'WARNING',
+                            'message': f'{dropped} log records were dropped because the log queue was full'})
+        return records
+
+    async def drain(self):
+        """Pass every queued record to the sinks that accept its level"""
+
+        records = self._take()
+        if not records:
+            return
+
+        for threshold, sink in self._sinks:
+            batch = [record for record in records if LEVELS.get(record['level'], 0) >= threshold]
+            if not batch:
+                continue
+            try:
+                await sink.handle(batch)
+            except Exception as e:
+                print(f'Log sink {type(sink).__name__} failed: {e}', file=sys.stderr)
+
+    def write_now(self):
+        """Synchronously write out queued records to sinks that support it, for when no consumer is running"""
+
+        records = self._take()
+        for threshold, sink in self._sinks:
+            batch = [record for record in records if LEVELS.get(record['level'], 0) >= threshold]
+            if batch and hasattr(sink, 'write_records'):
+                sink.write_records(batch)
+
+    def close(self):
+        """Stop the consumer and synchronously write out queued records to sinks that support it"""
+
+        if self._task is not None and not self._task.done() and not self._loop.is_closed():
+            self._task.cancel()
+        self._task = None
+
+        self.write_now()
+        for threshold, sink in self._sinks:
+            if hasattr(sink, 'close'):
+                sink.close()
+
+
+pipeline = LogPipeline()
+
+
+def emit(message, level='INFO', **fields):
+    """Queue a structured log record on the shared pipeline without waiting on any I/O
+
+    Args:
+        message (str): The log message
+        level (str): One of DEBUG, INFO, WARNING or ERROR
+        **fields: Extra structured fields such as cog, command, user and guild
+    """
+
+    pipeline.emit(message, level, **fields)
+
+
+class LogIndex:
+    """Full-text index of log records backed by SQLite FTS5
+    Records are inserted in batches as the pipeline drains, so searches never need to scan the log file.
+    Records older than `retention_days` are pruned when the index is opened. A newly created index is
+    backfilled from the JSON lines in the log file and its compressed segments.
+
+    Args:
+        path (str): Path of the index database
+        log_path (str): Path of the active log file, used for the initial backfill
+        retention_days (int): Number of days of records to keep
+    """
+
+    def __init__(self, path='log_index.db', log_path='log', retention_days=365):
+        self.path = path
+        self.log_path = log_path
+        self.retention_days = retention_days
+
+        self._conn = None
+        self._needs_backfill = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the index, creating it if it does not exist yet
+
+        Returns:
+            conn (sqlite3.Connection): The open connection
+        """
+
+        if self._conn is not None:
+            return self._conn
+
+        created = not os.path.exists(self.path)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records(
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                level TEXT,
+                cog TEXT,
+                command TEXT,
+                user TEXT,
+                user_id INTEGER,
+                guild_id INTEGER,
+                message TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_records_ts ON records(ts);
+            CREATE INDEX IF NOT EXISTS idx_records_user ON records(user_id, ts);
+            CREATE INDEX IF NOT EXISTS idx_records_cog ON records(cog, ts);
+            CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(message, content='records', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS records_ai AFTER INSERT ON records BEGIN
+                INSERT INTO records_fts(rowid, message) VALUES (new.id, new.message);
+            END;
+            CREATE TRIGGER IF NOT EXISTS records_ad AFTER DELETE ON records BEGIN
+                INSERT INTO records_fts(records_fts, rowid, message) VALUES ('delete', old.id, old.message);
+            END;
+        """)
+        self._conn = conn
+        self._needs_backfill = created
+
+        cutoff = time.time() - self.retention_days * 24 * 60 * 60
+        with conn:
+            conn.execute('DELETE FROM records WHERE ts < ?', (cutoff,))
+        return conn
+
+    def _backfill(self, before):
+        """Index the JSON lines of the log file and its compressed segments, oldest first
+
+        Args:
+            before (float): Only records older than this epoch time are indexed, newer ones are being
+                indexed by the pipeline already
+        """
+
+        directory = os.path.dirname(self.log_path) or '.'
+        prefix = os.path.basename(self.log_path) + '.'
+        paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                       if name.startswith(prefix) and name.endswith('.gz'))
+        paths.append(self.log_path)
+
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+
+            opener = gzip.open if path.endswith('.gz') else open
+            records = []
+            with opener(path, mode='rt') as f:
+                for line in f:
+                    # Lines written before the log file switched to JSON are skipped
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict) and record.get('ts', before) < before:
+                        records.append(record)
+            self._insert(records)
+
+    def _insert(self, records):
+        """Insert records into the index in a single transaction
+
+        Args:
+            records (List[dict]): The records to insert
+        """
+
+        rows = [(record['ts'], record.get('level'), record.get('cog'), record.get('command'), record.get('user'),
+                 record.get('user_id'), record.get('guild_id'), record.get('message')) for record in records]
+        with self._conn:
+            self._conn.executemany("""INSERT INTO records(ts, level, cog, command, user, user_id, guild_id, message)
+                                      VALUES(?,?,?,?,?,?,?,?)""", rows)
+
+    def write_records(self, records):
+        """Add records to the index
+
+        Args:
+            records (List[dict]): The records to add
+        """
+
+        with self._lock:
+            self._connect()
+            if self._needs_backfill:
+                self._needs_backfill = False
+                self._backfill(min(record['ts'] for record in records))
+            self._insert(records)
+
+    async def handle(self, records):
+        """Pipeline sink entry point, indexes records from a worker thread
+
+        Args:
+            records (List[dict]): The records to add
+        """
+
+        await asyncio.to_thread(self.write_records, records)
+
+    def search(self, text=None, user_id=None, cog=None, start=None, end=None, limit=20):
+        """Find the most recent records matching every given filter
+
+        Args:
+            text (str): Words that must all appear in the message
+            user_id (int): ID of the user that triggered the record
+            cog (str): Name of the cog that emitted the record
+            start (float): Earliest epoch time to include
+            end (float): Latest epoch time to include
+            limit (int): Maximum number of records to return
+
+        Returns:
+            records (List[tuple]): (ts, level, cog, command, user, message) rows, newest first
+        """
+
+        query = 'SELECT r.ts, r.level, r.cog, r.command, r.user, r.message FROM records r'
+        conditions = []
+        params = []
+
+        if text:
+            # Quote every word so user input can't be parsed as FTS5 query syntax
+            words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+            query += ' JOIN records_fts ON records_fts.rowid = r.id'
+            conditions.append('records_fts MATCH ?')
+            params.append(' '.join(words))
+        if user_id is not None:
+            conditions.append('r.user_id = ?')
+            params.append(user_id)
+        if cog:
+            conditions.append('r.cog = ?')
+            params.append(cog)
+        if start is not None:
+            conditions.append('r.ts >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('r.ts <= ?')
+            params.append(end)
+
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY r.ts DESC LIMIT ?'
+        params.append(limit)
+
+        with self._lock:
+            return self._connect().execute(query, params).fetchall()
+
+    def close(self):
+        """Close the index connection"""
+
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+
+class MemberResolver:
+    """Resolves guild members by ID without refetching the member list
+    Members missing from the cache are requested with a single targeted gateway query. Concurrent lookups
+    of the same member share one query, and users that are not in the guild are remembered for
+    `negative_ttl` seconds so repeated lookups of departed users cost nothing.
+
+    Args:
+        negative_ttl (float): Seconds to remember that a user is not in a guild
+        max_negative (int): Number of remembered misses that triggers a sweep of expired entries
+    """
+
+    def __init__(self, negative_ttl=10 * 60, max_negative=1000):
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+
+        self._negative = {}
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.coalesced = 0
+
+    async def resolve(self, guild, member_id):
+        """Return a member of a guild by ID
+
+        Args:
+            guild (discord.Guild): The guild to search
+            member_id (int): ID of the member
+
+        Returns:
+            member (discord.Member): The member, or None if the user is not in the guild
+        """
+
+        member_id = int(member_id)
+        member = guild.get_member(member_id)
+        if member is not None:
+            self.hits += 1
+            return member
+
+        key = (guild.id, member_id)
+        expires = self._negative.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.negative_hits += 1
+                return None
+            del self._negative[key]
+
+        # Share a query that is already in flight for this member
+        task = self._pending.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._query(guild, member_id))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _query(self, guild, member_id):
+        """Ask the gateway for one member, remembering the miss if they are not in the guild
+
+        Args:
+            guild (discord.Guild): The guild to search
+            member_id (int): ID of the member
+
+        Returns:
+            member (discord.Member): The member, or None if the user is not in the guild
+        """
+
+        members = await guild.query_members(user_ids=[member_id], limit=1, cache=True)
+        if members:
+            return members[0]
+
+        if len(self._negative) >= self.max_negative:
+            now = time.monotonic()
+            self._negative = {key: expires for key, expires in self._negative.items() if expires > now}
+        self._negative[(guild.id, member_id)] = time.monotonic() + self.negative_ttl
+        return None
+
+    def member_joined(self, member):
+        """Forget a remembered miss for a user that has joined a guild
+
+        Args:
+            member (discord.Member): The member that joined
+        """
+
+        self._negative.pop((member.guild.id, member.id), None)
+
+    def summary(self):
+        """Summarize the lookup counters
+
+        Returns:
+            summary (str): The counters as a single line
+        """
+
+        return (f'Member lookups: {self.hits} cached, {self.misses} queried, {self.coalesced} shared, '
+                f'{self.negative_hits} known absent')
+
+
+member_resolver = MemberResolver()
@@ -0,0 +1,163 @@
+import csv
+import datetime
+import io
+
+import discord
+
+from utils.utils import get_last_pay_period_monday
+
+
+def pay_period_calendar(start, end):
+    """List the full pay periods that overlap a time range
+    Each period starts on the Monday that `get_last_pay_period_monday` gives for the days inside it, and ends
+    where the next one starts.
+
+    Args:
+        start (float): Epoch time the range starts at
+        end (float): Epoch time the range ends at
+
+    Returns:
+        periods (List[Tuple[float, float]]): (start, end) epoch times of each period, in order
+    """
+
+    first_day = datetime.datetime.fromtimestamp(start).date()
+    last_day = datetime.datetime.fromtimestamp(end).date()
+
+    # Every Monday in the range, and the two after it, maps to the start of its pay period
+    mondays = set()
+    day = first_day - datetime.timedelta(days=first_day.weekday())
+    while day <= last_day + datetime.timedelta(weeks=2):
+        mondays.add(get_last_pay_period_monday(datetime.datetime.combine(day, datetime.time()).timestamp()))
+        day += datetime.timedelta(weeks=1)
+
+    starts = [datetime.datetime.combine(monday, datetime.time()).timestamp() for monday in sorted(mondays)]
+    return [(period_start, period_end) for period_start, period_end in zip(starts, starts[1:]) if period_start < end]
+
+
+def pay_periods(start, end):
+    """Split a time range into the pay periods that overlap it, clipping the first and last to the range
+
+    Args:
+        start (float): Epoch time the range starts at
+        end (float): Epoch time the range ends at
+
+    Returns:
+        periods (List[Tuple[float, float]]): (start, end) epoch times of each period, in order
+    """
+
+    periods = []
+    for period_start, period_end in pay_period_calendar(start, end):
+        period_start, period_end = max(period_start, start), min(period_end, end)
+        if period_start < period_end:
+            periods.append((period_start, period_end))
+    return periods
+
+
+def format_hours(seconds):
+    """Format a duration as hours and minutes, without wrapping at a day
+
+    Args:
+        seconds (float): The duration
+
+    Returns:
+        duration (str): The duration as `#h ##m`
+    """
+
+    minutes = int(round(seconds / 60))
+    return f'{minutes // 60}h {minutes % 60:02d}m'
+
+
+def _date(epoch):
+    """Format an epoch time as a date"""
+
+    return datetime.datetime.fromtimestamp(epoch).strftime('%m-%d-%Y')
+
+
+class TimesheetReport:
+    """Per-user and per-pay-period totals for a set of users, built from the rows of `get_role_report`
+
+    Args:
+        rows (list): Rows returned by `db_utils.get_role_report`
+        names (dict): Display name of every user to report on by Discord ID, including users without rows
+        periods (List[Tuple[float, float]]): The pay periods the rows were grouped by
+        title (str): Title of the report
+    """
+
+    def __init__(self, rows, names, periods, title):
+        self.periods = periods
+        self.title = title
+        self.start = periods[0][0]
+        self.end = periods[-1][1]
+
+        self.users = {}
+        for discord_id, name in sorted(names.items(), key=lambda item: item[1].lower()):
+            self.users[discord_id] = {'name': name, 'sessions': 0, 'total_time': 0.0, 'pomodoros': 0,
+                                      'completed': 0, 'help_requests': 0, 'periods': {}}
+
+        for discord_id, period_start, sessions, total_time, pomodoros, completed, help_requests in rows:
+            user = self.users.get(discord_id)
+            if user is None:
+                continue
+            user['periods'][period_start] = (sessions, total_time, pomodoros, completed, help_requests)
+            user['sessions'] += sessions
+            user['total_time'] += total_time
+            user['pomodoros'] += pomodoros
+            user['completed'] += completed
+            user['help_requests'] += help_requests
+
+    def embeds(self):
+        """Render the report as embeds, one field per user and at most 25 users per embed
+
+        Returns:
+            embeds (List[discord.Embed]): The report
+        """
+
+        total = sum(user['total_time'] for user in self.users.values())
+        description = f'{_date(self.start)} to {_date(self.end - 1)}\nTotal: **{format_hours(total)}**'
+
+        users = list(self.users.values())
+        embeds = []
+        for i in range(0, max(len(users), 1), 25):
+            embed = discord.Embed(title=self.title if i == 0 else f'{self.title} (continued)',
+                                  description=description if i == 0 else None, color=0x00ff00)
+            for user in users[i:i + 25]:
+                embed.add_field(name=user['name'], value=self._user_summary(user), inline=False)
+            embeds.append(embed)
+        return embeds
+
+    def _user_summary(self, user):
+        """Summarize one user's totals, with a line for each pay period they worked in"""
+
+        lines = [f"**{format_hours(user['total_time'])}** over {user['sessions']} check-ins, "
+                 f"{user['completed']}/{user['pomodoros']} pomodoros completed, {user['help_requests']} help requests"]
+        if len(self.periods) > 1:
+            for period_start, period_end in self.periods:
+                period = user['periods'].get(period_start)
+                if period is not None:
+                    lines.append(f'{_date(period_start)}: {format_hours(period[1])}')
+
+        # Embed field values are limited to 1024 characters
+        summary = '\n'.join(lines)
+        return summary if len(summary) <= 1024 else summary[:1021] + '...'
+
+    def csv_file(self, filename='report.csv'):
+        """Render the report as a CSV attachment with a row for every user and pay period
+
+        Args:
+            filename (str): Name of the attachment
+
+        Returns:
+            file (discord.File): The report
+        """
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['discord_id', 'name', 'period_start', 'period_end', 'check_ins', 'hours', 'pomodoros',
+                         'completed_pomodoros', 'help_requests'])
+        for discord_id, user in self.users.items():
+            for period_start, period_end in self.periods:
+                sessions, total_time, pomodoros, completed, help_requests = user['periods'].get(period_start, (0, 0.0, 0, 0, 0))
+                writer.writerow([discord_id, user['name'], _date(period_start), _date(period_end - 1), sessions,
+                                 round(total_time / 3600, 2), pomodoros, completed, help_requests])
+
+        return discord.File(io.BytesIO(buffer.getvalue().encode()), filename=filename)
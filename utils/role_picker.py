@@ -0,0 +1,238 @@
+import os
+import re
+import time
+
+import discord
+import pandas as pd
+
+from utils.guild_index import guild_index
+
+
+class PickerSession:
+    """The courses a member is picking from and what they have picked so far
+
+    Args:
+        courses (List[Tuple[int, str, str]]): Role ID, label and description of each course
+        current (Set[int]): IDs of the course roles the member had when the picker was opened
+    """
+
+    __slots__ = ('courses', 'current', 'picked', 'page', 'opened')
+
+    def __init__(self, courses, current):
+        self.courses = courses
+        self.current = current
+        self.picked = set(current)
+        self.page = 0
+        self.opened = time.monotonic()
+
+
+class RolePicker:
+    """Select menu picker for the course roles of one prefix, such as CS or EE
+    A member opens the picker from the button in a class selection channel and gets an ephemeral message with
+    their current course roles preselected. Picks are only kept in memory while they browse the pages, so
+    changing a select costs the interaction response and nothing else, and saving applies every added and
+    removed role in a single member edit instead of a REST call per course.
+
+    Courses are read from the guild's role list, the same CSV the role menus are built from, and cached until
+    the file changes. Each page has up to four selects of 25 courses, leaving the last row for the buttons.
+
+    Args:
+        path (str): Path of a guild's role list, formatted with its `guild_id`
+        ttl (float): Seconds after which an untouched picker is forgotten
+    """
+
+    OPTIONS = 25
+    SELECTS = 4
+
+    def __init__(self, path='role_lists/roles_{guild_id}.csv', ttl=900.0):
+        self.path = path
+        self.ttl = ttl
+
+        self._courses = {}
+        self._sessions = {}
+
+    def courses(self, guild, prefix):
+        """Get the courses of a prefix that have a role in the guild
+
+        Args:
+            guild (discord.Guild): The guild
+            prefix (str): Course prefix, such as 'CS'
+
+        Returns:
+            courses (List[Tuple[int, str, str]]): Role ID, label and description of each course, one per role
+        """
+
+        path = self.path.format(guild_id=guild.id)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return []
+
+        cached = self._courses.get((path, prefix))
+        if cached is None or cached[0] != mtime:
+            courses_df = pd.read_csv(path)
+            rows = [(str(text), str(long_name), str(role_name))
+                    for text, long_name, role_name in zip(courses_df["text"], courses_df["long_name"], courses_df["role/link"])
+                    if re.match(prefix, str(text))]
+            cached = self._courses[(path, prefix)] = (mtime, rows)
+
+        # Roles are looked up on every call so renamed, added and deleted roles are picked up without a reload.
+        # Cross-listed courses share a role, which is only offered once
+        courses = []
+        seen = set()
+        for text, long_name, role_name in cached[1]:
+            role = guild_index.role(guild, role_name)
+            if role is None or role.id in seen:
+                continue
+            seen.add(role.id)
+            courses.append((role.id, text[:100], long_name[:100]))
+        return courses
+
+    def open(self, member, prefix):
+        """Start picking the course roles of a prefix, forgetting the member's previous picks
+
+        Args:
+            member (discord.Member): The member picking
+            prefix (str): Course prefix
+
+        Returns:
+            session (PickerSession): The new picks, starting from the member's current course roles
+        """
+
+        now = time.monotonic()
+        for key in [key for key, session in self._sessions.items() if now - session.opened > self.ttl]:
+            del self._sessions[key]
+
+        courses = self.courses(member.guild, prefix)
+        course_ids = {role_id for role_id, _, _ in courses}
+        session = PickerSession(courses, {role.id for role in member.roles if role.id in course_ids})
+        self._sessions[(member.id, prefix)] = session
+        return session
+
+    def session(self, member, prefix):
+        """Get the member's picks, reopening the picker if they were forgotten, e.g. after a restart
+
+        Args:
+            member (discord.Member): The member picking
+            prefix (str): Course prefix
+
+        Returns:
+            session (PickerSession): The member's picks
+        """
+
+        session = self._sessions.get((member.id, prefix))
+        if session is None:
+            return self.open(member, prefix)
+        session.opened = time.monotonic()
+        return session
+
+    def pick(self, session, page, slot, values):
+        """Replace the picks of one select
+
+        Args:
+            session (PickerSession): The member's picks
+            page (int): Page of the select
+            slot (int): Position of the select on its page
+            values (List[str]): Role IDs picked in the select
+        """
+
+        start = (page * self.SELECTS + slot) * self.OPTIONS
+        offered = {role_id for role_id, _, _ in session.courses[start:start + self.OPTIONS]}
+        session.picked = (session.picked - offered) | {int(value) for value in values if int(value) in offered}
+
+    def pages(self, session):
+        """Number of pages of a picker"""
+
+        per_page = self.SELECTS * self.OPTIONS
+        return max(1, -(-len(session.courses) // per_page))
+
+    def render(self, prefix, session, note=None):
+        """Render the current page of a picker
+
+        Args:
+            prefix (str): Course prefix
+            session (PickerSession): The member's picks
+            note (str): Line to add at the end, such as the result of saving
+
+        Returns:
+            content (str): The member's course roles and the changes they haven't saved
+            view (discord.ui.View): The selects of the page and the buttons
+        """
+
+        if not session.courses:
+            return f"There are no {prefix} courses to pick from.", None
+
+        labels = {role_id: label for role_id, label, _ in session.courses}
+        added = [labels[role_id] for role_id, _, _ in session.courses if role_id in session.picked - session.current]
+        removed = [labels[role_id] for role_id, _, _ in session.courses if role_id in session.current - session.picked]
+        current = [labels[role_id] for role_id, _, _ in session.courses if role_id in session.current]
+
+        pages = self.pages(session)
+        session.page = min(session.page, pages - 1)
+        lines = [f"**{prefix} courses**" + (f" (page {session.page + 1}/{pages})" if pages > 1 else ""),
+                 "Your courses: " + (", ".join(current) if current else "none")]
+        if added:
+            lines.append("To add: " + ", ".join(added))
+        if removed:
+            lines.append("To remove: " + ", ".join(removed))
+        if added or removed:
+            lines.append("Press Save to apply your changes.")
+        if note:
+            lines.append(note)
+        content = "\n".join(lines)
+        if len(content) > 2000:
+            content = content[:1997] + "..."
+
+        view = discord.ui.View(timeout=None)
+        start = session.page * self.SELECTS * self.OPTIONS
+        for slot in range(self.SELECTS):
+            courses = session.courses[start + slot * self.OPTIONS:start + (slot + 1) * self.OPTIONS]
+            if not courses:
+                break
+            options = [discord.SelectOption(label=label, value=str(role_id), description=description or None,
+                                            default=role_id in session.picked)
+                       for role_id, label, description in courses]
+            view.add_item(discord.ui.Select(custom_id=f"roles:pick:{prefix}:{session.page}:{slot}",
+                                            placeholder=f"{courses[0][1]} to {courses[-1][1]}", min_values=0,
+                                            max_values=len(options), options=options, row=slot))
+
+        if pages > 1:
+            view.add_item(discord.ui.Button(label="Previous", style=discord.ButtonStyle.gray, row=self.SELECTS,
+                                            custom_id=f"roles:page:{prefix}:{session.page - 1}",
+                                            disabled=session.page == 0))
+            view.add_item(discord.ui.Button(label="Next", style=discord.ButtonStyle.gray, row=self.SELECTS,
+                                            custom_id=f"roles:page:{prefix}:{session.page + 1}",
+                                            disabled=session.page == pages - 1))
+        view.add_item(discord.ui.Button(label="Save", style=discord.ButtonStyle.green, row=self.SELECTS,
+                                        custom_id=f"roles:save:{prefix}", disabled=not (added or removed)))
+        return content, view
+
+    async def save(self, member, prefix, session):
+        """Apply the member's picks in a single member edit
+
+        Args:
+            member (discord.Member): The member picking
+            prefix (str): Course prefix
+            session (PickerSession): The member's picks
+
+        Returns:
+            added (int): Number of course roles given
+            removed (int): Number of course roles taken
+        """
+
+        course_ids = {role_id for role_id, _, _ in session.courses}
+        have = {role.id for role in member.roles if role.id in course_ids}
+        added = session.picked - have
+        removed = have - session.picked
+
+        if added or removed:
+            # Every role that isn't one of these courses is kept, except @everyone which can't be sent
+            roles = [role for role in member.roles[1:] if role.id not in removed]
+            roles += [discord.Object(id=role_id) for role_id in added]
+            await member.edit(roles=roles, reason=f"Picked {prefix} courses")
+
+        session.current = set(session.picked)
+        return len(added), len(removed)
+
+
+role_picker = RolePicker()
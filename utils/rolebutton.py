@@ -2,7 +2,8 @@ from validators import url
 
 import discord
 from discord.ui import Button
-from discord.utils import get
+
+from utils.guild_index import guild_index
 
 class RoleButton(Button):
     """Inherits from discord.ui.Button"""
@@ -19,12 +20,12 @@ class RoleButton(Button):
 
     async def on_click(self, interaction:discord.Interaction):
         """Gives role to or removes it from user when a role button is clicked
-        Gets the role from the server using its name
+        Gets the role from the server's name index
         Removes the role from the user if they already have it
         Gives the role to the user if they don't already have it
         """
         
-        role = get(interaction.guild.roles, name=self.role_name)
+        role = guild_index.role(interaction.guild, self.role_name)
         # an interaction.response is necessary for a callback
         if role in interaction.user.roles:
             await interaction.user.remove_roles(role)
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+
+class RolloverJournal:
+    """Journal of the guild mutations made by course builds and teardowns
+    Before a run makes its first API call, every step it is going to take is written to the journal as
+    pending. Each step is marked as started right before its call is made and as done, with the ID of what it
+    created, right after. A run that was interrupted by a restart or errors can then be resumed from its
+    unfinished steps, and a step that was started but never marked done is checked against the guild before
+    it is replayed.
+
+    Steps are grouped by course. Within a course they run in order, and a step's arguments can refer to what an
+    earlier step of the same course created as `{'step': index}`, or to an existing object as `{'id': id}`.
+
+    Starting a run abandons the unfinished runs of the same guild, since every run is planned from the live
+    state of the guild and so already covers whatever an older run left undone.
+
+    Args:
+        path (str): Path of the journal database
+    """
+
+    def __init__(self, path='rollover_journal.db'):
+        self.path = path
+
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the journal, creating it if it does not exist yet
+
+        Returns:
+            conn (sqlite3.Connection): The open connection
+        """
+
+        if self._conn is not None:
+            return self._conn
+
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rollover_run(
+                run_id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                started REAL NOT NULL,
+                finished REAL
+            );
+            CREATE INDEX IF NOT EXISTS rollover_run_unfinished ON rollover_run(guild_id) WHERE status = 'running';
+            CREATE TABLE IF NOT EXISTS rollover_step(
+                step_id INTEGER PRIMARY KEY,
+                run_id INTEGER NOT NULL REFERENCES rollover_run(run_id),
+                course_seq INTEGER NOT NULL,
+                step_seq INTEGER NOT NULL,
+                course TEXT NOT NULL,
+                action TEXT NOT NULL,
+                args TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                result_id INTEGER,
+                error TEXT,
+                updated REAL,
+                UNIQUE (run_id, course_seq, step_seq)
+            );
+        """)
+        self._conn = conn
+        return conn
+
+    async def _run(self, func, *args):
+        """Run a journal function on a worker thread, one at a time"""
+
+        def locked():
+            with self._lock:
+                return func(self._connect(), *args)
+        return await asyncio.to_thread(locked)
+
+    async def start(self, guild_id, kind, courses):
+        """Journal a new run and all of its steps
+
+        Args:
+            guild_id (int): ID of the guild the run changes
+            kind (str): What the run does, such as 'build' or 'destroy'
+            courses (List[Tuple[str, List[Tuple[str, dict]]]]): Name of each course and its (action, args) steps
+
+        Returns:
+            run_id (int): ID of the run
+        """
+
+        def start(conn):
+            with conn:
+                now = time.time()
+                conn.execute("""UPDATE rollover_run SET status = 'abandoned', finished = ?
+                                WHERE guild_id = ? AND status = 'running'""", (now, guild_id))
+                run_id = conn.execute("""INSERT INTO rollover_run(guild_id, kind, started) VALUES(?,?,?)""",
+                                      (guild_id, kind, now)).lastrowid
+                conn.executemany("""INSERT INTO rollover_step(run_id, course_seq, step_seq, course, action, args)
+                                    VALUES(?,?,?,?,?,?)""",
+                                 [(run_id, course_seq, step_seq, course, action, json.dumps(args))
+                                  for course_seq, (course, steps) in enumerate(courses)
+                                  for step_seq, (action, args) in enumerate(steps)])
+            return run_id
+        return await self._run(start)
+
+    async def unfinished(self, guild_id):
+        """Find the run of a guild that hasn't finished
+
+        Args:
+            guild_id (int): ID of the guild
+
+        Returns:
+            run (Tuple[int, str, float, int, int]): (run_id, kind, started, unfinished steps, total steps), or None
+        """
+
+        def unfinished(conn):
+            return conn.execute("""SELECT rollover_run.run_id, kind, started,
+                                          SUM(rollover_step.status != 'done'), COUNT(rollover_step.step_id)
+                                   FROM rollover_run JOIN rollover_step ON rollover_step.run_id = rollover_run.run_id
+                                   WHERE guild_id = ? AND rollover_run.status = 'running'
+                                   GROUP BY rollover_run.run_id ORDER BY rollover_run.run_id DESC LIMIT 1""",
+                                (guild_id,)).fetchone()
+        return await self._run(unfinished)
+
+    async def steps(self, run_id):
+        """Get every step of a run
+
+        Args:
+            run_id (int): ID of the run
+
+        Returns:
+            steps (list): (step_id, course_seq, step_seq, course, action, args, status, result_id) of each step, in order
+        """
+
+        def steps(conn):
+            rows = conn.execute("""SELECT step_id, course_seq, step_seq, course, action, args, status, result_id
+                                   FROM rollover_step WHERE run_id = ? ORDER BY course_seq, step_seq""",
+                                (run_id,)).fetchall()
+            return [row[:5] + (json.loads(row[5]),) + row[6:] for row in rows]
+        return await self._run(steps)
+
+    async def mark(self, step_id, status, result_id=None, error=None):
+        """Record the progress of a step
+
+        Args:
+            step_id (int): ID of the step
+            status (str): 'started' right before its call is made, then 'done' or 'failed'
+            result_id (int): ID of what the step created
+            error (str): Why the step failed
+        """
+
+        def mark(conn):
+            with conn:
+                conn.execute("""UPDATE rollover_step SET status = ?, result_id = ?, error = ?, updated = ?
+                                WHERE step_id = ?""", (status, result_id, error, time.time(), step_id))
+        await self._run(mark)
+
+    async def finish(self, run_id):
+        """Mark a run as finished if all of its steps are done
+
+        Args:
+            run_id (int): ID of the run
+
+        Returns:
+            remaining (int): Number of steps that are not done, in which case the run stays resumable
+        """
+
+        def finish(conn):
+            with conn:
+                remaining = conn.execute("""SELECT COUNT(*) FROM rollover_step WHERE run_id = ? AND status != 'done'""",
+                                         (run_id,)).fetchone()[0]
+                if not remaining:
+                    conn.execute("""UPDATE rollover_run SET status = 'finished', finished = ? WHERE run_id = ?""",
+                                 (time.time(), run_id))
+            return remaining
+        return await self._run(finish)
+
+
+rollover_journal = RolloverJournal()
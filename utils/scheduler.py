@@ -0,0 +1,104 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from utils.log_utils import emit
+
+
+class DeadlineScheduler:
+    """Runs coroutines at wall-clock deadlines
+    Deadlines are kept in a heap and a single task sleeps until the earliest one, so nothing runs while
+    there is nothing due. Every deadline has a key; scheduling a key again replaces its deadline, and
+    cancelling it drops the deadline without touching the heap, which skips it when it comes up.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._sequence = itertools.count()
+        self._changed = asyncio.Event()
+        self._task = None
+        self._running = set()
+
+    def start(self):
+        """Start the task that waits for deadlines, if it isn't running yet"""
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def schedule(self, key, when, callback, *args):
+        """Run a coroutine function at a deadline, replacing any deadline already scheduled under the key
+
+        Args:
+            key (Hashable): Identifies the deadline, used to replace or cancel it
+            when (float): Epoch time to run the callback at. Past deadlines run right away
+            callback (Callable[..., Awaitable]): Coroutine function to run
+            *args: Arguments for the callback
+        """
+
+        self.cancel(key)
+        entry = [when, next(self._sequence), key, callback, args]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._changed.set()
+
+    def cancel(self, key):
+        """Drop the deadline scheduled under a key, if there is one
+
+        Args:
+            key (Hashable): Identifies the deadline
+        """
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[3] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def _run(self):
+        """Sleep until the earliest deadline and run everything that is due, forever"""
+
+        while True:
+            # Drop cancelled and replaced entries from the top of the heap
+            while self._heap and self._heap[0][3] is None:
+                heapq.heappop(self._heap)
+
+            self._changed.clear()
+            if not self._heap:
+                await self._changed.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            when, _, key, callback, args = heapq.heappop(self._heap)
+            del self._entries[key]
+            task = asyncio.get_running_loop().create_task(self._fire(key, callback, args))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    @staticmethod
+    async def _fire(key, callback, args):
+        """Run a callback, logging instead of raising if it fails"""
+
+        try:
+            await callback(*args)
+        except Exception as e:
+            emit(f'Scheduled task {key} failed because {e}', level='ERROR', cog='scheduler')
+
+    def close(self):
+        """Stop waiting for deadlines and drop every scheduled one"""
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._heap.clear()
+        self._entries.clear()
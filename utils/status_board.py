@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+
+import aiofiles
+import discord
+
+from utils.guild_index import guild_index
+from utils.log_utils import emit
+
+
+class StatusBoard:
+    """The CSE Development Team Status board in the checkin channel
+    The roster is kept as structured state, in the order members first appeared, and the board is rendered
+    from it. Changes are coalesced for `delay` seconds, so a burst of check-ins costs one edit per page
+    instead of a history fetch and an edit per click, and only pages whose text changed are edited. The
+    board's guild, channel and message IDs are cached and saved to `path` along with the roster, so the
+    board is found without searching after a restart. Once the roster outgrows one embed description it
+    continues on more messages.
+
+    Args:
+        path (str): JSON file the board's location and roster are saved to
+        delay (float): Seconds to wait for more changes before editing the board
+        guild_names (Tuple[str]): Names of the guilds the board may be in
+        page_length (int): Maximum length of a page's description
+    """
+
+    TITLE = 'CSE Development Team Status'
+    EMOJIS = {
+        "checkin": "🟢",
+        "pomodoro": "🟠",
+        "checkout": "🔴",
+    }
+
+    def __init__(self, path='status_board.json', delay=2.0, guild_names=('WSU CSE-EE Department', 'CSE Testing Server'),
+                 page_length=4000):
+        self.path = path
+        self.delay = delay
+        self.guild_names = guild_names
+        self.page_length = page_length
+
+        self.guild_id = None
+        self.channel_id = None
+        self.message_ids = []
+        # [user_id, display_name, status] in board order. Members adopted from a board written before the
+        # roster was saved have no user ID until they next change status
+        self.roster = []
+        self._rendered = []
+
+        self._loaded = False
+        self._dirty = False
+        self._flush_task = None
+
+    async def update(self, bot, user_id, display_name, status):
+        """Set a member's status and schedule the board to be redrawn
+
+        Args:
+            bot (commands.Bot): a Discord bot object
+            user_id (int): ID of the member
+            display_name (str): Display name of the member
+            status (str): 'checkin', 'pomodoro' or 'checkout'
+        """
+
+        await self._load()
+
+        guild = self._guild(bot)
+        if guild is None:
+            return
+
+        # Only the dev team is shown on the board
+        member = guild.get_member(user_id)
+        role = guild_index.role(guild, "cse-devteam")
+        if member is None or role is None or role not in member.roles:
+            return
+
+        entry = next((entry for entry in self.roster if entry[0] == user_id), None)
+        if entry is None:
+            entry = next((entry for entry in self.roster if entry[0] is None and entry[1] == display_name), None)
+        if entry is None:
+            entry = [user_id, display_name, status]
+            self.roster.append(entry)
+        entry[0], entry[1], entry[2] = user_id, display_name, status
+
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later(bot, guild))
+
+    def _guild(self, bot):
+        """Get the guild the board is in, searching the bot's guilds by name only until one is found"""
+
+        if self.guild_id is not None:
+            guild = bot.get_guild(self.guild_id)
+            if guild is not None:
+                return guild
+
+        for guild in bot.guilds:
+            if any(name in guild.name for name in self.guild_names):
+                if guild.id != self.guild_id:
+                    self.guild_id = guild.id
+                    self.channel_id = None
+                    self.message_ids = []
+                    self._rendered = []
+                return guild
+        return None
+
+    def pages(self):
+        """Render the roster into the descriptions of the board's embeds
+
+        Returns:
+            pages (List[str]): One description per message
+        """
+
+        lines = [f"{name} - {self.EMOJIS.get(status, status)}" for _, name, status in self.roster]
+        pages = []
+        page = []
+        length = 0
+        for line in lines:
+            # Each page is wrapped in a code block, which takes six characters
+            if page and length + len(line) + 1 + 6 > self.page_length:
+                pages.append(page)
+                page, length = [], 0
+            page.append(line)
+            length += len(line) + 1
+        if page or not pages:
+            pages.append(page)
+
+        return ["```" + "\n".join(page) + "```" if page else "No members currently logged in" for page in pages]
+
+    async def _flush_later(self, bot, guild):
+        """Wait for more changes, then redraw the board, again if it changed while it was being redrawn"""
+
+        while self._dirty:
+            await asyncio.sleep(self.delay)
+            self._dirty = False
+            try:
+                await self._flush(bot, guild)
+            except discord.HTTPException as e:
+                emit(f'Could not update the {self.TITLE} board because {e}', level='ERROR', cog='status_board')
+
+    async def _flush(self, bot, guild):
+        """Edit every page whose text changed and send or delete messages as the page count changes"""
+
+        channel = await self._channel(guild)
+        if channel is None:
+            return
+
+        pages = self.pages()
+        message_ids = []
+        for i, description in enumerate(pages):
+            title = self.TITLE if i == 0 else f'{self.TITLE} (continued)'
+            embed = discord.Embed(title=title, description=description)
+            message_id = self.message_ids[i] if i < len(self.message_ids) else None
+
+            if message_id is not None and i < len(self._rendered) and self._rendered[i] == description:
+                message_ids.append(message_id)
+                continue
+
+            if message_id is not None:
+                try:
+                    await channel.get_partial_message(message_id).edit(embed=embed)
+                    message_ids.append(message_id)
+                    continue
+                except discord.NotFound:
+                    pass
+            message_ids.append((await channel.send(embed=embed)).id)
+
+        # Drop pages that are no longer needed
+        for message_id in self.message_ids[len(pages):]:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.NotFound:
+                pass
+
+        self.message_ids = message_ids
+        self._rendered = pages
+        await self._save()
+
+    async def _channel(self, guild):
+        """Get the checkin channel, adopting the board already in it the first time it is found
+
+        Args:
+            guild (discord.Guild): The guild the board is in
+
+        Returns:
+            channel (discord.TextChannel): The checkin channel, or None if there is none
+        """
+
+        channel = guild.get_channel(self.channel_id) if self.channel_id is not None else None
+        if channel is not None:
+            return channel
+
+        channel = guild_index.channel(guild, 'checkin')
+        if channel is None:
+            return None
+        self.channel_id = channel.id
+
+        # Adopt a board sent before its location was saved
+        if not self.message_ids:
+            async for message in channel.history(limit=10, oldest_first=False):
+                if len(message.embeds) == 1 and message.embeds[0].title == self.TITLE:
+                    self.message_ids = [message.id]
+                    self._adopt(message.embeds[0].description or '')
+                    break
+        return channel
+
+    def _adopt(self, description):
+        """Add the members listed on an existing board to the roster"""
+
+        for line in description.replace("```", "").splitlines():
+            name, separator, emoji = line.rpartition(" - ")
+            if not separator:
+                continue
+            status = next((status for status, status_emoji in self.EMOJIS.items() if status_emoji == emoji.strip()), None)
+            if status is not None and not any(entry[1] == name for entry in self.roster):
+                self.roster.append([None, name, status])
+
+    async def _load(self):
+        """Read the saved board location and roster, once"""
+
+        if self._loaded:
+            return
+        self._loaded = True
+
+        if not os.path.exists(self.path):
+            return
+        try:
+            async with aiofiles.open(self.path, mode='r') as f:
+                saved = json.loads(await f.read())
+        except (OSError, ValueError) as e:
+            emit(f'Could not read {self.path} because {e}', level='ERROR', cog='status_board')
+            return
+
+        self.guild_id = saved.get('guild_id')
+        self.channel_id = saved.get('channel_id')
+        self.message_ids = saved.get('message_ids', [])
+        self.roster = saved.get('roster', [])
+        self._rendered = self.pages() if self.message_ids else []
+
+    async def _save(self):
+        """Save the board location and roster"""
+
+        saved = {'guild_id': self.guild_id, 'channel_id': self.channel_id, 'message_ids': self.message_ids,
+                 'roster': self.roster}
+        async with aiofiles.open(self.path, mode='w') as f:
+            await f.write(json.dumps(saved))
+
+
+status_board = StatusBoard()
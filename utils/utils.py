@@ -1,10 +1,33 @@
-import re
+import asyncio
+import atexit
 import datetime
-import aiofiles
 import discord
 from discord.ext import commands
 from bing_image_downloader import downloader
 
+from utils.guild_index import guild_index
+from utils.member_resolver import member_resolver
+from utils.dm_outbox import dm_outbox
+from utils.status_board import status_board
+from utils.interaction_router import router
+from utils.log_utils import LogFile, ChannelLogSink, LogIndex, StdoutSink, pipeline
+
+
+# Append-only JSON-lines log file, flushed on an interval and at exit
+log_file = LogFile('log')
+
+# Batched sender for each guild's bot-logs channel, kept current by the Listeners cog
+channel_log_sink = ChannelLogSink('bot-logs')
+
+# Full-text index of every record, searched by /logsearch
+log_index = LogIndex('log_index.db', log_path='log')
+
+pipeline.add_sink(StdoutSink(), 'INFO')
+pipeline.add_sink(channel_log_sink, 'INFO')
+pipeline.add_sink(log_file, 'DEBUG')
+pipeline.add_sink(log_index, 'DEBUG')
+atexit.register(pipeline.close)
+
 
 async def confirmation(bot, interaction:discord.Interaction, confirm_string='confirm'):
     """Add a layer of security to sensitive commands by adding a confirmation step
@@ -59,13 +82,13 @@ async def download_corgis(bot, interaction, amount):
                         output_dir='dogs',
                         adult_filter_off=False,
                         force_replace=False)
-    await log(bot, f'{interaction.user} ran /downloadcorgis {amount} in #{interaction.channel}')
+    log(bot, f'{interaction.user} ran /downloadcorgis {amount} in #{interaction.channel}', interaction=interaction)
 
 
 async def dm(member, content):
     """Send a direct message to another user.
-    Create a dm channel between the user and intended recipient. Send the desired message from the user to the
-    recipient through the new channel.
+    The message is queued in the DM outbox, which retries it until it is delivered. Before the outbox has been
+    started by the Checkin cog, it is sent right away through a new dm channel instead.
 
     Args:
         member (discord.Member): The member to receive the dm
@@ -75,13 +98,17 @@ async def dm(member, content):
         A message with content `content` to a DM with `member`
     """
 
+    if dm_outbox.db is not None:
+        await dm_outbox.send(member.id, content)
+        return
+
     channel = await member.create_dm()
     await channel.send(content)
 
 
 async def get_channel_named(guild, channel_name):
     """Return a channel for use in other methods
-    Loop through all the channels in the guild. If the channel matches the input channel name, return it.
+    Look up the channel by name in the guild index.
 
     Args:
         channel_name (str): name of the channel being queried.
@@ -90,14 +117,12 @@ async def get_channel_named(guild, channel_name):
         channel (discord.channel.TextChannel): An instance of the channel being quieried
     """
 
-    for channel in guild.channels:
-        if channel.name == channel_name:
-            return channel
+    return guild_index.channel(guild, channel_name)
 
 
 async def get_emoji_named(guild, emoji_name):
     """Return an emoji for use in other methods.
-    Search through all the emojis in the guild. If the name of one mathces the input emoji name, return it.
+    Look up the emoji by name in the guild index.
 
     Args:
         emoji_name (str): name of the emoji being searched for
@@ -106,82 +131,98 @@ async def get_emoji_named(guild, emoji_name):
         emoji (discord.Emoji): an instance of the emoji being quieried for.
     """
 
-    for emoji in guild.emojis:
-        if emoji.name == emoji_name:
-            return emoji
+    return guild_index.emoji(guild, emoji_name)
 
 
 async def get_member(guild, member_id):
     """Return a member for use in other methods
-    Try to get member from the member id passed in to the method. If this doesn't work, search through the list of
-    all members and extract a matching member id. If this doesn't work, refresh member list and return member if the
-    id matches the intended member id. If this doesn't work, return none.
+    Try to get member from the member cache. If this doesn't work, ask the gateway for that one member. Users
+    known to have left the guild are remembered for a while so they are not queried again.
 
     Args:
         member_id (int): id of the member
 
     Returns:
-        member (discord.Member): An instance of the member being called for
+        member (discord.Member): An instance of the member being called for, or None if they are not in the guild
     """
 
-    # Primary method
-    member = guild.get_member(member_id)
-    if member is not None:
-        return member
-
-    # Secondary method
-    for member in guild.members:
-        if str(member.id) == str(member_id):
-            return member
-
-    # If can't find member, refresh member lists and retry
-    async for member in guild.fetch_members():
-        if member.id == member_id:
-            return member
-
-    # If all else fails, return None
-    return None
+    return await member_resolver.resolve(guild, member_id)
 
 
-async def log(bot, string, timestamp=True):
+def log(bot, string, timestamp=True, level='INFO', interaction=None, **fields):
     """Save a record of events occuring within the server
-    Save the current date and time as a string and print it. Loop through guilds in the bot, then for each
-    guild search through all channels. If the channel name is 'bot-logs', send a log message there. Use
-    Aiofiles to open log in read mode, and save previous logs. Use Aiofiles in write mode to append the log
-    message to the document as well as the string.
+    Queue a structured record on the log pipeline and return immediately. A background task prints the
+    record, sends it in batches to each guild's 'bot-logs' channel, and appends it as a JSON line to the
+    rotating log file, so callers never wait on log I/O.
 
     Args:
         bot (discord.ext.commands.bot.Bot): The bot object
         string (str): The message being sent to the log.
         timestamp (bool): Determine whether a timestamp will be given. Automatically set to true.
+        level (str): One of DEBUG, INFO, WARNING or ERROR. Automatically set to INFO.
+        interaction (discord.Interaction): Interaction to take the cog, command, user and guild fields from
+        **fields: Extra structured fields, overriding any taken from `interaction`
     """
 
-    # Log to stdout
-    timestamp_string = ''
-    if timestamp:
-        timestamp_string = f'[{str(datetime.datetime.now())[:-7]}]'
-    print(timestamp_string + ' ' + string)
-
-    # Log to channel
-    for guild in bot.guilds:
-        for channel in guild.text_channels:
-            if channel.name == 'bot-logs':
-                try:
-                    await channel.send(string)
-                except discord.errors.HTTPException as e:
-                    pass
-
-    # Log to file
+    record = {}
+    if interaction is not None:
+        record = {
+            'user': str(interaction.user),
+            'user_id': interaction.user.id,
+            'guild': str(interaction.guild) if interaction.guild is not None else None,
+            'guild_id': interaction.guild_id,
+            'channel': str(interaction.channel),
+        }
+        command = interaction.command
+        if command is not None:
+            record['command'] = command.qualified_name
+            if getattr(command, 'binding', None) is not None:
+                record['cog'] = type(command.binding).__name__
+    record.update(fields)
+    pipeline.emit(string, level, stamped=timestamp, **record)
+
     try:
-        async with aiofiles.open('log', mode='r') as f:
-            previous_logs = await f.readlines()
-    except FileNotFoundError:
-        previous_logs = []
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Called off the event loop, such as from a worker thread or a script. A consumer running on the bot's
+        # loop is woken by emit, otherwise the record is written out right away
+        if not pipeline.running:
+            pipeline.write_now()
+            log_file.flush()
+        return
+
+    pipeline.start()
+    log_file.start()
+    channel_log_sink.start(bot)
+
+
+def chunk_lines(text, limit=2000):
+    """Split text into pieces short enough for one message, breaking between lines where possible
+
+    Args:
+        text (str): The text to split
+        limit (int): Maximum length of a piece
 
-    async with aiofiles.open('log', mode='w') as f:
-        for line in previous_logs:
-            await f.write(line.strip() + '\n')
-        await f.write(timestamp_string + ' ' + string + '\n')
+    Returns:
+        chunks (List[str]): The pieces, in order
+    """
+
+    chunks = []
+    chunk = ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if chunk:
+                chunks.append(chunk)
+                chunk = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if chunk and len(chunk) + len(line) + 1 > limit:
+            chunks.append(chunk)
+            chunk = ''
+        chunk = f'{chunk}\n{line}' if chunk else line
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
 
 def months_ago(months):
@@ -198,19 +239,17 @@ def months_ago(months):
     that_day = now - delta
     return that_day
 
-async def update_view(interaction, view:discord.ui.View):
+async def update_view(interaction, view:discord.ui.View, content=discord.utils.MISSING):
     """Takes in a view and updates the current message with the new view
-    Uses the interaction to get the channel and message id. Fetches the message and edits it with the new view.
+    Edits the message the component or modal belongs to through the interaction response, so the edit and the
+    response are a single request instead of fetching the message, editing it and responding.
 
     Args:
-        interaction (discord.Interaction): The interaction object
+        interaction (discord.Interaction): The interaction object, not yet responded to
         view (discord.ui.View): The new view that will replace the old view
+        content (str): New text of the message, left unchanged if not given
     """
-    channel = interaction.channel
-    message_id = interaction.message.id
-
-    message = await channel.fetch_message(message_id)
-    await message.edit(view=view)
+    await interaction.response.edit_message(content=content, view=view)
 
 async def get_time_epoch():
     """ Function that gets the current epoch timestamp.
@@ -280,6 +319,7 @@ def get_unix_time(desired_date: str):
 
 async def change_checkin_status(bot: commands.Bot, user_id: int, display_name: str, status: str):
     """ Function that changes the status of a CSE Dev Team member in checkin
+    The status board is redrawn shortly after, together with any other changes made in the meantime.
 
     Args:
         bot (commands.Bot): a Discord bot object
@@ -288,84 +328,4 @@ async def change_checkin_status(bot: commands.Bot, user_id: int, display_name: s
         status (str): The status to set
     """
 
-    # Find Guilds to watch
-    guild = None
-    for temp_guild in bot.guilds:
-        if any(name in temp_guild.name for name in ['WSU CSE-EE Department', 'CSE Testing Server']):
-            guild = temp_guild
-
-    # If guild was found
-    if guild is not None:
-        # Get member object
-        member = guild.get_member(user_id)
-
-        # Get role object
-        role = discord.utils.get(guild.roles, name="cse-devteam")
-
-        # See if user has role
-        if role is not None and role in member.roles:
-            status_emojis = {
-                "checkin": "🟢",
-                "pomodoro": "🟠",
-                "checkout": "🔴",
-            }
-
-            # Get checkin channel
-            channel = discord.utils.get(guild.channels, name='checkin')
-
-            # If channel is found
-            if channel is not None:
-                # Set message to assign
-                message = None
-
-                # Loop through ten most recent messages
-                async for temp_message in channel.history(limit=10, oldest_first=False):
-                    # If message has embeds
-                    if len(temp_message.embeds) == 1:
-                        # If embed is the embed we're looking for, set message
-                        if temp_message.embeds[0].title == 'CSE Development Team Status':
-                            message = temp_message
-                            break
-                
-                # If message was not found, create it
-                embed = discord.Embed(title="CSE Development Team Status")
-                if message is None:
-                    # Update description of new embed
-                    embed.description = f"```{display_name} - {status_emojis[status]}```"
-
-                    await channel.send(embed=embed)
-                # If message found, update it
-                else:
-                    # Update description of embed
-                    embed.description = message.embeds[0].description
-
-                    # If user is inside of embed already, update them
-                    if display_name in embed.description:
-                        # Remove all markdown ticks
-                        embed.description = embed.description.replace("```", "")
-
-                        # Replace description
-                        embed.description = re.sub(fr"({display_name} - )\S+(\s*$)", rf"\1{status_emojis[status]}\2", embed.description, flags=re.MULTILINE)
-
-                        # Readd markdown ticks
-                        embed.description = "```" + embed.description + "```"
-
-                        # Edit message
-                        await message.edit(embed=embed)
-                    # If user isn't in embed, add them
-                    else:
-                        # Remove trailing characters
-                        embed.description = embed.description.rstrip("`")
-
-                        # Remove placeholder if necessary
-                        embed.description = embed.description.replace("No members currently logged in", "")
-
-                        # Add spacing if needed
-                        if embed.description != '```':
-                            embed.description += "\n"
-
-                        # Add user and end code block
-                        embed.description += f"{display_name} - {status_emojis[status]}```"
-
-                        # Update message
-                        await message.edit(embed=embed)
\ No newline at end of file
+    await status_board.update(bot, user_id, display_name, status)